@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import (QgsFeatureSink, QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+                       QgsProcessingOutputLayerDefinition, QgsProcessingOutputNumber, QgsProcessingParameterBoolean,
+                       QgsProcessingParameterCrs, QgsProcessingParameterExpression,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterFileDestination, QgsProcessingParameterNumber,
+                       QgsProcessingParameterString, QgsProcessingParameterVectorLayer, QgsProcessingUtils,
+                       QgsWkbTypes)
+
+from ..utilities.functions import (DEFAULT_OFFSET, GenerationContext, create_new_layer, generate_from_snapshots,
+                                   is_labeling_layer, labeling_fields, setup_new_layer)
+from ..utilities.generation import PLACEMENT_CHUNK_SIZE, iter_chunks, source_request
+from ..utilities.reference_index import ReferenceIndex
+from ..utilities.refresh import REFRESH_CHUNK_SIZE, refresh_labels
+
+
+class _AlgorithmBase(QgsProcessingAlgorithm):
+    """ Common group and instance creation of all labeling algorithms """
+
+    def group(self) -> str:
+        return "Beschriftungspunkte"
+
+    def groupId(self) -> str:
+        return "labeling"
+
+    def createInstance(self):
+        return self.__class__()
+
+
+class CreateLabelingLayerAlgorithm(_AlgorithmBase):
+    """ Creates an empty labeling layer in a new GeoPackage, see `create_new_layer` """
+    CRS = "CRS"
+    OUTPUT = "OUTPUT"
+
+    def name(self) -> str:
+        return "createlabelinglayer"
+
+    def displayName(self) -> str:
+        return "Beschriftungslayer erstellen"
+
+    def shortHelpString(self) -> str:
+        return "Erstellt einen leeren Beschriftungslayer mit Standardstil und Indizes in einem neuen GeoPackage."
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterCrs(self.CRS, "KBS", "ProjectCrs"))
+        self.addParameter(QgsProcessingParameterFileDestination(self.OUTPUT, "Beschriftungslayer",
+                                                                "GeoPackage (*.gpkg)"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        crs = self.parameterAsCrs(parameters, self.CRS, context)
+        path = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+
+        layer = create_new_layer(path, crs)
+        if not layer.isValid():
+            raise QgsProcessingException(f"Beschriftungslayer konnte nicht erstellt werden: {path}")
+
+        return {self.OUTPUT: path}
+
+
+class GenerateLabelsAlgorithm(_AlgorithmBase):
+    """ Generates labeling points for all features of a source like `GenerationTask` and writes them into a sink.
+        Use an existing labeling layer as sink to append, e.g. in models.
+
+        New outputs get the default style and indexes like `create_new_layer` in `postProcessAlgorithm`,
+        appended layers only an update of an existing reference index.
+    """
+    INPUT = "INPUT"
+    EXPRESSION = "EXPRESSION"
+    OFFSET = "OFFSET"
+    REFERENCE_NAME = "REFERENCE_NAME"
+    TARGET_CRS = "TARGET_CRS"
+    OUTPUT = "OUTPUT"
+    CREATED = "CREATED"
+    SKIPPED = "SKIPPED"
+
+    def __init__(self):
+        super().__init__()
+        self._dest_id = None
+        self._append = False
+
+    def name(self) -> str:
+        return "generatelabels"
+
+    def displayName(self) -> str:
+        return "Beschriftungspunkte erstellen"
+
+    def shortHelpString(self) -> str:
+        return ("Erstellt für jedes Objekt der Eingabe einen Beschriftungspunkt. Der Text wird aus dem Ausdruck "
+                "berechnet, die Referenz aus dem Layernamen im Projekt (oder 'Referenzname') und der Objekt-ID "
+                "gebildet. Neue Ausgaben erhalten Standardstil und Indizes wie ein neuer Beschriftungslayer.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, "Referenzlayer",
+                                                              [QgsProcessing.TypeVectorAnyGeometry]))
+        self.addParameter(QgsProcessingParameterExpression(self.EXPRESSION, "Ausdruck",
+                                                           parentLayerParameterName=self.INPUT))
+        self.addParameter(QgsProcessingParameterNumber(self.OFFSET, "Versatz in Metern",
+                                                       QgsProcessingParameterNumber.Double, DEFAULT_OFFSET,
+                                                       minValue=0))
+        self.addParameter(QgsProcessingParameterString(self.REFERENCE_NAME, "Referenzname (Standard: Layername)",
+                                                       optional=True))
+        self.addParameter(QgsProcessingParameterCrs(self.TARGET_CRS, "Ziel-KBS (Standard: KBS der Eingabe)",
+                                                    optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "Beschriftungspunkte",
+                                                            QgsProcessing.TypeVectorPoint))
+        self.addOutput(QgsProcessingOutputNumber(self.CREATED, "Erstellte Beschriftungspunkte"))
+        self.addOutput(QgsProcessingOutputNumber(self.SKIPPED, "Objekte ohne Position"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+
+        expression = self.parameterAsExpression(parameters, self.EXPRESSION, context)
+        offset = self.parameterAsDouble(parameters, self.OFFSET, context)
+        name = self.parameterAsString(parameters, self.REFERENCE_NAME, context) or \
+            self._reference_name(parameters, context, source)
+        crs = self.parameterAsCrs(parameters, self.TARGET_CRS, context)
+        if not crs.isValid():
+            crs = source.sourceCrs()
+
+        fields = labeling_fields()
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.Point, crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        definition = parameters.get(self.OUTPUT)
+        self._dest_id = dest_id
+        self._append = isinstance(definition, QgsProcessingOutputLayerDefinition) and definition.useRemapping()
+
+        generation = GenerationContext.create(name, source.sourceCrs(), crs, fields, expression, offset)
+
+        total = source.featureCount()
+        done = 0
+        created = 0
+        skipped = 0
+        for features in iter_chunks(source.getFeatures(source_request(source, expression)), PLACEMENT_CHUNK_SIZE):
+            if feedback.isCanceled():
+                break
+
+            new_features = [f for f in generate_from_snapshots(generation, features) if f is not None]
+            if not sink.addFeatures(new_features, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(self.writeFeatureError(sink, parameters, self.OUTPUT))
+
+            created += len(new_features)
+            skipped += len(features) - len(new_features)
+            done += len(features)
+            if total > 0:
+                feedback.setProgress(100 * done / total)
+
+        for expression_text, (message, count) in generation.expressions.errors.items():
+            feedback.reportError(f"Fehler in Ausdruck '{expression_text}' bei {count} Objekt(en): {message}")
+        if skipped:
+            feedback.pushInfo(f"Für {skipped} Objekt(e) konnte keine Position ermittelt werden.")
+
+        return {self.OUTPUT: dest_id, self.CREATED: created, self.SKIPPED: skipped}
+
+    def _reference_name(self, parameters, context, source) -> str:
+        """ Name of the input layer in the project, references are resolved by it.
+            Inputs outside of the project, e.g. files, use their source name.
+        """
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        project = context.project()
+        if layer is not None and project is not None and project.mapLayer(layer.id()) is not None:
+            return layer.name()
+
+        return source.sourceName()
+
+    def postProcessAlgorithm(self, context, feedback):
+        """ main thread, sets up new outputs like `create_new_layer` """
+        layer = QgsProcessingUtils.mapLayerFromString(self._dest_id, context) if self._dest_id else None
+        if layer is None:
+            return {}
+
+        if not self._append:
+            setup_new_layer(layer, context.project())
+            return {}
+
+        reference_index = ReferenceIndex.for_layer(layer)
+        if reference_index is not None:
+            if reference_index.exists():
+                reference_index.sync(layer, context.project())
+            reference_index.close()
+
+        return {}
+
+
+class RefreshLabelsAlgorithm(_AlgorithmBase):
+    """ Refreshes label texts of a labeling layer in place, see `refresh_labels`.
+        References are resolved by layer name in the project of the processing context.
+    """
+    INPUT = "INPUT"
+    FILTER = "FILTER"
+    DRY_RUN = "DRY_RUN"
+    RESUME = "RESUME"
+    FORCE = "FORCE"
+    CHUNK_SIZE = "CHUNK_SIZE"
+    UPDATED = "UPDATED"
+    UNCHANGED = "UNCHANGED"
+    STALE = "STALE"
+    BROKEN = "BROKEN"
+
+    def name(self) -> str:
+        return "refreshlabels"
+
+    def displayName(self) -> str:
+        return "Beschriftungspunkte aktualisieren"
+
+    def shortHelpString(self) -> str:
+        return ("Berechnet die Texte der Beschriftungspunkte aus ihren referenzierten Objekten neu. "
+                "Referenzierte Layer werden per Name im Projekt gesucht. "
+                "Im Testlauf werden veraltete Beschriftungspunkte nur gezählt. "
+                "Mit 'Alle neu berechnen' wird der Fingerabdruck ignoriert.")
+
+    def flags(self):
+        # labeling layer is changed in place and referenced project layers are read
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(self.INPUT, "Beschriftungslayer",
+                                                            [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterExpression(self.FILTER, "Filter", optional=True,
+                                                           parentLayerParameterName=self.INPUT))
+        self.addParameter(QgsProcessingParameterBoolean(self.DRY_RUN, "Testlauf", False))
+        self.addParameter(QgsProcessingParameterBoolean(self.RESUME, "Unterbrochene Aktualisierung fortsetzen",
+                                                        False))
+        self.addParameter(QgsProcessingParameterBoolean(self.FORCE, "Alle neu berechnen (Fingerabdruck ignorieren)",
+                                                        False))
+        self.addParameter(QgsProcessingParameterNumber(self.CHUNK_SIZE, "Objekte pro Transaktion",
+                                                       QgsProcessingParameterNumber.Integer, REFRESH_CHUNK_SIZE,
+                                                       minValue=1))
+        self.addOutput(QgsProcessingOutputNumber(self.UPDATED, "Aktualisiert"))
+        self.addOutput(QgsProcessingOutputNumber(self.UNCHANGED, "Unverändert"))
+        self.addOutput(QgsProcessingOutputNumber(self.STALE, "Veraltet"))
+        self.addOutput(QgsProcessingOutputNumber(self.BROKEN, "Ohne Referenz"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if layer is None or not is_labeling_layer(layer):
+            raise QgsProcessingException("Kein gültiger Beschriftungslayer")
+
+        result = refresh_labels(
+            layer,
+            self.parameterAsExpression(parameters, self.FILTER, context) or None,
+            self.parameterAsInt(parameters, self.CHUNK_SIZE, context),
+            resume=self.parameterAsBoolean(parameters, self.RESUME, context),
+            dry_run=self.parameterAsBoolean(parameters, self.DRY_RUN, context),
+            feedback=feedback,
+            project=context.project(),
+            force=self.parameterAsBoolean(parameters, self.FORCE, context)
+        )
+
+        for expression, (message, count) in result.expression_errors.items():
+            feedback.reportError(f"Fehler in Ausdruck '{expression}' bei {count} Objekt(en): {message}")
+        if result.errors:
+            raise QgsProcessingException(f"Aktualisierung abgebrochen ({result.errors[-1]}), "
+                                         f"kann mit 'fortsetzen' wieder aufgenommen werden.")
+
+        feedback.pushInfo(f"{result.updated} aktualisiert, {result.unchanged} unverändert, "
+                          f"{result.stale} veraltet, {len(result.broken)} ohne Referenz.")
+
+        return {self.UPDATED: result.updated, self.UNCHANGED: result.unchanged,
+                self.STALE: result.stale, self.BROKEN: len(result.broken)}
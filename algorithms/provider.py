@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from pathlib import Path
+
+from qgis.core import QgsProcessingProvider
+from qgis.PyQt.QtGui import QIcon
+
+from .labeling import CreateLabelingLayerAlgorithm, GenerateLabelsAlgorithm, RefreshLabelsAlgorithm
+
+
+class EasyLabelingProvider(QgsProcessingProvider):
+    """ Processing provider with the labeling algorithms, usable in models, batch processing and `qgis_process`.
+
+        .. code-block:: shell
+
+            qgis_process run easy_labeling:generatelabels --INPUT=roads.gpkg --EXPRESSION='"name"' \\
+                --TARGET_CRS=EPSG:25832 --OUTPUT=labels.gpkg
+    """
+
+    def id(self) -> str:
+        return "easy_labeling"
+
+    def name(self) -> str:
+        return "Easy Labeling"
+
+    def icon(self) -> QIcon:
+        return QIcon(str(Path(__file__).parent.parent / "templates" / "icons" / "icon.png"))
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(CreateLabelingLayerAlgorithm())
+        self.addAlgorithm(GenerateLabelsAlgorithm())
+        self.addAlgorithm(RefreshLabelsAlgorithm())
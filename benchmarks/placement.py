@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Compares `get_position` (one line at a time) with `get_positions` (all lines at once).
+Run it with the python interpreter of your QGIS installation from the plugins folder:
+
+    .. code-block::
+
+        python easy_labeling/benchmarks/placement.py
+"""
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from qgis.core import QgsApplication, QgsCoordinateReferenceSystem, QgsGeometry, QgsPointXY
+
+
+def random_lines(count: int, seed: int = 0):
+    """ random lines with 2 to 10 vertices in EPSG:25832 """
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        x, y = rnd.uniform(300000, 900000), rnd.uniform(5300000, 6100000)
+        points = [QgsPointXY(x, y)]
+        for _ in range(rnd.randint(1, 9)):
+            x += rnd.uniform(-50, 50)
+            y += rnd.uniform(-50, 50)
+            points.append(QgsPointXY(x, y))
+        lines.append(QgsGeometry.fromPolylineXY(points))
+    return lines
+
+
+def run(sizes=(1000, 10000, 100000), offset: float = 10):
+    from easy_labeling.utilities.functions import get_position, get_positions
+    from easy_labeling.submodules.qgis.geometry.functions import get_distance_area
+
+    crs = QgsCoordinateReferenceSystem("EPSG:25832")
+    area = get_distance_area(crs)
+
+    print(f"{'lines':>8} {'get_position':>14} {'get_positions':>14} {'speedup':>8} {'max diff':>10}")
+    for size in sizes:
+        geoms = random_lines(size)
+
+        start = time.perf_counter()
+        single = [get_position(g, crs, area, offset) for g in geoms]
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = get_positions(geoms, crs, area, offset)
+        batch_time = time.perf_counter() - start
+
+        diffs = [a.distance(b) for a, b in zip(single, batch) if a is not None and b is not None]
+        mismatched = sum(1 for a, b in zip(single, batch) if (a is None) != (b is None))
+        print(f"{size:>8} {single_time:>13.3f}s {batch_time:>13.3f}s {single_time / batch_time:>7.1f}x "
+              f"{max(diffs, default=0):>10.2e}" + (f" ({mismatched} mismatched)" if mismatched else ""))
+
+
+if __name__ == "__main__":
+    app = QgsApplication([], False)
+    app.initQgis()
+    try:
+        run()
+    finally:
+        app.exitQgis()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import getopt
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# QgsApplication of this process, see `_init_qgis`
+_APP = None
+# shards per worker process, smaller shards balance uneven feature complexity
+SHARDS_PER_WORKER = 4
+
+
+def _load_package():
+    """ Makes this folder importable as `easy_labeling`, independent of the folder name """
+    if "easy_labeling" in sys.modules:
+        return
+
+    repo_location = os.path.dirname(os.path.abspath(__file__))  # dieses Verzeichnis
+    spec = importlib.util.spec_from_file_location("easy_labeling", os.path.join(repo_location, "__init__.py"),
+                                                  submodule_search_locations=[repo_location])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["easy_labeling"] = module
+    spec.loader.exec_module(module)
+
+
+def _init_qgis():
+    """ Starts QGIS without gui in this process, once per process """
+    global _APP
+    if _APP is not None:
+        return
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from qgis.core import QgsApplication
+
+    prefix = os.environ.get("QGIS_PREFIX_PATH")
+    if prefix:
+        QgsApplication.setPrefixPath(prefix, True)
+
+    _APP = QgsApplication([], False)
+    _APP.initQgis()
+
+    _load_package()
+
+
+def fid_ranges(fids: List[int], count: int) -> List[Tuple[int, int]]:
+    """ Splits feature ids into up to `count` ranges with nearly equal numbers of features.
+
+        :param fids: feature ids
+        :param count: number of ranges
+        :return: first and last feature id of each range
+    """
+    fids = sorted(fids)
+    if not fids:
+        return []
+
+    count = max(1, min(count, len(fids)))
+    size, rest = divmod(len(fids), count)
+    ranges = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < rest else 0)
+        ranges.append((fids[start], fids[end - 1]))
+        start = end
+
+    return ranges
+
+
+def _open_layer(uri: str, provider: str):
+    from qgis.core import QgsVectorLayer
+
+    layer = QgsVectorLayer(uri, "source", provider)
+    if not layer.isValid():
+        raise ValueError(f"Layer konnte nicht geöffnet werden: {uri}")
+
+    return layer
+
+
+def _generate_shard(uri: str, provider: str, fid_range: Tuple[int, int], expression: str, name: str,
+                    dest_crs: str, offset: Optional[float], shard_path: str) -> Tuple[int, int, Dict[str, Tuple[str, int]]]:
+    """ worker process, generates labeling points of one feature id range into a shard GeoPackage
+
+        :return: number of created points, skipped source features and expression errors
+    """
+    _init_qgis()
+
+    from qgis.core import QgsCoordinateReferenceSystem, QgsFeatureSink, QgsProject, QgsVectorFileWriter, QgsWkbTypes
+
+    from easy_labeling.utilities.functions import GenerationContext, generate_from_snapshots, labeling_fields
+    from easy_labeling.utilities.generation import PLACEMENT_CHUNK_SIZE, iter_chunks, source_request
+
+    layer = _open_layer(uri, provider)
+    crs = QgsCoordinateReferenceSystem(dest_crs) if dest_crs else layer.crs()
+    fields = labeling_fields()
+    context = GenerationContext.create(name, layer.crs(), crs, fields, expression, offset)
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = "labels"
+    writer = QgsVectorFileWriter.create(shard_path, fields, QgsWkbTypes.Point, crs,
+                                        QgsProject.instance().transformContext(), options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise ValueError(f"Teilergebnis konnte nicht erstellt werden ({writer.errorMessage()})")
+
+    first, last = fid_range
+    request = source_request(layer, expression, filter_expression=f"$id >= {first} AND $id <= {last}")
+    created = 0
+    skipped = 0
+    for features in iter_chunks(layer.getFeatures(request), PLACEMENT_CHUNK_SIZE):
+        new_features = [f for f in generate_from_snapshots(context, features) if f is not None]
+        if not writer.addFeatures(new_features, QgsFeatureSink.FastInsert):
+            raise ValueError(f"Teilergebnis konnte nicht geschrieben werden ({writer.lastError()})")
+        created += len(new_features)
+        skipped += len(features) - len(new_features)
+
+    # flushes and closes the shard
+    del writer
+
+    return created, skipped, dict(context.expressions.errors)
+
+
+def _merge(shard_paths: List[str], destination: str, dest_crs) -> List[str]:
+    """ Appends all shards to a new labeling layer, one transaction per chunk.
+        The reference index is built once afterwards, when the labeling layer does not write the file anymore.
+
+        :return: error messages of the reference index, the labeling points are merged nevertheless
+    """
+    import sqlite3
+
+    from qgis.core import QgsVectorLayer
+
+    from easy_labeling.utilities.functions import create_new_layer
+    from easy_labeling.utilities.gpkg import gpkg_uri
+    from easy_labeling.utilities.generation import DEFAULT_CHUNK_SIZE, commit_features, iter_chunks
+    from easy_labeling.utilities.reference_index import ReferenceIndex
+
+    layer = create_new_layer(destination, dest_crs)
+    if not layer.isValid():
+        raise ValueError(f"Beschriftungslayer konnte nicht erstellt werden: {destination}")
+
+    fid_index = layer.fields().lookupField("fid")
+    for path in shard_paths:
+        shard = QgsVectorLayer(gpkg_uri(path, "labels"), "shard", "ogr")
+        for features in iter_chunks(shard.getFeatures(), DEFAULT_CHUNK_SIZE):
+            for feature in features:
+                # fids of the shards overlap, new fids are assigned by the labeling layer
+                if fid_index >= 0:
+                    feature.setAttribute(fid_index, None)
+            result = commit_features(layer, features)
+            if result.errors:
+                raise ValueError(f"Zusammenführen fehlgeschlagen ({result.errors[-1]})")
+
+    uri = layer.source()
+    # releases the writing provider before the index is written into the same file
+    del layer
+
+    reference_index = ReferenceIndex(destination)
+    try:
+        reference_index.rebuild(QgsVectorLayer(uri, "labels", "ogr"))
+    except sqlite3.Error as e:
+        # an empty index would be used as complete, without table references are read from the layer
+        reference_index.drop()
+        return [f"Referenzindex konnte nicht erstellt werden ({e})"]
+    finally:
+        reference_index.close()
+
+    return []
+
+
+class GenerateResult:
+    """ Outcome of `run` """
+
+    def __init__(self):
+        self.created = 0
+        # source features without position
+        self.skipped = 0
+        # expression -> (last error message, error count)
+        self.expression_errors: Dict[str, Tuple[str, int]] = {}
+        self.errors: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(created={self.created}, skipped={self.skipped}, " \
+               f"errors={len(self.errors)})"
+
+
+def run(uri: str, expression: str, destination: str, provider: str = "ogr", name: Optional[str] = None,
+        dest_crs: Optional[str] = None, offset: Optional[float] = None, workers: Optional[int] = None,
+        shards: Optional[int] = None,
+        progress: Optional[Callable[[int, int, GenerateResult], None]] = None) -> GenerateResult:
+    """ Generates labeling points for all features of a layer with one process per core.
+
+        Feature ids are split into ranges (shards). Each worker process starts its own QGIS
+        without gui and writes the labeling points of its shards into temporary GeoPackages,
+        which are merged into the new labeling layer afterwards.
+
+        :param uri: source layer uri, e.g. "roads.gpkg|layername=roads"
+        :param expression: label expression
+        :param destination: new labeling GeoPackage
+        :param provider: source layer provider, defaults to "ogr"
+        :param name: layer name written to "Reference", defaults to the source layer name
+        :param dest_crs: crs of the labeling layer, e.g. "EPSG:25832", defaults to source crs
+        :param offset: offset in meters from center of lines, defaults to `DEFAULT_OFFSET`
+        :param workers: number of processes, defaults to number of cores
+        :param shards: number of shards, defaults to `SHARDS_PER_WORKER` per worker
+        :param progress: called after each finished shard with number of finished shards, number of shards
+                         and the result so far
+        :return: result object
+    """
+    _init_qgis()
+
+    from qgis.core import QgsCoordinateReferenceSystem, QgsFeatureRequest, QgsProviderRegistry
+
+    from easy_labeling.utilities.functions import DEFAULT_OFFSET
+
+    layer = _open_layer(uri, provider)
+    if not name:
+        parts = QgsProviderRegistry.instance().decodeUri(provider, uri)
+        name = parts.get("layerName") or os.path.splitext(os.path.basename(parts.get("path") or uri))[0]
+    crs = QgsCoordinateReferenceSystem(dest_crs) if dest_crs else layer.crs()
+    offset = DEFAULT_OFFSET if offset is None else offset
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * SHARDS_PER_WORKER
+
+    request = QgsFeatureRequest().setNoAttributes().setFlags(QgsFeatureRequest.NoGeometry)
+    ranges = fid_ranges([feature.id() for feature in layer.getFeatures(request)], shards)
+    del layer
+
+    temp_dir = tempfile.mkdtemp(prefix="easy_labeling_")
+    try:
+        shard_paths = [os.path.join(temp_dir, f"shard_{i}.gpkg") for i in range(len(ranges))]
+
+        result = GenerateResult()
+        # spawn: forked children would share the Qt/QGIS state of this process
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(_generate_shard, uri, provider, fid_range, expression, name,
+                                       crs.authid() or crs.toWkt(), offset, path): path
+                       for fid_range, path in zip(ranges, shard_paths)}
+            for done, future in enumerate(as_completed(futures), 1):
+                shard_created, shard_skipped, shard_errors = future.result()
+                result.created += shard_created
+                result.skipped += shard_skipped
+                for expression_text, (message, count) in shard_errors.items():
+                    previous = result.expression_errors.get(expression_text, ("", 0))[1]
+                    result.expression_errors[expression_text] = (message, previous + count)
+                if progress is not None:
+                    progress(done, len(futures), result)
+
+        result.errors.extend(_merge(shard_paths, destination, crs))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return result
+
+
+def from_sys_args(argv):
+    """ Run this script from console.
+
+        .. code-block::
+
+            python path/to/easy_labeling/generate_labels.py -i "roads.gpkg|layername=roads" -e "\\"name\\"" \\
+                -o "path/to/labels.gpkg" -c EPSG:25832 -w 8
+
+        Arguments:
+
+            * `-i` source layer uri
+            * `-e` label expression
+            * `-o` new labeling GeoPackage
+            * `-p` source layer provider, defaults to "ogr"
+            * `-n` layer name written to "Reference", defaults to the source layer name
+            * `-c` crs of the labeling layer, defaults to source crs
+            * `-d` offset in meters
+            * `-w` number of worker processes, defaults to number of cores
+            * `-s` number of shards
+    """
+    opts, args = getopt.getopt(argv, "i:e:o:p:n:c:d:w:s:", [])
+    map_ = dict(opts)
+    for option in ("-i", "-e", "-o"):
+        if option not in map_:
+            raise getopt.GetoptError(f"option {option} missing")
+
+    def progress(done: int, total: int, result: GenerateResult):
+        print(f"Teil {done}/{total} fertig, {result.created} Beschriftungspunkt(e) erstellt")
+
+    result = run(map_["-i"],
+                 map_["-e"],
+                 map_["-o"],
+                 map_.get("-p", "ogr"),
+                 map_.get("-n"),
+                 map_.get("-c"),
+                 float(map_["-d"]) if "-d" in map_ else None,
+                 int(map_["-w"]) if "-w" in map_ else None,
+                 int(map_["-s"]) if "-s" in map_ else None,
+                 progress)
+
+    for expression_text, (message, count) in result.expression_errors.items():
+        print(f"Fehler in Ausdruck '{expression_text}' bei {count} Objekt(en): {message}")
+    for error in result.errors:
+        print(error)
+    print(f"{result.created} Beschriftungspunkt(e) erstellt, {result.skipped} Objekt(e) ohne Position")
+
+    return result
+
+
+if __name__ == "__main__":
+    from_sys_args(sys.argv[1:])
@@ -14,21 +14,35 @@
  *                                                                         *
  ***************************************************************************/
 """
-from json import loads, dumps
+from functools import partial
 
-from qgis.PyQt.QtCore import pyqtSignal, Qt
+from typing import Dict, Tuple, List, Iterable, Optional
+
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QTimer
+from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtWidgets import QFileDialog, QListWidgetItem, QMessageBox
 
 from qgis.core import (QgsApplication, QgsMapLayerProxyModel, QgsVectorLayer,
-                       QgsProject, QgsPointXY, QgsGeometry)
+                       QgsProject, QgsPointXY, QgsGeometry, QgsMapLayer, QgsFeatureRequest)
 from qgis.gui import QgsDockWidget, QgsFieldExpressionWidget
 
-from ..utilities.functions import FIELDS, get_label_text, create_new_layer, generate_from_feature, get_reference_data, create_new_feature
+from ..utilities.compatibility import LayerCompatibility
+from ..utilities.functions import (DEFAULT_OFFSET, get_label_text, create_new_layer, get_reference_data,
+                                   create_new_feature, is_labeling_layer)
+from ..utilities.generation import GenerationTask, BatchResult, source_request
+from ..utilities.fingerprint import fingerprint_values
+from ..utilities.leaders import decode_leaders, leader_values
+from ..utilities.leader_lines import leader_lines_enabled, sync_leader_lines
+from ..utilities.reference_index import Entry, ReferenceIndex, reference_entry, reference_key_field
+from ..utilities.references import ReferenceResolver
+from ..utilities.selection import SelectionResult, SelectionTask
+from ..utilities.refresh import RefreshTask, RefreshResult, load_checkpoint
 
 from ..submodules.module_base.base_class import UiModuleBase
 from ..submodules.module_base.pyqt.functions import set_label_status, set_label_error
-from ..submodules.qgis.canvas.maptool_click_snap import MapToolQgisSnap
+from ..submodules.qgis.canvas.maptool_click_snap import MapToolQgisSnap, LOCATORS
 from ..submodules.qgis.canvas.canvas_drawing import DrawTool
+from ..submodules.qgis.tools.expression_cache import ExpressionCache
 
 FORM_CLASS, _ = UiModuleBase.get_uic_classes(__file__)
 
@@ -41,7 +55,13 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         QgsDockWidget.__init__(self, kwargs.get('parent', None))
 
         self._point_feature = None
+        self._tasks = []
+        # loads leader targets and references of the current selection, see `_load_selection`
+        self._selection_task: Optional[SelectionTask] = None
+        self._layer_compatibility = LayerCompatibility(self.is_point_layer_valid)
+        self._layer_connections: Dict[str, list] = {}
         self._draw_tool = DrawTool(self.iface.mapCanvas(), drawings=self.get_plugin().drawings)
+        self._preview = self._draw_tool.create_preview_line()
 
         self.setupUi(self)
 
@@ -51,9 +71,13 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
     def _setup(self):
         """ setup some options """
 
-        # reload loadable layers
-        self.connect(QgsProject.instance().layersAdded, self._load_layers)
-        self.connect(QgsProject.instance().layersRemoved, self._load_layers)
+        # reload loadable layers, bursts of layer signals result in one update
+        self._excepted_layers_timer = QTimer(self)
+        self._excepted_layers_timer.setSingleShot(True)
+        self._excepted_layers_timer.setInterval(50)
+        self.connect(self._excepted_layers_timer.timeout, self._update_excepted_layers)
+        self.connect(QgsProject.instance().layersAdded, self._layers_added)
+        self.connect(QgsProject.instance().layersRemoved, self._layers_removed)
 
         self.replace_widget_with_class(self.Edit_New_Expression, ExpressionWidget)
         self.replace_widget_with_class(self.Edit_Expression, ExpressionWidget)
@@ -83,26 +107,71 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         self.connect(self.But_Add_Point.clicked, self._add_point_pos)
         self.connect(self.But_Save.clicked, self._save_point)
 
-        self.connect(self.iface.mapCanvas().selectionChanged, self._point_feature_selected)
+        # selection changes are handled once the selection settles
+        self._selection_timer = QTimer(self)
+        self._selection_timer.setSingleShot(True)
+        self._selection_timer.setInterval(150)
+        self.connect(self._selection_timer.timeout, lambda: self._point_feature_selected(self.point_layer))
+        self.connect(self.iface.mapCanvas().selectionChanged, self._canvas_selection_changed)
 
         self._load_layers()
 
     def _load_layers(self, *args):
         """ Reloads exclude list for layer dropdowns """
-        exclude_labeling_layers = []
-        exclude_reference_layers = []
+        self._layers_added(QgsProject.instance().mapLayers().values())
+        self._update_excepted_layers()
 
-        layers = QgsProject.instance().mapLayers().values()
+    def _layers_added(self, layers: Iterable[QgsMapLayer]):
+        """ Checks compatibility of new layers and watches their fields """
+        layers = list(layers)
         for layer in layers:
-            if self.is_point_layer_valid(layer):
-                # incompatible reference layers
-                exclude_reference_layers.append(layer)
-            else:
-                # incompatible labeling layers
-                exclude_labeling_layers.append(layer)
+            if not isinstance(layer, QgsVectorLayer):
+                continue
 
-        self.DrD_LabelingLayers.setExceptedLayerList(exclude_labeling_layers)
-        self.DrD_ReferenceLayers.setExceptedLayerList(exclude_reference_layers)
+            layer_id = layer.id()
+            if layer_id not in self._layer_connections:
+                changed = partial(self._layer_fields_changed, layer_id)
+                self._layer_connections[layer_id] = [
+                    self.connect(layer.attributeAdded, changed),
+                    self.connect(layer.attributeDeleted, changed),
+                    # provider fields changed, e.g. after commit
+                    self.connect(layer.updatedFields, changed),
+                ]
+
+        if self._layer_compatibility.add(layers):
+            self._excepted_layers_timer.start()
+
+    def _layers_removed(self, layer_ids: List[str]):
+        for layer_id in layer_ids:
+            for entry in self._layer_connections.pop(layer_id, []):
+                if entry in self._connections:
+                    self._connections.remove(entry)
+
+        if self._layer_compatibility.remove(layer_ids):
+            self._excepted_layers_timer.start()
+
+    def _layer_fields_changed(self, layer_id: str, *args):
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if layer is None:
+            return
+
+        if self._layer_compatibility.update(layer):
+            self._excepted_layers_timer.start()
+
+    def _update_excepted_layers(self):
+        """ Sets exclude lists of both layer dropdowns from compatibility cache """
+        self._excepted_layers_timer.stop()
+
+        excepted = self._layer_compatibility.excepted_ids()
+        if excepted is None:
+            return
+
+        # incompatible labeling layers and compatible labeling layers, which are no reference layers
+        labeling_ids, reference_ids = excepted
+
+        project = QgsProject.instance()
+        self.DrD_LabelingLayers.setExceptedLayerList([project.mapLayer(i) for i in labeling_ids if project.mapLayer(i)])
+        self.DrD_ReferenceLayers.setExceptedLayerList([project.mapLayer(i) for i in reference_ids if project.mapLayer(i)])
 
     def _save_point(self, checked: bool):
         set_label_error(self.Label_Status_Edit, "")
@@ -122,11 +191,17 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
 
         index_map = self.point_layer.dataProvider().fieldNameMap()
         update_map = {}
+        reference = None
         if self.Edit_Expression.isVisible():
             reference = get_reference_data(self._point_feature)
             if reference:
-                text = get_label_text(reference[1], self.Edit_Expression.currentText())
+                cache = ExpressionCache()
+                text = get_label_text(reference[1], self.Edit_Expression.currentText(), cache)
                 update_map[index_map["Text"]] = text
+                fingerprints = fingerprint_values(self.point_layer.fields(), reference[1],
+                                                  self.Edit_Expression.currentText(), not cache.last_error)
+                for name, value in fingerprints.items():
+                    update_map[index_map[name]] = value
             else:
                 reply = self.question(
                     "Referenz nicht gefunden",
@@ -146,39 +221,48 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         for row in range(self.List_Points.count()):
             item = self.List_Points.item(row)
             x, y = item.text().split(",")
-            x = float(x)
-            y = float(y)
-            points.append([x, y])
+            points.append(QgsPointXY(float(x), float(y)))
 
-        points = dumps(points)
-        update_map[index_map["Points"]] = points
+        for name, value in leader_values(self.point_layer.fields(), points).items():
+            update_map[index_map[name]] = value
         if self.point_layer.isEditable():
+            # leader lines and reference index follow on commit, see `modules.live_sync`
             self.point_layer.changeAttributeValues(self._point_feature.id(), update_map)
         else:
             self.point_layer.dataProvider().changeAttributeValues({self._point_feature.id(): update_map})
+            entry = reference_entry(self._point_feature, reference[1] if reference else None,
+                                    reference_key_field(self.point_layer))
+            self._update_reference_index(self.point_layer, {self._point_feature.id(): entry})
+            self._sync_leader_lines(self.point_layer, [self._point_feature.id()])
 
         self.point_layer.triggerRepaint()
 
     def _add_point_pos(self, checked: bool):
-        tool = MapToolQgisSnap(self.iface, self.point_layer)
+        # snap only on the referenced feature, otherwise on the reference layer
+        reference = get_reference_data(self._point_feature) if self._point_feature else None
+        if reference is not None:
+            tool = MapToolQgisSnap(self.iface, self.point_layer,
+                                   reference_layer=reference[0], reference_fids=[reference[1].id()])
+        elif self.reference_layer is not None:
+            tool = MapToolQgisSnap(self.iface, self.point_layer, reference_layer=self.reference_layer)
+        else:
+            tool = MapToolQgisSnap(self.iface, self.point_layer)
         tool.clicked.connect(self._add_point_to_list)
         tool.moved.connect(self._maptool_moved)
         tool.aborted.connect(self._maptool_aborted)
+        tool.deactivated.connect(self._preview.reset)
 
-    def _maptool_moved(self, point: QgsPointXY):
-        self._draw_tool.remove_all_drawings()
-
-        if not self._point_feature or not self.point_layer:
-            return
-
-        current_point = self.point_layer.getGeometry(self._point_feature.id()).asPoint()
+        if self._point_feature and self.point_layer:
+            # anchor is fixed while the map tool is active
+            anchor = self.point_layer.getGeometry(self._point_feature.id()).asPoint()
+            self._preview.start(anchor, self.point_layer)
 
-        self._draw_tool.create_rubber_band(
-            QgsGeometry.fromPolylineXY([current_point, point]),
-            self.point_layer)
+    def _maptool_moved(self, point: QgsPointXY):
+        self._preview.move_to(point)
 
     def _maptool_aborted(self):
-        self._draw_tool.remove_all_drawings()
+        self._preview.reset()
+        self._draw_tool.remove_tool_drawings()
 
     def _add_point_to_list(self, point: QgsPointXY):
         pos = point.toString(8)
@@ -233,6 +317,8 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         ok, features = prov.addFeatures([new_feature])
         if ok:
             self.point_layer.reload()
+            self._update_reference_index(self.point_layer, {features[0].id(): reference_entry(features[0])})
+            self._sync_leader_lines(self.point_layer, [features[0].id()])
             self.point_layer.selectByIds([features[0].id()])
         else:
             self.iface.messageBar().pushWarning("Easy Labeling", f"Erstellen eines neuen Punktes fehlgeschlagen ({prov.lastError()})")
@@ -245,8 +331,22 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
             set_label_error(self.Label_Status_Create, "Ausdruck fehlerhaft")
             return
 
+        expression = self.Edit_New_Expression.currentText()
+
         if not self.reference_layer.selectedFeatureCount():
-            set_label_error(self.Label_Status_Create, "Keine Objekte gewählt")
+            reply = self.question(
+                "Beschriftungspunkte erstellen",
+                "Keine Objekte gewählt. Beschriftungspunkte für alle Objekte im Kartenausschnitt erstellen?"
+            )
+
+            if reply != self.Yes:
+                set_label_error(self.Label_Status_Create, "Keine Objekte gewählt")
+                return
+
+            canvas = self.iface.mapCanvas()
+            extent = canvas.mapSettings().mapToLayerCoordinates(self.reference_layer, canvas.extent())
+            request = source_request(self.reference_layer, expression, extent=extent)
+            self._start_generation(request, expression)
             return
 
         if self.reference_layer.selectedFeatureCount() > 1:
@@ -259,19 +359,48 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
             if reply != self.Yes:
                 return
 
-        created = []
-        for feature in self.reference_layer.selectedFeatures():
-            f = generate_from_feature(self.reference_layer, feature,
-                                      self.Edit_New_Expression.currentText(),
-                                      self.point_layer, 10)
-            ok, features = self.point_layer.dataProvider().addFeatures([f])
-            if ok:
-                created.extend(features)
+        request = source_request(self.reference_layer, expression, fids=self.reference_layer.selectedFeatureIds())
+        self._start_generation(request, expression)
+
+    def _start_generation(self, request: QgsFeatureRequest, expression: str):
+        """ Streams source features from reference layer in a background task """
+        task = GenerationTask(self.reference_layer, request, expression, self.point_layer, DEFAULT_OFFSET)
+        self.connect(task.generated, self._generation_finished)
+        self._tasks.append(task)
+        self.But_Create_From_Selection.setEnabled(False)
+        QgsApplication.taskManager().addTask(task)
 
-        self.point_layer.reload()
+    def _generation_finished(self, result: BatchResult):
+        """ Background generation finished or cancelled """
+        task = [t for t in self._tasks if t.result is result][0]
+        self._tasks.remove(task)
+        self.But_Create_From_Selection.setEnabled(not any(isinstance(t, GenerationTask) for t in self._tasks))
 
-        if len(created) == 1:
-            self.point_layer.selectByIds([created[0].id()])
+        created = result.created
+
+        point_layer = QgsProject.instance().mapLayer(task.dest_layer_id)
+        if point_layer:
+            point_layer.reload()
+            self._sync_leader_lines(point_layer, created)
+
+            if len(created) == 1:
+                point_layer.selectByIds(created)
+
+        if result.canceled:
+            msg = f"Erstellen abgebrochen, {len(created)} Beschriftungspunkt(e) erstellt."
+            self.iface.messageBar().pushWarning("Easy Labeling", msg)
+        elif created:
+            self.iface.messageBar().pushSuccess("Easy Labeling", f"{len(created)} Beschriftungspunkt(e) erstellt.")
+
+        if result.skipped:
+            msg = f"Für {len(result.skipped)} Objekt(e) konnte keine Position ermittelt werden."
+            self.iface.messageBar().pushWarning("Easy Labeling", msg)
+
+        if result.errors:
+            msg = f"Fehler beim Erstellen, {result.failed} Beschriftungspunkt(e) nicht gespeichert ({result.errors[-1]})"
+            set_label_error(self.Label_Status_Create, msg)
+
+        self._push_expression_errors(result.expression_errors)
 
     def _refresh_selected(self, checked: bool):
         set_label_error(self.Label_Status, "")
@@ -280,7 +409,16 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
             return
 
         if not self.point_layer.selectedFeatureCount():
-            set_label_error(self.Label_Status, "Keine Objekte gewählt")
+            reply = self.question(
+                "Beschriftungspunkte aktualisieren",
+                "Keine Objekte gewählt. Alle Beschriftungspunkte des Layers aktualisieren?"
+            )
+
+            if reply != self.Yes:
+                set_label_error(self.Label_Status, "Keine Objekte gewählt")
+                return
+
+            self.refresh_all()
             return
 
         if self.point_layer.selectedFeatureCount() > 1:
@@ -295,24 +433,32 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
 
         index_map = self.point_layer.dataProvider().fieldNameMap()
         update_map = {}
+        entries = {}
         errors = []
-        for feature in self.point_layer.selectedFeatures():
+        cache = ExpressionCache()
+        key_field = reference_key_field(self.point_layer)
+        features = [f for f in self.point_layer.selectedFeatures() if f['Reference'] or f['Expression']]
+        references = ReferenceResolver().resolve(features)
+        for feature in features:
             expression = feature['Expression']
-            reference = feature['Reference']
-            if not reference and not expression:
-                continue
-
-            reference = get_reference_data(feature)
+            reference = references[feature.id()]
             if reference is not None:
                 layer, line_feature = reference
-                text = get_label_text(line_feature, expression)
+                text = get_label_text(line_feature, expression, cache)
                 update_map[feature.id()] = {index_map['Text']: text}
+                fingerprints = fingerprint_values(self.point_layer.fields(), line_feature, expression,
+                                                  not cache.last_error)
+                for name, value in fingerprints.items():
+                    update_map[feature.id()][index_map[name]] = value
+                entries[feature.id()] = reference_entry(feature, line_feature, key_field)
             else:
                 errors.append(feature.id())
 
         if update_map:
             self.point_layer.dataProvider().changeAttributeValues(update_map)
+            self._update_reference_index(self.point_layer, entries)
             self.point_layer.triggerRepaint()
+            self._sync_leader_lines(self.point_layer, update_map.keys())
             self.iface.messageBar().pushSuccess("Easy Labeling", f"{len(update_map)} Objekt(e) aktualisiert.")
 
         if errors:
@@ -324,6 +470,108 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         if not update_map and not errors:
             self.iface.messageBar().pushSuccess("Easy Labeling", f"Keine Objekte aktualisiert.")
 
+        self._push_expression_errors(cache.errors)
+
+    def refresh_all(self, filter_expression: Optional[str] = None, dry_run: bool = False, force: bool = False):
+        """ Refreshes all labeling points or points matching a filter in a background task.
+            Offers to continue an interrupted run.
+
+            :param filter_expression: only labeling points matching this expression
+            :param dry_run: only count stale labeling points
+            :param force: evaluate all labeling points, also the ones with an unchanged fingerprint
+        """
+        set_label_error(self.Label_Status, "")
+
+        layer = self.point_layer
+        if not layer:
+            return
+
+        if any(isinstance(t, RefreshTask) and t.layer_id == layer.id() for t in self._tasks):
+            set_label_error(self.Label_Status, "Aktualisierung läuft bereits")
+            return
+
+        resume = False
+        if not dry_run and load_checkpoint(layer, filter_expression) is not None:
+            reply = self.question(
+                "Beschriftungspunkte aktualisieren",
+                "Die letzte Aktualisierung wurde unterbrochen. Dort fortsetzen?\n"
+                "Nein: von vorne beginnen."
+            )
+            resume = reply == self.Yes
+
+        task = RefreshTask(layer, filter_expression, resume=resume, dry_run=dry_run, force=force)
+        self.connect(task.chunkRefreshed, self._refresh_progressed)
+        self.connect(task.refreshed, self._refresh_finished)
+        self._tasks.append(task)
+        self.But_Refresch_Selected.setEnabled(False)
+        QgsApplication.taskManager().addTask(task)
+
+    def _refresh_progressed(self, result: RefreshResult):
+        """ One chunk of a background refresh was written """
+        set_label_status(self.Label_Status, self._refresh_summary(result))
+
+    def _refresh_finished(self, result: RefreshResult):
+        """ Background refresh finished or cancelled """
+        task = [t for t in self._tasks if t.result is result][0]
+        self._tasks.remove(task)
+        self.But_Refresch_Selected.setEnabled(not any(isinstance(t, RefreshTask) for t in self._tasks))
+
+        summary = self._refresh_summary(result)
+        if result.errors:
+            set_label_error(self.Label_Status, f"{summary} Fehler: {result.errors[-1]}")
+        else:
+            set_label_status(self.Label_Status, summary)
+
+        if result.dry_run:
+            self.iface.messageBar().pushInfo("Easy Labeling", f"Prüfung abgeschlossen. {summary}")
+        elif result.canceled or result.errors:
+            msg = f"Aktualisierung unterbrochen, kann später fortgesetzt werden. {summary}"
+            self.iface.messageBar().pushWarning("Easy Labeling", msg)
+        else:
+            self.iface.messageBar().pushSuccess("Easy Labeling", f"Aktualisierung abgeschlossen. {summary}")
+
+        point_layer = QgsProject.instance().mapLayer(task.layer_id)
+        if point_layer and result.broken:
+            msg = f"{len(result.broken)} Objekt(e) ohne gültige Referenz. Objekte sind markiert."
+            self.iface.messageBar().pushWarning("Easy Labeling", msg)
+            point_layer.selectByIds(result.broken)
+
+        self._push_expression_errors(result.expression_errors)
+
+    @staticmethod
+    def _refresh_summary(result: RefreshResult) -> str:
+        if result.dry_run:
+            return f"{result.stale} veraltet, davon {result.updated} mit neuem Text, " \
+                   f"{len(result.broken)} ohne Referenz."
+
+        return f"{result.updated} aktualisiert, {result.unchanged} unverändert, " \
+               f"{len(result.broken)} ohne Referenz."
+
+    def _sync_leader_lines(self, layer: QgsVectorLayer, fids):
+        """ Updates the leader line table, when arrows are drawn from it """
+        if not leader_lines_enabled(layer):
+            return
+
+        ok, message = sync_leader_lines(layer, fids)
+        if not ok:
+            self.iface.messageBar().pushWarning("Easy Labeling", f"Pfeillayer konnte nicht aktualisiert werden ({message})")
+
+    @staticmethod
+    def _update_reference_index(layer: QgsVectorLayer, entries: Dict[int, Optional[Entry]]):
+        """ Writes entries of direct provider writes to the persistent reference index, when it exists """
+        reference_index = ReferenceIndex.for_layer(layer)
+        if reference_index is None:
+            return
+
+        reference_index.write(entries)
+        reference_index.close()
+
+    def _push_expression_errors(self, errors: Dict[str, Tuple[str, int]]):
+        """ Shows one warning per faulty expression """
+        for expression, (message, count) in errors.items():
+            msg = f"Fehler in Ausdruck '{expression}' bei {count} Objekt(en): {message}"
+            self.iface.messageBar().pushWarning("Easy Labeling", msg)
+
     def _create_new_layer(self, checked: bool):
         save_path, _ = QFileDialog.getSaveFileName(
             self.iface.mainWindow(),
@@ -349,26 +597,24 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
     def _line_layer_changed(self, layer: QgsVectorLayer):
         self._reset()
 
+        if layer is not None:
+            LOCATORS.prebuild(layer, self.iface.mapCanvas())
+
     def _show_feature_expr_result(self):
         set_label_status(self.Label_Edit_Preview, "")
         expression = self.Edit_Expression.currentText()
-        text = get_label_text(self._point_feature, expression)
-        if not text:
+        cache = ExpressionCache()
+        text = get_label_text(self._point_feature, expression, cache)
+        if expression in cache.errors:
+            set_label_error(self.Label_Edit_Preview, f"Fehler in Ausdruck: {cache.errors[expression][0]}")
+        elif not text:
             set_label_error(self.Label_Edit_Preview, "Fehler in Ausdruck")
         else:
             set_label_status(self.Label_Edit_Preview, text)
 
     @classmethod
     def is_point_layer_valid(cls, layer: QgsVectorLayer) -> bool:
-        if not layer:
-            return False
-
-        names = layer.dataProvider().fields().names()
-        for field in FIELDS:
-            if field.name() not in names:
-                return False
-
-        return True
+        return is_labeling_layer(layer)
 
     def _reset(self):
         point_layer = self.DrD_LabelingLayers.currentLayer()
@@ -411,9 +657,20 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
             self.Widget_Create.setEnabled(False)
             set_label_error(self.Label_Status_Create, "Bitte einen Linienlayer wählen")
 
+    def _canvas_selection_changed(self, layer: QgsMapLayer):
+        """ Selection changed on any layer, only the point layer is handled """
+        point_layer = self.point_layer
+        if layer is None or point_layer is None or layer.id() != point_layer.id():
+            return
+
+        self._selection_timer.start()
+
     def _point_feature_selected(self, layer: QgsVectorLayer):
         """ Load data from selected point feature """
 
+        if self._selection_task is not None:
+            self._selection_task.cancel()
+            self._selection_task = None
         self._point_feature = None
         self.Edit_Manual_Expression.setPlainText("")
         self.Edit_Expression.setExpression("")
@@ -423,6 +680,7 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         self.GroupBox_Edit.setEnabled(False)
         set_label_error(self.Label_Edit_Feature, "")
         set_label_error(self.Label_Status_Edit, "")
+        self._draw_tool.clear_overlay()
 
         if not layer:
             return
@@ -438,6 +696,7 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
             return
 
         if len(selected) != 1:
+            self._load_selection(layer, selected)
             set_label_error(self.Label_Status_Edit,
                             "Bitte nur ein Objekt wählen")
             return
@@ -468,29 +727,57 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
                             f"Punkt: {selected[0]} (ohne Referenzlayer)\n"
                             f"Manuelle Textbearbeitung.")
 
-        try:
-            points = loads(self._point_feature['Points'])
-        except:
-            points = []
-
         # load points to view
-        for point in points:
-            item = QListWidgetItem(f"{point[0]},{point[1]}")
+        for point in decode_leaders(self._point_feature):
+            item = QListWidgetItem(f"{point.x()},{point.y()}")
             self.List_Points.addItem(item)
 
         self.GroupBox_Edit.setEnabled(True)
-
-        reference = get_reference_data(self._point_feature)
         self._selected_point_pos_changed()
 
-        if reference is not None and reference:
-            # reference found and layer reference active
-            self.iface.mapCanvas().flashFeatureIds(reference[0], [reference[1].id()], flashes=4)
-        elif reference:
-            # reference active, but feature not found
-            msg = f"Referenzierte Linie '{self._point_feature['Reference']}' nicht gefunden"
-            self.iface.messageBar().pushWarning("Easy Labeling", msg)
-            set_label_error(self.Label_Status_Edit, msg)
+        self._load_selection(layer, selected, selected if reference else [])
+
+    def _load_selection(self, layer: QgsVectorLayer, fids: List[int], resolve: Iterable[int] = ()):
+        """ Loads leader targets and referenced features of selected labeling features in a background task """
+        task = SelectionTask(layer, fids, resolve)
+        self.connect(task.resolved, self._selection_loaded)
+        self._tasks.append(task)
+        self._selection_task = task
+        QgsApplication.taskManager().addTask(task)
+
+    def _selection_loaded(self, result: SelectionResult):
+        """ Highlights leader lines and targets, flashes the referenced feature of the loaded point feature """
+        task = [t for t in self._tasks if t.result is result][0]
+        self._tasks.remove(task)
+        if task is not self._selection_task or result.canceled:
+            return
+
+        self._selection_task = None
+        layer = self.point_layer
+        if layer is None or layer.id() != task.layer_id:
+            return
+
+        if result.errors:
+            set_label_error(self.Label_Status_Edit, f"Auswahl konnte nicht geladen werden ({result.errors[-1]})")
+
+        if result.lines:
+            self._draw_tool.add_lines(result.lines, layer, Qt.SolidLine, QColor(255, 120, 0, 150), 2)
+            self._draw_tool.add_markers(result.targets, layer, QColor(255, 120, 0, 200), size=8)
+
+        for fid, reference in result.references.items():
+            if self._point_feature is None or self._point_feature.id() != fid:
+                continue
+
+            if reference is not None:
+                # reference found and layer reference active
+                self.iface.mapCanvas().flashFeatureIds(reference[0], [reference[1].id()], flashes=4)
+                # snapping on the referenced layer, see `_add_point_pos`
+                LOCATORS.prebuild(reference[0], self.iface.mapCanvas())
+            else:
+                # reference active, but feature not found
+                msg = f"Referenzierte Linie '{self._point_feature['Reference']}' nicht gefunden"
+                self.iface.messageBar().pushWarning("Easy Labeling", msg)
+                set_label_error(self.Label_Status_Edit, msg)
 
     @property
     def point_layer(self):
@@ -505,11 +792,20 @@ class LabelingMenu(UiModuleBase, QgsDockWidget, FORM_CLASS):
         result = QgsApplication.translate("QgsApplication", text)
         return result
 
+    def cancel(self):
+        """ cancels running background tasks """
+        for task in self._tasks:
+            task.cancel()
+
     def closeEvent(self, event) -> None:
         event.accept()
         self.unload(True)
 
     def unload(self, self_unload: bool = False):
+        self.cancel()
+        self._preview.remove()
+        self._draw_tool.remove_class_drawings()
+        LOCATORS.clear()
         return super().unload(self_unload)
 
     @classmethod
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+
+from functools import partial
+
+from typing import Dict, Iterable, List, Optional, Set
+
+from qgis.PyQt.QtCore import QTimer
+
+from qgis.core import Qgis, QgsFeatureRequest, QgsGeometry, QgsMapLayer, QgsMessageLog, QgsProject, QgsVectorLayer
+
+from ..utilities.functions import is_labeling_layer
+from ..utilities.geometry_follow import FOLLOW_FORCE, follow_mode, reanchor_labels
+from ..utilities.leader_lines import leader_lines_enabled, sync_leader_lines
+from ..utilities.live_sync import GEOMETRY_CHANGED, ReverseIndex, live_sync_enabled, update_label_texts
+from ..utilities.reference_index import ReferenceIndex, reference_entry
+
+from ..submodules.module_base.base_class import ModuleBase
+
+
+class LiveSync(ModuleBase):
+    """ Keeps label texts of labeling layers with live sync up to date, see `utilities.live_sync`.
+
+        Committed attribute and geometry changes of all vector layers are collected.
+        All changes committed in one event loop cycle, e.g. one field calculator run or saving
+        several layers at once, are written as one batch per labeling layer.
+        Only labels whose expression uses a changed field or the changed geometry are evaluated.
+
+        Labeling layers with geometry follow, see `utilities.geometry_follow`, move their labels
+        to the new positions of edited reference geometries. Geometries before the edit are read
+        right before the commit to detect manually moved labels.
+
+        Persistent reference indexes of labeling GeoPackages, see `utilities.reference_index`,
+        are loaded on first use and kept up to date with committed edits of labeling layers.
+
+        Leader line tables, see `utilities.leader_lines`, follow committed edits of their labeling layers,
+        one sync per labeling layer and event loop cycle.
+    """
+
+    def __init__(self, *args, **kwargs):
+        ModuleBase.__init__(self, *args, **kwargs)
+
+        # labeling layer id -> reverse index, built on first use
+        self._indexes: Dict[str, ReverseIndex] = {}
+        # labeling layer id -> persistent reference index, None for layers without GeoPackage
+        self._reference_indexes: Dict[str, Optional[ReferenceIndex]] = {}
+        # labeling layer id -> feature count at the last `ReferenceIndex.sync`
+        self._synced: Dict[str, int] = {}
+        # referenced layer id -> feature id -> changed field names
+        self._pending: Dict[str, Dict[int, Set[str]]] = {}
+        # referenced layer id -> feature id -> geometry before and after the commit
+        self._old_geometries: Dict[str, Dict[int, QgsGeometry]] = {}
+        self._new_geometries: Dict[str, Dict[int, QgsGeometry]] = {}
+        # labeling layer id -> feature ids with changed leader lines
+        self._leader_changes: Dict[str, Set[int]] = {}
+        self._layer_connections: Dict[str, list] = {}
+
+        self._flush_timer = QTimer()
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self.connect(self._flush_timer.timeout, self._flush)
+
+        self.connect(QgsProject.instance().layersAdded, self._layers_added)
+        self.connect(QgsProject.instance().layersRemoved, self._layers_removed)
+        self._layers_added(QgsProject.instance().mapLayers().values())
+
+    def _layers_added(self, layers: Iterable[QgsMapLayer]):
+        """ Watches committed changes of new vector layers """
+        for layer in layers:
+            if not isinstance(layer, QgsVectorLayer) or layer.id() in self._layer_connections:
+                continue
+
+            layer_id = layer.id()
+            self._layer_connections[layer_id] = [
+                self.connect(layer.beforeCommitChanges, partial(self._before_commit, layer_id)),
+                self.connect(layer.committedAttributeValuesChanges, self._attributes_committed),
+                self.connect(layer.committedGeometriesChanges, self._geometries_committed),
+                # labels added or removed, e.g. after generation or reload
+                self.connect(layer.committedFeaturesAdded, self._features_added),
+                self.connect(layer.committedFeaturesRemoved, self._features_removed),
+                self.connect(layer.dataChanged, partial(self.invalidate, layer_id)),
+            ]
+
+    def _layers_removed(self, layer_ids: List[str]):
+        for layer_id in layer_ids:
+            self._indexes.pop(layer_id, None)
+            self._pending.pop(layer_id, None)
+            self._old_geometries.pop(layer_id, None)
+            self._new_geometries.pop(layer_id, None)
+            self._leader_changes.pop(layer_id, None)
+            self._synced.pop(layer_id, None)
+            reference_index = self._reference_indexes.pop(layer_id, None)
+            if reference_index is not None:
+                reference_index.close()
+            for entry in self._layer_connections.pop(layer_id, []):
+                if entry in self._connections:
+                    self._connections.remove(entry)
+
+    def invalidate(self, layer_id: str, *args):
+        """ Drops the reverse index of a labeling layer, it is built again on next use """
+        self._indexes.pop(layer_id, None)
+
+    def _leaders_changed(self, layer_id: str, fids: Iterable[int]):
+        """ Collects labels of labeling layers with leader line table, written in `_flush` """
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if layer is None or not leader_lines_enabled(layer):
+            return
+
+        self._leader_changes.setdefault(layer_id, set()).update(fids)
+        self._flush_timer.start()
+
+    def _features_added(self, layer_id: str, features: list):
+        self.invalidate(layer_id)
+        self._leaders_changed(layer_id, [feature.id() for feature in features])
+        layer = QgsProject.instance().mapLayer(layer_id)
+        reference_index = self._reference_index(layer, build=False)
+        if reference_index is not None:
+            # committed features carry their new ids and all attributes
+            reference_index.write({feature.id(): reference_entry(feature) for feature in features})
+
+    def _features_removed(self, layer_id: str, fids: list):
+        self.invalidate(layer_id)
+        self._leaders_changed(layer_id, fids)
+        layer = QgsProject.instance().mapLayer(layer_id)
+        reference_index = self._reference_index(layer, build=False)
+        if reference_index is not None:
+            reference_index.remove(fids)
+
+    def _attributes_committed(self, layer_id: str, changes: dict):
+        # "Reference" or "Expression" of labels may have changed
+        self.invalidate(layer_id)
+
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if layer is None:
+            return
+
+        fields = layer.fields()
+        leader_fields = {fields.lookupField(name) for name in ("Points", "Leaders")} - {-1}
+        self._leaders_changed(layer_id, [fid for fid, values in changes.items() if leader_fields.intersection(values)])
+
+        reference_field = fields.lookupField("Reference")
+        changed_references = [fid for fid, values in changes.items() if reference_field in values]
+        if reference_field >= 0 and changed_references:
+            reference_index = self._reference_index(layer, build=False)
+            if reference_index is not None:
+                reference_index.update(layer, changed_references)
+
+        pending = self._pending.setdefault(layer_id, {})
+        for fid, values in changes.items():
+            names = pending.setdefault(fid, set())
+            names.update(fields.at(index).name() for index in values if 0 <= index < fields.count())
+
+        self._flush_timer.start()
+
+    def _before_commit(self, layer_id: str, *args):
+        """ Reads the committed geometries of edited features, only needed for geometry follow """
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if layer is None or layer.editBuffer() is None or not self._follow_layers():
+            return
+
+        fids = list(layer.editBuffer().changedGeometries())
+        if not fids:
+            return
+
+        request = QgsFeatureRequest().setFilterFids(fids)
+        request.setNoAttributes()
+        old_geometries = self._old_geometries.setdefault(layer_id, {})
+        for feature in layer.dataProvider().getFeatures(request):
+            # keep the oldest geometry, when committed several times before the flush
+            old_geometries.setdefault(feature.id(), feature.geometry())
+
+    def _geometries_committed(self, layer_id: str, changes: dict):
+        # moved labels move the start of their leader lines
+        self._leaders_changed(layer_id, changes.keys())
+
+        pending = self._pending.setdefault(layer_id, {})
+        new_geometries = self._new_geometries.setdefault(layer_id, {})
+        for fid, geometry in changes.items():
+            pending.setdefault(fid, set()).add(GEOMETRY_CHANGED)
+            new_geometries[fid] = QgsGeometry(geometry)
+
+        self._flush_timer.start()
+
+    def _flush(self):
+        """ Writes all collected changes, one batch per labeling and referenced layer """
+        pending, self._pending = self._pending, {}
+        old_geometries, self._old_geometries = self._old_geometries, {}
+        new_geometries, self._new_geometries = self._new_geometries, {}
+        leader_changes, self._leader_changes = self._leader_changes, {}
+
+        project = QgsProject.instance()
+        for layer_id, fids in leader_changes.items():
+            layer = project.mapLayer(layer_id)
+            if layer is None:
+                continue
+
+            ok, message = sync_leader_lines(layer, fids)
+            if not ok:
+                msg = f"Pfeillayer von '{layer.name()}' konnte nicht aktualisiert werden ({message})"
+                self._push(msg, Qgis.Warning)
+
+        follow_layers = self._follow_layers()
+        moved = 0
+        kept = 0
+        for reference_id, geometries in new_geometries.items():
+            reference_layer = self._reference_layer(reference_id)
+            if reference_layer is None:
+                continue
+
+            for layer in follow_layers:
+                if layer.id() == reference_id:
+                    continue
+
+                index = self._index(layer)
+                labels = {label_fid: fid for fid in geometries
+                          for label_fid in index.lookup(reference_layer.name(), fid)}
+                fids, layer_kept, error = reanchor_labels(layer, reference_layer.crs(), labels, geometries,
+                                                          old_geometries.get(reference_id),
+                                                          follow_mode(layer) == FOLLOW_FORCE)
+                if error:
+                    msg = f"Beschriftungen in '{layer.name()}' konnten nicht verschoben werden ({error})"
+                    self._push(msg, Qgis.Warning)
+                    continue
+
+                kept += layer_kept
+                if fids:
+                    moved += len(fids)
+                    layer.triggerRepaint()
+                    if leader_lines_enabled(layer):
+                        sync_leader_lines(layer, fids)
+
+        if moved:
+            self._push(f"{moved} Beschriftung(en) verschoben.")
+        if kept:
+            msg = f"{kept} manuell verschobene Beschriftung(en) nicht verschoben."
+            self._push(msg)
+
+        labeling_layers = [layer for layer in project.mapLayers().values()
+                           if isinstance(layer, QgsVectorLayer) and live_sync_enabled(layer)]
+        if not labeling_layers:
+            return
+
+        written = 0
+        for reference_id, changes in pending.items():
+            reference_layer = self._reference_layer(reference_id)
+            if reference_layer is None:
+                continue
+
+            for layer in labeling_layers:
+                if layer.id() == reference_id:
+                    continue
+
+                labels = self._index(layer).affected(reference_layer.name(), changes)
+                count, error = update_label_texts(layer, reference_layer, labels)
+                if error:
+                    msg = f"Beschriftungen in '{layer.name()}' konnten nicht aktualisiert werden ({error})"
+                    self._push(msg, Qgis.Warning)
+                    continue
+
+                if count:
+                    written += count
+                    layer.triggerRepaint()
+
+        if written:
+            self._push(f"{written} Beschriftung(en) aktualisiert.")
+
+    def _push(self, message: str, level: Qgis.MessageLevel = Qgis.Info):
+        """ Shows a message in the message bar, in the message log without QGIS gui """
+        if self.iface is None:
+            QgsMessageLog.logMessage(message, "Easy Labeling", level)
+        else:
+            self.iface.messageBar().pushMessage("Easy Labeling", message, level)
+
+    @staticmethod
+    def _reference_layer(layer_id: str) -> Optional[QgsVectorLayer]:
+        """ references are resolved by unique layer names """
+        project = QgsProject.instance()
+        layer = project.mapLayer(layer_id)
+        if layer is None or len(project.mapLayersByName(layer.name())) != 1:
+            return None
+
+        return layer
+
+    @staticmethod
+    def _follow_layers() -> List[QgsVectorLayer]:
+        return [layer for layer in QgsProject.instance().mapLayers().values()
+                if isinstance(layer, QgsVectorLayer) and follow_mode(layer)]
+
+    def _index(self, layer: QgsVectorLayer) -> ReverseIndex:
+        index = self._indexes.get(layer.id())
+        if index is None:
+            index = self._indexes[layer.id()] = ReverseIndex(layer, self._reference_index(layer))
+
+        return index
+
+    def _reference_index(self, layer: Optional[QgsVectorLayer], build: bool = True) -> Optional[ReferenceIndex]:
+        """ Returns the persistent reference index of a labeling layer, None without GeoPackage.
+            With `build` it is built again after it was dropped and completed, when the feature count
+            of the layer changed since the last sync, see `ReferenceIndex.sync`.
+        """
+        if layer is None or not is_labeling_layer(layer):
+            return None
+
+        if layer.id() not in self._reference_indexes:
+            self._reference_indexes[layer.id()] = ReferenceIndex.for_layer(layer)
+
+        reference_index = self._reference_indexes[layer.id()]
+        if reference_index is None or not build:
+            return reference_index
+
+        if reference_index.exists() and self._synced.get(layer.id()) == layer.featureCount():
+            return reference_index
+
+        try:
+            reference_index.sync(layer)
+        except sqlite3.Error as e:
+            msg = f"Referenzindex von '{layer.name()}' konnte nicht geladen werden ({e})"
+            self._push(msg, Qgis.Warning)
+            self._synced.pop(layer.id(), None)
+            return None
+
+        self._synced[layer.id()] = layer.featureCount()
+        return reference_index
+
+    def unload(self, self_unload: bool = False):
+        self._flush_timer.stop()
+        self._indexes.clear()
+        for reference_index in self._reference_indexes.values():
+            if reference_index is not None:
+                reference_index.close()
+        self._reference_indexes.clear()
+        self._synced.clear()
+        self._pending.clear()
+        self._old_geometries.clear()
+        self._new_geometries.clear()
+        self._leader_changes.clear()
+        return super().unload(self_unload)
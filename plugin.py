@@ -20,7 +20,7 @@ import os
 
 from pathlib import Path
 
-from qgis.core import QgsApplication
+from qgis.core import QgsApplication, QgsMessageLog, Qgis
 from qgis.gui import QgisInterface
 
 from qgis.PyQt.QtWidgets import QMenu, QApplication, QAction
@@ -32,6 +32,11 @@ from .submodules.basics.versions_reader import VersionPlugin
 from .submodules.basics.compatibility import qgis_unload_keyerror
 
 from .submodules.module_base.base_class import ModuleBase, Plugin
+from .submodules.qgis.canvas.drawing_registry import DrawingRegistry, SCOPE_MAP_TOOL
+from .submodules.qgis.geometry.transform import TRANSFORM_CACHE
+
+# maximum number of canvas drawings, the oldest drawings are removed first
+MAX_DRAWINGS = 10000
 
 
 class EasyLabeling(Plugin):
@@ -77,17 +82,26 @@ class EasyLabeling(Plugin):
         super().__init__(*args, log_name=self.log_filename,
                          name=self.plugin_name, **kwargs)
 
+        # shared with all DrawTool objects, see `check_map_tool_changed`
+        self.drawings = DrawingRegistry(MAX_DRAWINGS)
+
+        # processing algorithms, see `initProcessing`
+        self.provider = None
+
         self.connect(self.pluginUnloaded, self.reloaded)
 
-        if self.is_qgis_plugin():
+        # no interface when loaded by qgis_process
+        if self.is_qgis_plugin() and self.iface is not None:
             self.connect(self.iface.mapCanvas().mapToolSet, self.check_map_tool_changed)
 
     def check_map_tool_changed(self, new_tool, old_tool):
-        for drawing in self.drawings:
-            if drawing:
-                self.iface.mapCanvas().scene().removeItem(drawing)
+        """ removes drawings of the last map tool session """
+        self.drawings.remove_scope(SCOPE_MAP_TOOL)
 
-        self.drawings.clear()
+        if self.is_dev_mode():
+            scene_items = len(self.iface.mapCanvas().scene().items())
+            QgsMessageLog.logMessage(f"Zeichnungen: {self.drawings.stats()}, Elemente in Karte: {scene_items}",
+                                     self.plugin_name, Qgis.Info)
 
     def is_qgis_plugin(self) -> bool:
         """ is this a module loaded per default from QGIS? """
@@ -103,6 +117,17 @@ class EasyLabeling(Plugin):
 
         return not (path == Path(__file__))
 
+    # noinspection PyPep8Naming
+    def initProcessing(self):
+        """ Registers the processing provider, also called by qgis_process without gui """
+        if self.provider is not None:
+            return
+
+        from .algorithms.provider import EasyLabelingProvider
+
+        self.provider = EasyLabelingProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     # noinspection PyPep8Naming
     def initGui(self):
         """ Called by QGIS on programm start or loading this plugin.
@@ -142,6 +167,9 @@ class EasyLabeling(Plugin):
                             True,
                             tool_tip=tool_tip)
 
+        if self.is_qgis_plugin():
+            self.initProcessing()
+
         # Do not add you actions in initGui, keep it clean and use load_tool_bar instead
         from .utilities import ui_control
         ui_control.load_tool_bar(self)
@@ -162,6 +190,10 @@ class EasyLabeling(Plugin):
 
     def unload(self, self_unload: bool = False):
         """ Auto-call when plugin will be unloaded from QGIS plugin manager. """
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+
         super().unload()
 
         QApplication.restoreOverrideCursor()
@@ -176,9 +208,8 @@ class EasyLabeling(Plugin):
 
         qgis_unload_keyerror(self.plugin_dir)
 
-        for marker in self.drawings:
-            self.iface.mapCanvas().scene().removeItem(marker)
         self.drawings.clear()
+        TRANSFORM_CACHE.unload()
 
     def __repr__(self) -> str:
         if self.is_qgis_plugin():
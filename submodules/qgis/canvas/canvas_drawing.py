@@ -15,14 +15,17 @@
  ***************************************************************************/
 """
 
-from qgis.gui import QgsMapTool, QgsVertexMarker, QgsRubberBand
-from qgis.core import QgsGeometry, QgsVectorLayer, QgsPointXY
+from qgis.gui import QgsMapTool, QgsVertexMarker, QgsRubberBand, QgsMapCanvas
+from qgis.core import QgsGeometry, QgsVectorLayer, QgsPointXY, QgsWkbTypes, QgsCoordinateTransform
 
 from qgis.PyQt.QtGui import QColor, QFont
 from qgis.PyQt.QtCore import Qt, QPointF
 
 from typing import Optional, Union, List
 
+from .canvas_overlay import CanvasOverlay
+from .drawing_registry import DrawingRegistry, ListDrawingRegistry, SCOPE_MAP_TOOL, SCOPE_MODULE
+
 
 class DrawTool:
     """ Zur Erstellung einfacher Grafiken und Markierungen auf der Karte.
@@ -46,10 +49,14 @@ class DrawTool:
         :param color: color from Qt, defaults to QColor(0, 250, 0, 100)
         :param size: size, defaults to 10
         :param width: width, defaults to 7
-        :param drawings: optional vertex marker list to add marker to the list
+        :param drawings: optional drawing registry shared with other tools, e.g. `Plugin.drawings`.
+                         Plain lists are wrapped in a `ListDrawingRegistry` and kept up to date
+        :param scope: registry scope of drawings from this tool, defaults to `SCOPE_MAP_TOOL`.
+                      The `overlay` is always kept with `SCOPE_MODULE` until `remove_class_drawings`.
     """
 
-    def __init__(self, canvas, color: QColor = QColor(0, 250, 0, 100), size: int = 10, width: int = 7, drawings: Optional[List] = None):
+    def __init__(self, canvas, color: QColor = QColor(0, 250, 0, 100), size: int = 10, width: int = 7,
+                 drawings: Optional[Union[DrawingRegistry, list]] = None, scope: str = SCOPE_MAP_TOOL):
 
         self.canvas = canvas
         self.QgsMapTool = QgsMapTool(self.canvas)
@@ -58,10 +65,15 @@ class DrawTool:
         self.color = color
 
         if drawings is None:
-            drawings = []
+            drawings = DrawingRegistry()
+        elif isinstance(drawings, list):
+            drawings = ListDrawingRegistry(drawings)
+        elif not isinstance(drawings, DrawingRegistry):
+            raise TypeError(f"drawings must be a DrawingRegistry, got {type(drawings).__name__}")
 
         self.drawings = drawings
-        self.drawn_objekts = []
+        self.scope = scope
+        self._overlay: Optional[CanvasOverlay] = None
 
     def add_text(self, text: str, point: Union[QPointF, QgsVertexMarker], font: Optional[QFont] = None):
         """ Adds text to current canvas scene at given point.
@@ -85,8 +97,7 @@ class DrawTool:
 
         item = self.canvas.scene().addText(text, font)
         item.setPos(point)
-        self.drawn_objekts.append(item)
-        self.drawings.append(item)
+        self._register(item)
 
     def set_color(self, red: int, green: int, blue: int, transparency: int):
         """ Ändere die Farbe des Zeichentools
@@ -157,9 +168,8 @@ class DrawTool:
                 v_point.setPenWidth(width)
                 if fill_color:
                     v_point.setFillColor(fill_color)
-                self.drawn_objekts.append(v_point)
+                self._register(v_point)
                 v_points.append(v_point)
-                self.drawings.append(v_point)
             return v_points
 
         elif isinstance(point, QgsPointXY):
@@ -175,8 +185,7 @@ class DrawTool:
             v_point.setPenWidth(width)
             if fill_color:
                 v_point.setFillColor(fill_color)
-            self.drawn_objekts.append(v_point)
-            self.drawings.append(v_point)
+            self._register(v_point)
             return v_point
 
         elif isinstance(point, QgsGeometry):
@@ -190,8 +199,7 @@ class DrawTool:
             v_point.setPenWidth(width)
             if fill_color:
                 v_point.setFillColor(fill_color)
-            self.drawn_objekts.append(v_point)
-            self.drawings.append(v_point)
+            self._register(v_point)
             return v_point
 
         else:
@@ -233,22 +241,120 @@ class DrawTool:
         rubber_band.setColor(color)
         rubber_band.setWidth(width)
         rubber_band.setLineStyle(line_type)
-        if not drawn:
-            self.drawn_objekts.append(rubber_band)
-        self.drawings.append(rubber_band)
+        self._register(rubber_band, owned=not drawn)
         return rubber_band
 
+    @property
+    def overlay(self) -> CanvasOverlay:
+        """ Shared overlay for batch drawings, recreated after it was removed from canvas """
+        if self._overlay is None or self._overlay.scene() is None:
+            self._overlay = CanvasOverlay(self.canvas)
+            # shared by the dock, not removed when the map tool changes
+            self.drawings.add(self._overlay, owner=self, scope=SCOPE_MODULE)
+
+        return self._overlay
+
+    def add_markers(self, points: List[QgsPointXY], source_layer: Optional[QgsVectorLayer] = None,
+                    color: QColor = None, icon_type: QgsVertexMarker.IconType = None, size: int = None) -> int:
+        """ Zeichnet viele Punkte in einem Canvas-Element (CanvasOverlay).
+            Schneller als `create_vpoint` mit vielen Punkten.
+
+            :param points: points
+            :param source_layer: converts points from layer crs to map crs, None for map coordinates
+            :param color: color, defaults to None
+            :param icon_type: icon_type, defaults to None
+            :param size: size, defaults to None
+            :return: group handle, see `remove_overlay_group`
+        """
+        if color is None:
+            color = self.color
+        if size is None:
+            size = self.size
+        if icon_type is None:
+            icon_type = QgsVertexMarker.ICON_CIRCLE
+
+        points = self._to_map_points(points, source_layer)
+        return self.overlay.add_markers([(p.x(), p.y()) for p in points], color, size, icon_type)
+
+    def add_lines(self, lines: List[List[QgsPointXY]], source_layer: Optional[QgsVectorLayer] = None,
+                  line_type: Qt.PenStyle = Qt.SolidLine, color: QColor = None, width: int = None) -> int:
+        """ Zeichnet viele Linien in einem Canvas-Element (CanvasOverlay).
+            Schneller als `create_rubber_band` mit vielen Linien.
+
+            :param lines: poly lines
+            :param source_layer: converts points from layer crs to map crs, None for map coordinates
+            :param line_type: Aussehen der Linie, defaults to Qt.SolidLine
+            :param color: color, defaults to None
+            :param width: width, defaults to None
+            :return: group handle, see `remove_overlay_group`
+        """
+        if color is None:
+            color = self.color
+        if width is None:
+            width = self.width
+
+        coords = []
+        offsets = [0]
+        for line in lines:
+            coords.extend((p.x(), p.y()) for p in self._to_map_points(line, source_layer))
+            offsets.append(len(coords))
+
+        return self.overlay.add_lines(coords, offsets, color, width, line_type)
+
+    def remove_overlay_group(self, handle: int):
+        if self._overlay is not None:
+            self._overlay.remove_group(handle)
+
+    def clear_overlay(self):
+        """ entfernt alle Punkte und Linien aus `add_markers` und `add_lines` """
+        if self._overlay is not None:
+            self._overlay.clear()
+
+    def _to_map_points(self, points: List[QgsPointXY], source_layer: Optional[QgsVectorLayer]) -> List[QgsPointXY]:
+        if source_layer is None:
+            return points
+
+        transform = self.canvas.mapSettings().layerTransform(source_layer)
+        if not transform.isValid() or transform.isShortCircuited():
+            return points
+
+        return [transform.transform(p) for p in points]
+
+    def create_preview_line(self, line_type: Qt.PenStyle = Qt.DashLine,
+                            color: QColor = None, width: int = None) -> 'PreviewLine':
+        """ Erstellt eine Vorschaulinie (PreviewLine) mit den Einstellungen des Zeichentools.
+            Die Vorschaulinie wird nicht in `drawings` gespeichert, entferne sie mit `PreviewLine.remove`.
+
+            :param line_type: Aussehen der Linie, defaults to Qt.DashLine
+            :param color: color, defaults to None
+            :param width: width, defaults to None
+        """
+        if color is None:
+            color = self.color
+        if width is None:
+            width = self.width
+
+        return PreviewLine(self.canvas, line_type, color, width)
+
+    @property
+    def drawn_objekts(self) -> List:
+        """ Zeichnungen dieser Klasse """
+        return self.drawings.items(owner=self)
+
+    def _register(self, item, owned: bool = True) -> int:
+        return self.drawings.add(item, owner=self if owned else None, scope=self.scope)
+
     def remove_class_drawings(self):
         """ entfernt alle Zeichnungen dieser Klasse """
-        for drawing in self.drawn_objekts:
-            self.canvas.scene().removeItem(drawing)
-        self.drawn_objekts = []
+        self.drawings.remove_owner(self)
+
+    def remove_tool_drawings(self):
+        """ entfernt die Zeichnungen dieser Klasse im eigenen Bereich (`scope`), das `overlay` bleibt erhalten """
+        self.drawings.remove_owner(self, self.scope)
 
     def remove_all_drawings(self):
-        """ entfernt alle Zeichnungen """
-        for drawing in self.drawings:
-            self.canvas.scene().removeItem(drawing)
-        self.drawings = []
+        """ entfernt alle Zeichnungen, die Registry bleibt mit anderen Tools geteilt """
+        self.drawings.clear()
 
     def remove_last_drawings(self, quantity: int = 1):
         """ entfernt die letzten `quantity` Zeichnungen
@@ -258,7 +364,91 @@ class DrawTool:
         """
         for i in range(quantity):
             try:
-                self.canvas.scene().removeItem(self.drawings[-1])
                 self.drawings.pop(-1)
             except IndexError:
                 pass
+
+
+class PreviewLine:
+    """ Line from a fixed anchor to a moving end point, e.g. while a map tool is active.
+        One rubber band is reused, on each move only its end vertex is moved.
+        Moves are applied right away, `MapToolQgisSnap.moved` is already throttled to the screen refresh.
+
+        .. code-block:: python
+
+            preview = PreviewLine(iface.mapCanvas())
+            preview.start(anchor, layer)
+            tool.moved.connect(preview.move_to)
+            tool.aborted.connect(preview.reset)
+
+        :param canvas: map canvas
+        :param line_type: pen style, defaults to Qt.DashLine
+        :param color: color, defaults to QColor(0, 250, 0, 100)
+        :param width: width, defaults to 7
+    """
+
+    def __init__(self, canvas: QgsMapCanvas, line_type: Qt.PenStyle = Qt.DashLine,
+                 color: QColor = QColor(0, 250, 0, 100), width: int = 7):
+        self.canvas = canvas
+        self.line_type = line_type
+        self.color = color
+        self.width = width
+
+        self._rubber_band: Optional[QgsRubberBand] = None
+        self._transform: Optional[QgsCoordinateTransform] = None
+        self._active = False
+
+    def start(self, anchor: QgsPointXY, layer: Optional[QgsVectorLayer] = None):
+        """ Starts a new preview line at anchor.
+
+            :param anchor: anchor point
+            :param layer: layer of anchor and moved points, None for map coordinates
+        """
+        if layer is not None:
+            self._transform = self.canvas.mapSettings().layerTransform(layer)
+            if not self._transform.isValid() or self._transform.isShortCircuited():
+                self._transform = None
+        else:
+            self._transform = None
+
+        if self._rubber_band is None:
+            self._rubber_band = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+            self._rubber_band.setColor(self.color)
+            self._rubber_band.setWidth(self.width)
+            self._rubber_band.setLineStyle(self.line_type)
+
+        anchor = self._to_map(anchor)
+        self._rubber_band.reset(QgsWkbTypes.LineGeometry)
+        self._rubber_band.addPoint(anchor, False)
+        self._rubber_band.addPoint(anchor, True)
+        self._active = True
+
+    def move_to(self, point: QgsPointXY):
+        """ Moves the end vertex """
+        if not self._active:
+            return
+
+        self._rubber_band.movePoint(self._to_map(point))
+
+    def _to_map(self, point: QgsPointXY) -> QgsPointXY:
+        if self._transform is None:
+            return QgsPointXY(point)
+
+        return self._transform.transform(point)
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def reset(self, *args):
+        """ Hides the line, the rubber band is kept for the next `start` """
+        self._active = False
+        if self._rubber_band is not None:
+            self._rubber_band.reset(QgsWkbTypes.LineGeometry)
+
+    def remove(self):
+        """ Removes the rubber band from canvas """
+        self.reset()
+        if self._rubber_band is not None:
+            self.canvas.scene().removeItem(self._rubber_band)
+            self._rubber_band = None
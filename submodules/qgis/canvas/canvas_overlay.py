@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy as np
+
+from qgis.gui import QgsMapCanvasItem, QgsMapCanvas, QgsVertexMarker
+from qgis.core import QgsRectangle
+
+from qgis.PyQt.QtGui import QColor, QPainter, QPainterPath, QPen, QPolygonF, QTransform
+from qgis.PyQt.QtCore import Qt, QRectF
+
+from typing import Dict, Iterable, Optional, Sequence
+
+
+def _as_coords(coords: Iterable[Sequence[float]]) -> np.ndarray:
+    """ (x, y) pairs as contiguous float64 array with shape (n, 2) """
+    if not isinstance(coords, (np.ndarray, list, tuple)):
+        coords = list(coords)
+
+    return np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def _polygon(coords: np.ndarray) -> QPolygonF:
+    """ Builds a polygon from an array with shape (n, 2) with one copy of its memory.
+        QPointF stores two qreal values, which are doubles on all desktop platforms.
+    """
+    polygon = QPolygonF(len(coords))
+    if len(coords):
+        pointer = polygon.data()
+        pointer.setsize(coords.nbytes)
+        np.frombuffer(pointer, dtype=np.float64).reshape(-1, 2)[:] = coords
+
+    return polygon
+
+
+class _Group:
+    """ Markers or lines with one pen """
+
+    def __init__(self, pen: QPen, margin: float, polygon: Optional[QPolygonF] = None,
+                 path: Optional[QPainterPath] = None):
+        self.pen = pen
+        self.margin = margin
+        self.polygon = polygon
+        self.path = path
+
+        rect = polygon.boundingRect() if polygon is not None else path.boundingRect()
+        self.extent = QgsRectangle(rect.left(), rect.top(), rect.right(), rect.bottom())
+
+
+class CanvasOverlay(QgsMapCanvasItem):
+    """ One canvas item painting many markers and lines in one pass.
+        Coordinates are map coordinates, markers and lines are added in groups sharing one style.
+
+        .. code-block:: python
+
+            overlay = CanvasOverlay(iface.mapCanvas())
+            handle = overlay.add_markers([(10.0, 50.0), (10.1, 50.1)], QColor(255, 0, 0), 8)
+            overlay.add_lines([(10.0, 50.0), (10.1, 50.1), (10.2, 50.0)], [0, 3], QColor(0, 0, 255), 2)
+            overlay.remove_group(handle)
+            overlay.clear()
+
+        :param canvas: map canvas
+    """
+
+    def __init__(self, canvas: QgsMapCanvas):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self._groups: Dict[int, _Group] = {}
+        self._next_handle = 0
+        self._margin = 0.0
+        self.setVisible(False)
+
+    def add_markers(self, coords: Iterable[Sequence[float]], color: QColor, size: int = 10,
+                    icon_type: int = QgsVertexMarker.ICON_CIRCLE) -> int:
+        """ Adds markers drawn as dots.
+
+            :param coords: (x, y) pairs in map coordinates, e.g. a numpy array with shape (n, 2)
+            :param color: color
+            :param size: dot size in pixels
+            :param icon_type: `QgsVertexMarker.ICON_BOX` for squares, otherwise circles
+            :return: group handle
+        """
+        polygon = _polygon(_as_coords(coords))
+        if polygon.isEmpty():
+            return -1
+
+        pen = QPen(color)
+        pen.setWidthF(size)
+        pen.setCosmetic(True)
+        pen.setCapStyle(Qt.SquareCap if icon_type == QgsVertexMarker.ICON_BOX else Qt.RoundCap)
+
+        return self._add_group(_Group(pen, size, polygon=polygon))
+
+    def add_lines(self, coords: Sequence[Sequence[float]], offsets: Sequence[int], color: QColor,
+                  width: int = 2, line_type: Qt.PenStyle = Qt.SolidLine) -> int:
+        """ Adds packed lines, see `geometry.placement.pack_lines`.
+
+            :param coords: (x, y) pairs in map coordinates of all lines, e.g. a numpy array with shape (n, 2)
+            :param offsets: start index of each line plus end index
+            :param color: color
+            :param width: line width in pixels
+            :param line_type: pen style
+            :return: group handle
+        """
+        coords = _as_coords(coords)
+        path = QPainterPath()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            if end - start < 2:
+                continue
+
+            # unclosed sub path
+            path.addPolygon(_polygon(coords[start:end]))
+
+        if path.isEmpty():
+            return -1
+
+        pen = QPen(color)
+        pen.setWidthF(width)
+        pen.setCosmetic(True)
+        pen.setStyle(line_type)
+
+        return self._add_group(_Group(pen, width, path=path))
+
+    def remove_group(self, handle: int):
+        if self._groups.pop(handle, None) is not None:
+            self._update_extent()
+
+    def clear(self):
+        self._groups.clear()
+        self._update_extent()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def _add_group(self, group: _Group) -> int:
+        handle = self._next_handle
+        self._next_handle += 1
+        self._groups[handle] = group
+        self._update_extent()
+
+        return handle
+
+    def _update_extent(self):
+        if not self._groups:
+            self.setVisible(False)
+            return
+
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for group in self._groups.values():
+            extent.combineExtentWith(group.extent)
+
+        self.prepareGeometryChange()
+        self._margin = max(group.margin for group in self._groups.values())
+        self.setRect(extent)
+        self.setVisible(True)
+        self.update()
+
+    def boundingRect(self) -> QRectF:
+        margin = self._margin
+        return super().boundingRect().adjusted(-margin, -margin, margin, margin)
+
+    def paint(self, painter: QPainter, option=None, widget=None):
+        if not self._groups:
+            return
+
+        # map coordinates to item coordinates
+        position = self.pos()
+        transform = self.canvas.mapSettings().mapToPixel().transform() * \
+            QTransform.fromTranslate(-position.x(), -position.y())
+
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setBrush(Qt.NoBrush)
+        for group in self._groups.values():
+            painter.setPen(group.pen)
+            if group.path is not None:
+                painter.drawPath(transform.map(group.path))
+            else:
+                painter.drawPoints(transform.map(group.polygon))
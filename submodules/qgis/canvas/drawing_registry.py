@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import OrderedDict
+
+from qgis.PyQt.QtWidgets import QGraphicsItem
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# removed, when the map tool changes
+SCOPE_MAP_TOOL = "map_tool"
+# kept until the owner removes it, e.g. on module unload
+SCOPE_MODULE = "module"
+
+
+class DrawingRegistry:
+    """ Registry of canvas scene items with owner and scope.
+        Removing an item removes it from its scene. Adding, removing by handle
+        or item and removing the oldest item are O(1).
+
+        List compatible (`append`, `clear`, `pop`, iteration, ...) to replace `Plugin.drawings`.
+
+        .. code-block:: python
+
+            registry = DrawingRegistry(max_size=5000)
+            handle = registry.add(rubber_band, owner=tool, scope=SCOPE_MAP_TOOL)
+            registry.remove(handle)
+            registry.remove_scope(SCOPE_MAP_TOOL)  # e.g. when map tool changed
+            registry.remove_owner(tool)
+            print(registry.stats())
+
+        :param max_size: maximum number of items, the oldest items are removed first. None for no limit.
+                         Items with `SCOPE_MODULE` are never removed by the limit.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        if max_size is not None and max_size < 1:
+            raise ValueError(f"max size must be greater than 0, got {max_size}")
+
+        self.max_size = max_size
+        # handle -> (item, owner key, scope)
+        self._entries: 'OrderedDict[int, Tuple[QGraphicsItem, Any, str]]' = OrderedDict()
+        # id(item) -> handle
+        self._handles: Dict[int, int] = {}
+        self._next_handle = 0
+        # number of items removed by `max_size`
+        self.evicted = 0
+
+    def add(self, item: QGraphicsItem, owner: Any = None, scope: str = SCOPE_MAP_TOOL) -> int:
+        """ Registers an item. Registering an item again returns its handle.
+
+            :param item: scene item
+            :param owner: owner object, see `remove_owner`
+            :param scope: scope, see `remove_scope`
+            :return: handle
+        """
+        handle = self._handles.get(id(item))
+        if handle is not None:
+            return handle
+
+        handle = self._next_handle
+        self._next_handle += 1
+        self._entries[handle] = (item, self._owner_key(owner), scope)
+        self._handles[id(item)] = handle
+
+        if self.max_size is not None and len(self._entries) > self.max_size:
+            self._evict()
+
+        return handle
+
+    def _evict(self):
+        """ Removes the oldest items above `max_size`, except items with `SCOPE_MODULE` """
+        handles = []
+        excess = len(self._entries) - self.max_size
+        for handle, (_, _, scope) in self._entries.items():
+            if len(handles) >= excess:
+                break
+            if scope != SCOPE_MODULE:
+                handles.append(handle)
+
+        for handle in handles:
+            self._remove_handle(handle)
+        self.evicted += len(handles)
+
+    def remove(self, handle_or_item) -> bool:
+        """ Removes an item by handle or item from registry and scene.
+
+            :return: True, if the item was registered
+        """
+        handle = handle_or_item if isinstance(handle_or_item, int) else self._handles.get(id(handle_or_item))
+        if handle is None or handle not in self._entries:
+            return False
+
+        self._remove_handle(handle)
+        return True
+
+    def remove_owner(self, owner: Any, scope: Optional[str] = None) -> int:
+        """ Removes all items of an owner, optional only the ones of a scope.
+
+            :return: number of removed items
+        """
+        key = self._owner_key(owner)
+        return self._remove_where(lambda entry: entry[1] == key and (scope is None or entry[2] == scope))
+
+    def remove_scope(self, scope: str) -> int:
+        """ Removes all items of a scope.
+
+            :return: number of removed items
+        """
+        return self._remove_where(lambda entry: entry[2] == scope)
+
+    def items(self, owner: Any = None, scope: Optional[str] = None) -> List[QGraphicsItem]:
+        """ Returns registered items, optional filtered by owner and scope. """
+        key = self._owner_key(owner) if owner is not None else None
+        return [item for item, item_owner, item_scope in self._entries.values()
+                if (key is None or item_owner == key) and (scope is None or item_scope == scope)]
+
+    def stats(self) -> Dict[str, int]:
+        """ Number of items per scope, total, items in scenes and evicted items """
+        stats: Dict[str, int] = {}
+        in_scene = 0
+        for item, _, scope in self._entries.values():
+            stats[scope] = stats.get(scope, 0) + 1
+            if _scene(item) is not None:
+                in_scene += 1
+
+        stats["total"] = len(self._entries)
+        stats["in_scene"] = in_scene
+        stats["evicted"] = self.evicted
+
+        return stats
+
+    @staticmethod
+    def _owner_key(owner: Any) -> Any:
+        return id(owner) if owner is not None else None
+
+    def _remove_where(self, condition) -> int:
+        handles = [handle for handle, entry in self._entries.items() if condition(entry)]
+        for handle in handles:
+            self._remove_handle(handle)
+
+        return len(handles)
+
+    def _remove_handle(self, handle: int) -> QGraphicsItem:
+        item, _, _ = self._entries.pop(handle)
+        self._handles.pop(id(item), None)
+
+        scene = _scene(item)
+        if scene is not None:
+            scene.removeItem(item)
+
+        return item
+
+    # list compatible interface
+
+    def append(self, item: QGraphicsItem):
+        self.add(item)
+
+    def extend(self, items: Iterable[QGraphicsItem]):
+        for item in items:
+            self.add(item)
+
+    def clear(self):
+        """ Removes all items from registry and scenes """
+        for handle in list(self._entries):
+            self._remove_handle(handle)
+
+    def pop(self, index: int = -1) -> QGraphicsItem:
+        """ Removes the newest (-1) or oldest (0) item """
+        if not self._entries:
+            raise IndexError("pop from empty registry")
+
+        if index == -1:
+            handle = next(reversed(self._entries))
+        elif index == 0:
+            handle = next(iter(self._entries))
+        else:
+            handle = list(self._entries)[index]
+
+        return self._remove_handle(handle)
+
+    def __getitem__(self, index: int) -> QGraphicsItem:
+        if index == -1 and self._entries:
+            return self._entries[next(reversed(self._entries))][0]
+
+        return list(self)[index]
+
+    def __iter__(self) -> Iterator[QGraphicsItem]:
+        return iter([entry[0] for entry in self._entries.values()])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, item: QGraphicsItem) -> bool:
+        return id(item) in self._handles
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.stats()})"
+
+
+def _scene(item: QGraphicsItem):
+    try:
+        return item.scene()
+    except RuntimeError:
+        # c++ object already deleted
+        return None
+
+
+class ListDrawingRegistry(DrawingRegistry):
+    """ Registry keeping a plain list of drawings up to date, for callers still passing lists to `DrawTool`.
+        Items already in the list are registered without owner.
+
+        :param drawings: list of scene items, items are appended and removed with the registry
+        :param max_size: see `DrawingRegistry`
+    """
+
+    def __init__(self, drawings: list, max_size: Optional[int] = None):
+        super().__init__(max_size)
+        self.drawings = drawings
+        for item in list(drawings):
+            super().add(item)
+
+    def add(self, item: QGraphicsItem, owner: Any = None, scope: str = SCOPE_MAP_TOOL) -> int:
+        if id(item) not in self._handles:
+            self.drawings.append(item)
+
+        return super().add(item, owner, scope)
+
+    def _remove_handle(self, handle: int) -> QGraphicsItem:
+        item = super()._remove_handle(handle)
+        for index, drawing in enumerate(self.drawings):
+            if drawing is item:
+                del self.drawings[index]
+                break
+
+        return item
@@ -15,11 +15,14 @@
  ***************************************************************************/
 """
 
-from qgis.PyQt.QtCore import pyqtSignal, Qt, QPoint
-from qgis.core import (QgsVectorLayer, QgsPointXY, Qgis, QgsPointLocator)
-from qgis.gui import (QgsMapTool, QgisInterface, QgsSnapIndicator)
+from functools import partial
 
-from typing import Optional, List
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QPoint, QTimer
+from qgis.PyQt.QtGui import QGuiApplication
+from qgis.core import (QgsVectorLayer, QgsPointXY, Qgis, QgsPointLocator, QgsTolerance)
+from qgis.gui import (QgsMapTool, QgisInterface, QgsSnapIndicator, QgsMapCanvas)
+
+from typing import Optional, List, Dict, Tuple, Iterable
 
 
 class MapToolQgisSnap(QgsMapTool):
@@ -58,6 +61,11 @@ class MapToolQgisSnap(QgsMapTool):
                              then a default filter will be generated from `LayerMatchFilter`.
         :param force_snap: force only use snapped points for poly line. Each point for poly line must be snapped.
         :param min_segment_length: minimum new segment length, defaults to 0.1. Set to -1 to disable it
+        :param reference_layer: snap only on vertices and edges of this layer with a prebuilt point locator,
+                                see `LOCATORS`. Project snapping config is not used then.
+        :param reference_fids: snap only on these features of `reference_layer`
+        :param move_interval: minimum milliseconds between two `moved` signals,
+                              defaults to one screen refresh (16 without screen)
 
     """
     aborted = pyqtSignal(name="aborted")
@@ -68,7 +76,10 @@ class MapToolQgisSnap(QgsMapTool):
                  layer: QgsVectorLayer,
                  snap_on_layers: Optional[List[QgsVectorLayer]] = None,
                  match_filter: Optional[QgsPointLocator.MatchFilter] = None,
-                 force_snap: bool = False):
+                 force_snap: bool = False,
+                 reference_layer: Optional[QgsVectorLayer] = None,
+                 reference_fids: Optional[Iterable[int]] = None,
+                 move_interval: Optional[int] = None):
 
         self.canvas = iface.mapCanvas()
         QgsMapTool.__init__(self, self.canvas)
@@ -96,6 +107,21 @@ class MapToolQgisSnap(QgsMapTool):
         # layer with same build method
         self.layer = layer
 
+        self.reference_layer = reference_layer
+        self._reference_filter = FidMatchFilter(reference_fids) if reference_fids is not None else None
+
+        # only the last mouse position is snapped, the only throttle of mouse moves,
+        # receivers of `moved` like `PreviewLine` draw right away
+        if move_interval is None:
+            screen = QGuiApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen is not None else 0
+            move_interval = int(1000 / refresh_rate) if refresh_rate > 0 else 16
+        self._move_pos: Optional[QPoint] = None
+        self._move_timer = QTimer()
+        self._move_timer.setSingleShot(True)
+        self._move_timer.setInterval(move_interval)
+        self._move_timer.timeout.connect(self._process_move)
+
         # activate self as Maptool
         self.canvas.setMapTool(self)
 
@@ -103,9 +129,25 @@ class MapToolQgisSnap(QgsMapTool):
         """ Returns snapped point. Point's crs is in projects/canvas crs. """
         coord = self.toMapCoordinates(pos)
 
+        if self.reference_layer is not None:
+            return self._get_reference_match(coord)
+
         # test for default snapping
         return self._utils.snapToMap(coord, filter=self._match_filter)
 
+    def _get_reference_match(self, coord: QgsPointXY) -> QgsPointLocator.Match:
+        """ Nearest vertex or edge of the reference layer """
+        locator = LOCATORS.get(self.reference_layer, self.canvas)
+        tolerance = QgsTolerance.vertexSearchRadius(self.canvas.mapSettings())
+
+        # relaxed: no match while the index is built in background
+        vertex = locator.nearestVertex(coord, tolerance, self._reference_filter, True)
+        edge = locator.nearestEdge(coord, tolerance, self._reference_filter, True)
+        if vertex.isValid() and (not edge.isValid() or vertex.distance() <= edge.distance()):
+            return vertex
+
+        return edge
+
     def canvasReleaseEvent(self, event):
         """user releases mouse button after clicking"""
 
@@ -182,7 +224,16 @@ class MapToolQgisSnap(QgsMapTool):
             self.unload_tool()
             return
 
-        point = self._get_point(event.pos())
+        self._move_pos = event.pos()
+        if not self._move_timer.isActive():
+            self._move_timer.start()
+
+    def _process_move(self):
+        if self._disabled or self._move_pos is None:
+            return
+
+        point = self._get_point(self._move_pos)
+        self._move_pos = None
         if point:
             self.moved.emit(point)
 
@@ -199,6 +250,7 @@ class MapToolQgisSnap(QgsMapTool):
         return self._disabled
 
     def unload_tool(self):
+        self._move_timer.stop()
         self._hide_indicator()
         self.canvas.unsetMapTool(self)
         if not self._disabled:
@@ -225,6 +277,87 @@ class LayerMatchFilter(QgsPointLocator.MatchFilter):
         return True
 
 
+class FidMatchFilter(QgsPointLocator.MatchFilter):
+    """ Accepts only matches of given feature ids """
+
+    def __init__(self, fids: Iterable[int]):
+        self._fids = set(fids)
+        super().__init__()
+
+    def acceptMatch(self, match: QgsPointLocator.Match) -> bool:
+        return match.featureId() in self._fids
+
+
+class LocatorCache:
+    """ Point locators per layer and destination crs, reused by all map tools.
+        A locator updates its index itself on feature and geometry edits of its layer.
+        Locators of a layer are removed, when the layer will be deleted. Call `clear` on unload,
+        it disconnects from all layers.
+
+        .. code-block:: python
+
+            # build index in background, e.g. when a layer is chosen
+            LOCATORS.prebuild(layer, iface.mapCanvas())
+            MapToolQgisSnap(iface, layer, reference_layer=layer)
+    """
+
+    def __init__(self):
+        self._locators: Dict[Tuple[str, str], QgsPointLocator] = {}
+        # layer id -> layer and connected `willBeDeleted` slot
+        self._connections: Dict[str, Tuple[QgsVectorLayer, partial]] = {}
+
+    def get(self, layer: QgsVectorLayer, canvas: QgsMapCanvas) -> QgsPointLocator:
+        settings = canvas.mapSettings()
+        crs = settings.destinationCrs()
+        key = (layer.id(), crs.authid() or crs.toWkt())
+
+        locator = self._locators.get(key)
+        if locator is None:
+            if layer.id() not in self._connections:
+                slot = partial(self.remove_layer, layer.id())
+                layer.willBeDeleted.connect(slot)
+                self._connections[layer.id()] = (layer, slot)
+
+            locator = QgsPointLocator(layer, crs, settings.transformContext())
+            self._locators[key] = locator
+
+        return locator
+
+    def prebuild(self, layer: QgsVectorLayer, canvas: QgsMapCanvas):
+        """ Builds the index in background, if not done yet """
+        locator = self.get(layer, canvas)
+        if not locator.hasIndex():
+            locator.init(-1, True)
+
+    def remove_layer(self, layer_id: str):
+        for key in [k for k in self._locators if k[0] == layer_id]:
+            del self._locators[key]
+
+        self._disconnect(layer_id)
+
+    def _disconnect(self, layer_id: str):
+        layer, slot = self._connections.pop(layer_id, (None, None))
+        if layer is None:
+            return
+
+        try:
+            layer.willBeDeleted.disconnect(slot)
+        except (RuntimeError, TypeError):
+            # layer already deleted or not connected anymore
+            pass
+
+    def clear(self):
+        for layer_id in list(self._connections):
+            self._disconnect(layer_id)
+        self._locators.clear()
+
+    def __len__(self) -> int:
+        return len(self._locators)
+
+
+LOCATORS = LocatorCache()
+
+
 if __name__ in ("__main__", "__console__"):
     import processing
     from qgis.utils import iface
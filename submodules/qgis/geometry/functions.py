@@ -15,12 +15,14 @@
  ***************************************************************************/
 """
 
-from qgis.core import (QgsCoordinateReferenceSystem, QgsDistanceArea,
-                       QgsProject)
+from qgis.core import QgsCoordinateReferenceSystem, QgsDistanceArea
+
+from .transform import TRANSFORM_CACHE
 
 
 def get_distance_area(crs: QgsCoordinateReferenceSystem, ellipsoid: str = "WGS84") -> QgsDistanceArea:
     """ Gets distance are object for calculating length in meters.
+        Objects are reused from `transform.TRANSFORM_CACHE`.
 
         .. code-block:: python
 
@@ -33,9 +35,4 @@ def get_distance_area(crs: QgsCoordinateReferenceSystem, ellipsoid: str = "WGS84
         :rtype: QgsDistanceArea
     """
 
-    dist_area = QgsDistanceArea()
-    crs = QgsCoordinateReferenceSystem(crs)
-    dist_area.setSourceCrs(crs, QgsProject.instance().transformContext())
-    dist_area.setEllipsoid(ellipsoid if ellipsoid else crs.ellipsoidAcronym())
-
-    return dist_area
+    return TRANSFORM_CACHE.get_distance_area(crs, ellipsoid)
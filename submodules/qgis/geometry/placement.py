@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import numpy as np
+
+from qgis.core import QgsPointXY, QgsDistanceArea
+
+from typing import List, Tuple, Optional, Callable
+
+from .. import constants
+
+
+# measure(a, b) -> distances in meters between point arrays a and b with shape (n, 2)
+Measure = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def pack_lines(lines: List[List[QgsPointXY]]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Packs poly lines into one vertex array.
+
+        :param lines: poly lines
+        :return: vertex array with shape (n, 2) and start index of each line plus end index (len(lines) + 1)
+    """
+    counts = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    coords = np.fromiter((c for line in lines for p in line for c in (p.x(), p.y())),
+                         dtype=np.float64, count=int(offsets[-1]) * 2)
+
+    return coords.reshape(-1, 2), offsets
+
+
+def distance_area_measure(area: QgsDistanceArea) -> Measure:
+    """ Measure function using `QgsDistanceArea.measureLine` for each point pair.
+        Needed when measuring on an ellipsoid, otherwise planar distances are used.
+    """
+    if not area.willUseEllipsoid():
+        return planar_measure()
+
+    def measure(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.fromiter((area.measureLine(QgsPointXY(*p1), QgsPointXY(*p2)) for p1, p2 in zip(a, b)),
+                           dtype=np.float64, count=len(a))
+
+    return measure
+
+
+def planar_measure(factor: float = 1.0) -> Measure:
+    """ Measure function for planar distances.
+
+        :param factor: map units to meters factor
+    """
+    def measure(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.hypot(*(b - a).T) * factor
+
+    return measure
+
+
+def place_on_lines(coords: np.ndarray, offsets: np.ndarray, offset: Optional[float] = None,
+                   measure: Optional[Measure] = None,
+                   epsilon: float = constants.EPSILON) -> Tuple[np.ndarray, np.ndarray]:
+    """ Computes label positions for many lines at once.
+        Same rules as for a single line in `utilities.functions.get_position`:
+
+            - the anchor is the point at half length of the line
+            - with an offset the anchor is moved `offset` meters towards the line through start and end vertex
+            - lines with equal start and end vertex or with the anchor on start or end vertex are invalid
+
+        .. code-block:: python
+
+            coords, offsets = pack_lines([get_polyline(g) for g in geometries])
+            points, valid = place_on_lines(coords, offsets, 10, distance_area_measure(area))
+
+        :param coords: vertex array with shape (n, 2), see `pack_lines`
+        :param offsets: start index of each line plus end index
+        :param offset: offset in meters
+        :param measure: function to measure distances in meters, defaults to planar distances
+        :param epsilon: tolerance for comparing points
+        :return: positions with shape (len(offsets) - 1, 2) and valid mask
+    """
+    if measure is None:
+        measure = planar_measure()
+
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    line_count = len(starts)
+
+    points = np.full((line_count, 2), np.nan)
+    valid = ends > starts
+    if not line_count or not valid.any():
+        return points, np.zeros(line_count, dtype=bool)
+
+    # segment lengths, segments between two lines do not count
+    seg_lengths = np.hypot(*np.diff(coords, axis=0).T)
+    seg_lengths[ends[ends < len(seg_lengths)]] = 0
+    cumulative = np.concatenate(([0.0], np.cumsum(seg_lengths)))
+
+    s = starts[valid]
+    e = ends[valid]
+    total = cumulative[e] - cumulative[s]
+    target = cumulative[s] + total / 2
+
+    # first vertex with cumulative length >= target, anchor is on segment (j - 1, j)
+    j = np.clip(np.searchsorted(cumulative, target, side="left"), s + 1, e)
+    seg = seg_lengths[j - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(seg > 0, (target - cumulative[j - 1]) / seg, 0.0)
+    center = coords[j - 1] + factor[:, None] * (coords[j] - coords[j - 1])
+    # zero length lines use the first vertex like `PolylineArray.point_at_distance`
+    center = np.where((total == 0)[:, None], coords[s], center)
+
+    if offset is None or offset == 0:
+        points[valid] = center
+        return points, valid
+
+    start = coords[s]
+    end = coords[e]
+
+    def near(a, b):
+        return np.all(np.abs(a - b) <= epsilon, axis=1)
+
+    ok = ~(near(start, end) | near(center, start) | near(center, end))
+
+    # foot of the altitude from center to the line through start and end
+    chord = end - start
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ij,ij->i", center - start, chord) / np.einsum("ij,ij->i", chord, chord)
+    foot = start + t[:, None] * chord
+    direction = foot - center
+
+    # collinear lines keep the center like `get_position`
+    collinear = near(center, foot)
+    meters = np.zeros(len(center))
+    measurable = ok & ~collinear
+    if measurable.any():
+        meters[measurable] = measure(center[measurable], foot[measurable])
+
+    moved = measurable & (meters > 0)
+    result = center.copy()
+    result[moved] = center[moved] + direction[moved] * (offset / meters[moved])[:, None]
+
+    line_valid = np.zeros(line_count, dtype=bool)
+    line_valid[np.flatnonzero(valid)[ok]] = True
+    points[line_valid] = result[ok]
+
+    return points, line_valid
@@ -15,25 +15,126 @@
  ***************************************************************************/
 """
 
+import threading
+
 from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransform,
+                       QgsCoordinateTransformContext, QgsDistanceArea,
                        QgsGeometry, QgsProject)
 
+from typing import Dict, List, Optional, Tuple
+
+
+class TransformCache:
+    """ Cache for transform and distance area objects.
+        Transforms are keyed by source crs, destination crs and transform context,
+        distance area objects by crs, ellipsoid and transform context.
+        Without a given transform context the project's context is used.
+        The cache is cleared, when the project's transform context changes.
+        Call `unload` to disconnect from the project, e.g. when the plugin is unloaded.
+
+        Returned objects are copies and can be used in the calling thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transforms: Dict[Tuple[str, str], List[Tuple[QgsCoordinateTransformContext, QgsCoordinateTransform]]] = {}
+        self._areas: Dict[Tuple[str, str], List[Tuple[QgsCoordinateTransformContext, QgsDistanceArea]]] = {}
+        self._watching = False
+
+    @staticmethod
+    def crs_key(crs: QgsCoordinateReferenceSystem) -> str:
+        return crs.authid() or crs.toWkt()
+
+    def _context(self, context: Optional[QgsCoordinateTransformContext]) -> QgsCoordinateTransformContext:
+        if context is not None:
+            return context
+
+        project = QgsProject.instance()
+        with self._lock:
+            if not self._watching:
+                project.transformContextChanged.connect(self.clear)
+                project.cleared.connect(self.clear)
+                self._watching = True
+
+        return project.transformContext()
+
+    @staticmethod
+    def _find(entries: list, context: QgsCoordinateTransformContext):
+        for entry_context, value in entries:
+            if entry_context == context:
+                return value
+        return None
+
+    def get_transform(self, src_coordinate_system: QgsCoordinateReferenceSystem,
+                      dst_coordinate_system: QgsCoordinateReferenceSystem,
+                      context: Optional[QgsCoordinateTransformContext] = None) -> QgsCoordinateTransform:
+        context = self._context(context)
+        key = (self.crs_key(src_coordinate_system), self.crs_key(dst_coordinate_system))
+
+        with self._lock:
+            entries = self._transforms.setdefault(key, [])
+            transform = self._find(entries, context)
+            if transform is None:
+                transform = QgsCoordinateTransform(src_coordinate_system, dst_coordinate_system, context)
+                entries.append((QgsCoordinateTransformContext(context), transform))
+
+            return QgsCoordinateTransform(transform)
+
+    def get_distance_area(self, crs: QgsCoordinateReferenceSystem, ellipsoid: str = "WGS84",
+                          context: Optional[QgsCoordinateTransformContext] = None) -> QgsDistanceArea:
+        context = self._context(context)
+        key = (self.crs_key(crs), ellipsoid)
+
+        with self._lock:
+            entries = self._areas.setdefault(key, [])
+            area = self._find(entries, context)
+            if area is None:
+                area = QgsDistanceArea()
+                crs = QgsCoordinateReferenceSystem(crs)
+                area.setSourceCrs(crs, context)
+                area.setEllipsoid(ellipsoid if ellipsoid else crs.ellipsoidAcronym())
+                entries.append((QgsCoordinateTransformContext(context), area))
+
+            return QgsDistanceArea(area)
+
+    def clear(self):
+        with self._lock:
+            self._transforms.clear()
+            self._areas.clear()
+
+    def unload(self):
+        """ Disconnects from the project and clears the cache, connects again on next use """
+        with self._lock:
+            if self._watching:
+                project = QgsProject.instance()
+                try:
+                    project.transformContextChanged.disconnect(self.clear)
+                    project.cleared.disconnect(self.clear)
+                except TypeError:
+                    # not connected anymore
+                    pass
+                self._watching = False
+
+        self.clear()
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self._transforms.values()) + sum(len(x) for x in self._areas.values())
+
+
+TRANSFORM_CACHE = TransformCache()
+
 
 def get_transform(src_coordinate_system: QgsCoordinateReferenceSystem,
                   dst_coordinate_system: QgsCoordinateReferenceSystem) -> QgsCoordinateTransform:
     """ get transform object.
         Transforming geometry is needed, when you want to use a geometry in a different coordinate reference system.
+        Transforms are reused from `TRANSFORM_CACHE`.
 
         :param src_coordinate_system: source coordinate system
         :param dst_coordinate_system: destination coordinate system
         :return: transform object
     """
-    transform_params = QgsCoordinateTransform(
-        src_coordinate_system,
-        dst_coordinate_system,
-        QgsProject.instance())
-
-    return transform_params
+    return TRANSFORM_CACHE.get_transform(src_coordinate_system, dst_coordinate_system)
 
 
 def transform_geometry(geometry: QgsGeometry, src_coordinate_system: QgsCoordinateReferenceSystem,
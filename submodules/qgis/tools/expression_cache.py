@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+
+from collections import OrderedDict
+
+from qgis.core import (QgsExpression, QgsExpressionContext, QgsExpressionContextUtils,
+                       QgsFeature, QgsFields)
+
+from typing import Any, Dict, Tuple, Optional
+
+
+class ExpressionCache:
+    """ LRU cache of prepared expressions.
+        Each entry is keyed by expression string and fields and keeps one prepared
+        `QgsExpression` and one `QgsExpressionContext`, which is reused for each feature.
+
+        A cache is not thread safe, use one per thread (see `get_thread_cache`).
+        Errors are kept for the last `max_errors` faulty expressions, long living caches
+        should take them with `pop_errors` after each run.
+
+        .. code-block:: python
+
+            cache = ExpressionCache()
+            for feature in layer.getFeatures():
+                print(cache.evaluate(feature, '"name" || \' \' || "type"'))
+
+            for expression, (message, count) in cache.errors.items():
+                print(expression, message, count)
+
+        :param max_size: maximum number of cached expressions, defaults to 64
+        :param max_errors: maximum number of expressions with errors, defaults to 64
+    """
+
+    def __init__(self, max_size: int = 64, max_errors: int = 64):
+        if max_size < 1:
+            raise ValueError(f"max size must be greater than 0, got {max_size}")
+        if max_errors < 1:
+            raise ValueError(f"max errors must be greater than 0, got {max_errors}")
+
+        self.max_size = max_size
+        self.max_errors = max_errors
+        self._entries: 'OrderedDict[Tuple, Tuple[QgsExpression, QgsExpressionContext]]' = OrderedDict()
+        # expression -> (last error message, error count), the most recent faulty expression last
+        self.errors: 'OrderedDict[str, Tuple[str, int]]' = OrderedDict()
+        # error message of the last `evaluate` call, empty on success
+        self.last_error = ""
+
+    @staticmethod
+    def _key(expression: str, fields: QgsFields) -> Tuple:
+        return expression, tuple((field.name(), field.type()) for field in fields)
+
+    def get(self, expression: str, fields: QgsFields) -> Tuple[QgsExpression, QgsExpressionContext]:
+        """ Returns the prepared expression and its context for given fields.
+
+            :param expression: expression string
+            :param fields: fields of the features to evaluate
+        """
+        key = self._key(expression, fields)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        expr = QgsExpression(expression)
+        context = QgsExpressionContextUtils.createFeatureBasedContext(QgsFeature(fields), fields)
+        if not expr.hasParserError():
+            expr.prepare(context)
+
+        entry = (expr, context)
+        self._entries[key] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def evaluate(self, feature: QgsFeature, expression: str) -> Any:
+        """ Evaluates expression on feature.
+            On parser or evaluation errors None is returned and the error is stored in `errors`.
+
+            :param feature: feature
+            :param expression: expression string
+        """
+        self.last_error = ""
+        expr, context = self.get(expression, feature.fields())
+        if expr.hasParserError():
+            self.last_error = expr.parserErrorString()
+            self.add_error(expression, self.last_error)
+            return None
+
+        context.setFeature(feature)
+        result = expr.evaluate(context)
+        if expr.hasEvalError():
+            self.last_error = expr.evalErrorString()
+            self.add_error(expression, self.last_error)
+            return None
+
+        return result
+
+    def add_error(self, expression: str, message: str):
+        _, count = self.errors.pop(expression, ("", 0))
+        self.errors[expression] = (message, count + 1)
+        if len(self.errors) > self.max_errors:
+            self.errors.popitem(last=False)
+
+    def pop_errors(self) -> Dict[str, Tuple[str, int]]:
+        """ Returns and removes all errors, e.g. at the end of a run with the cache of a thread """
+        errors = dict(self.errors)
+        self.errors.clear()
+        return errors
+
+    def clear(self):
+        self._entries.clear()
+        self.errors.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_local = threading.local()
+
+
+def get_thread_cache() -> ExpressionCache:
+    """ Returns the expression cache of the current thread.
+        It lives as long as the thread, take its errors with `ExpressionCache.pop_errors`.
+    """
+    cache: Optional[ExpressionCache] = getattr(_local, "cache", None)
+    if cache is None:
+        cache = ExpressionCache()
+        _local.cache = cache
+
+    return cache
@@ -14,15 +14,105 @@
  ***************************************************************************/
 """
 
+import math
+
+from array import array
+from bisect import bisect_left
+
 from qgis.core import (QgsPointXY)
-from ..geometry.line import is_point_on_segment
-from typing import List
+from ..constants import EPSILON
+from typing import List, Sequence
+
+
+class PolylineArray:
+    """ Immutable poly line with coordinates in contiguous float arrays
+        and a precomputed cumulative length per vertex.
+
+        `length` is O(1), `point_at_distance` uses a binary search.
+        `distance_of_point` checks the segments in order without creating point objects.
+
+        :param points: poly line with at least one point
+    """
+
+    def __init__(self, points: Sequence[QgsPointXY]):
+        if not points:
+            raise ValueError("poly line needs at least one point")
+
+        self._x = array('d', (p.x() for p in points))
+        self._y = array('d', (p.y() for p in points))
+
+        cumulative = array('d', [0.0])
+        total = 0.0
+        for i in range(1, len(self._x)):
+            total += math.hypot(self._x[i] - self._x[i - 1], self._y[i] - self._y[i - 1])
+            cumulative.append(total)
+        self._cumulative = cumulative
+
+    def __len__(self) -> int:
+        return len(self._x)
+
+    def length(self) -> float:
+        """ Returns geometry length. """
+        return self._cumulative[-1]
+
+    def vertex(self, index: int) -> QgsPointXY:
+        return QgsPointXY(self._x[index], self._y[index])
+
+    def segment_index_at_distance(self, distance: float) -> int:
+        """ Returns index `i` of segment (i - 1, i), which contains the point at given distance.
+            Returns 0 for distance 0.
+
+            :raises ValueError: distance is negative or higher than `length`
+        """
+        if distance < 0 or distance > self._cumulative[-1]:
+            raise ValueError(f"distance {distance} not in line length {self._cumulative[-1]}")
+
+        return bisect_left(self._cumulative, distance)
+
+    def point_at_distance(self, distance: float) -> QgsPointXY:
+        """ Returns the point at given distance from start along the line.
+
+            :raises ValueError: distance is negative or higher than `length`
+        """
+        i = self.segment_index_at_distance(distance)
+        if i == 0:
+            return self.vertex(0)
+
+        seg_length = self._cumulative[i] - self._cumulative[i - 1]
+        factor = (distance - self._cumulative[i - 1]) / seg_length if seg_length else 0.0
+
+        return QgsPointXY(self._x[i - 1] + factor * (self._x[i] - self._x[i - 1]),
+                          self._y[i - 1] + factor * (self._y[i] - self._y[i - 1]))
+
+    def distance_of_point(self, point: QgsPointXY, epsilon: float = EPSILON) -> float:
+        """ Returns the distance of a point on the line from start along the line.
+            The first segment containing the point is used.
+
+            :raises ValueError: point is not on line
+        """
+        px = point.x()
+        py = point.y()
+        x = self._x
+        y = self._y
+        for i in range(1, len(x)):
+            seg_length = self._cumulative[i] - self._cumulative[i - 1]
+            to_start = math.hypot(px - x[i - 1], py - y[i - 1])
+            to_end = math.hypot(px - x[i], py - y[i])
+            if abs(to_start + to_end - seg_length) < epsilon:
+                return self._cumulative[i - 1] + to_start
+
+        raise ValueError(f"point {point.toString()} not on poly line")
+
+    def as_point_list(self) -> List[QgsPointXY]:
+        return [QgsPointXY(x, y) for x, y in zip(self._x, self._y)]
 
 
 class PolylineWrapper:
     """ Eine (Poly-)Linie, die intern aus Segmenten besteht,
         die jeweils nur zwei Punkte enthalten (also Geradenstücke sind).
 
+        Compatibility layer for `PolylineArray`, which should be preferred.
+
         :param segment_list: list of poly segments
     """
 
@@ -35,6 +125,14 @@ class PolylineWrapper:
             if segment_list[i][1] != segment_list[i + 1][0]:
                 raise AttributeError("Nicht zusammenhängende Linie: " + str(segment_list))
         self.segment_list = segment_list
+        self._array = None
+
+    @property
+    def array(self) -> PolylineArray:
+        """ array representation, rebuilt after `insert_point_in_line` """
+        if self._array is None:
+            self._array = PolylineArray(self.as_point_list())
+        return self._array
 
     def get_distance_on_line(self, point: QgsPointXY) -> float:
         """ Gibt die Entfernung eines Punktes auf der Linie vom Linienanfang entlang der Linie zurück,
@@ -46,15 +144,10 @@ class PolylineWrapper:
             :rtype: float
 
         """
-        distance: float = 0
-        for segment in self.segment_list:
-            if not is_point_on_segment(point, segment):
-                distance += segment[1].distance(segment[0])
-            else:
-                distance += point.distance(segment[0])
-                return distance
-
-        raise AttributeError("Punkt " + str(point) + " liegt nicht auf Polylinie " + str(self.segment_list))
+        try:
+            return self.array.distance_of_point(point)
+        except ValueError:
+            raise AttributeError("Punkt " + str(point) + " liegt nicht auf Polylinie " + str(self.segment_list))
 
     def length(self) -> float:
         """ Returns geometry length.
@@ -62,7 +155,7 @@ class PolylineWrapper:
             :return: length of geometry
             :rtype: float
         """
-        return self.get_distance_on_line(self.segment_list[-1][-1])
+        return self.array.length()
 
     def insert_point_in_line(self, distance: float) -> QgsPointXY:
         """ Insert new point at given distance.
@@ -81,21 +174,18 @@ class PolylineWrapper:
         if distance == self.length():
             return self.segment_list[-1][-1]
 
-        for i in range(0, len(self.segment_list)):
-            segment = self.segment_list[i]
-            seg_length = segment[1].distance(segment[0])
-            if distance > seg_length:
-                distance -= seg_length
-                continue
-            else:
-                factor: float = distance / seg_length
-                new_pt: QgsPointXY = QgsPointXY(segment[0].x() + factor * (segment[1].x() - segment[0].x()),
-                                                segment[0].y() + factor * (segment[1].y() - segment[0].y()))
-                new_segment: List[QgsPointXY] = [new_pt, segment[1]]
-                segment[1] = new_pt
-                self.segment_list.insert(i + 1, new_segment)
-                return new_pt
-        raise AttributeError("übergebene Entfernung länger als Linie!")
+        try:
+            i = self.array.segment_index_at_distance(distance) - 1
+            new_pt = self.array.point_at_distance(distance)
+        except ValueError:
+            raise AttributeError("übergebene Entfernung länger als Linie!")
+
+        segment = self.segment_list[i]
+        new_segment: List[QgsPointXY] = [new_pt, segment[1]]
+        segment[1] = new_pt
+        self.segment_list.insert(i + 1, new_segment)
+        self._array = None
+        return new_pt
 
     def as_point_list(self) -> List[QgsPointXY]:
         """ Returns line segments as new poly line.
@@ -9,7 +9,7 @@
       <symbol clip_to_extent="1" alpha="1" type="marker" name="0" force_rhr="0">
         <layer enabled="1" locked="0" class="GeometryGenerator" pass="0">
           <prop k="SymbolType" v="Line"/>
-          <prop k="geometryModifier" v="collect_geometries(array_foreach(&#xd;&#xa;&#x9;from_json(&quot;Points&quot;),&#xd;&#xa;&#x9;make_line( &#xd;&#xa;        make_point($x, $y),&#xd;&#xa;&#x9;&#x9;make_point(array_get(@element, 0), array_get(@element, 1))&#xd;&#xa;&#x9;)&#xd;&#xa;))"/>
+          <prop k="geometryModifier" v="with_variable('leaders', geom_from_wkb(&quot;Leaders&quot;),&#xd;&#xa;&#x9;collect_geometries(array_foreach(&#xd;&#xa;&#x9;&#x9;generate_series(1, num_geometries(@leaders)),&#xd;&#xa;&#x9;&#x9;make_line(make_point($x, $y), geometry_n(@leaders, @element))&#xd;&#xa;&#x9;))&#xd;&#xa;)"/>
           <data_defined_properties>
             <Option type="Map">
               <Option value="" type="QString" name="name"/>
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os
+import sys
+import types
+
+import pytest
+
+
+REPO_LOCATION = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The plugin folder is imported as `easy_labeling` without running its `__init__`,
+# which needs a running QGIS with gui. Tests needing QGIS use the `qgis_app` fixture.
+if "easy_labeling" not in sys.modules:
+    _package = types.ModuleType("easy_labeling")
+    _package.__path__ = [REPO_LOCATION]
+    sys.modules["easy_labeling"] = _package
+
+if REPO_LOCATION not in sys.path:
+    sys.path.insert(0, REPO_LOCATION)
+
+
+@pytest.fixture(scope="session")
+def qgis_app():
+    """ QGIS without gui for the whole test session, tests are skipped without QGIS """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    core = pytest.importorskip("qgis.core")
+
+    app = core.QgsApplication([], False)
+    app.initQgis()
+    yield app
+    app.exitQgis()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import (QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsProcessingContext, QgsProcessingFeedback,
+                       QgsProject, QgsVectorLayer)
+from qgis.PyQt.QtCore import QVariant
+
+from easy_labeling.algorithms.labeling import (CreateLabelingLayerAlgorithm, GenerateLabelsAlgorithm,
+                                               RefreshLabelsAlgorithm)
+from easy_labeling.utilities.functions import is_labeling_layer
+from easy_labeling.utilities.gpkg import gpkg_uri
+from easy_labeling.utilities.reference_index import ReferenceIndex
+
+
+@pytest.fixture
+def project(qgis_app):
+    """ project with "Roads" and two named lines """
+    project = QgsProject()
+    roads = QgsVectorLayer("LineString?crs=EPSG:25832", "Roads", "memory")
+    roads.dataProvider().addAttributes([QgsField("name", QVariant.String)])
+    roads.updateFields()
+    features = []
+    for i, name in enumerate(["A", "B"]):
+        feature = QgsFeature(roads.fields())
+        feature["name"] = name
+        feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(i * 100, 0), QgsPointXY(i * 100, 100)]))
+        features.append(feature)
+    ok, _ = roads.dataProvider().addFeatures(features)
+    assert ok
+    project.addMapLayer(roads)
+    yield project
+    project.clear()
+
+
+def _run(algorithm, parameters, project):
+    context = QgsProcessingContext()
+    context.setProject(project)
+    algorithm.initAlgorithm()
+    results, ok = algorithm.run(parameters, context, QgsProcessingFeedback())
+    assert ok
+    return results, context
+
+
+def _roads(project):
+    return project.mapLayersByName("Roads")[0]
+
+
+def test_create_labeling_layer(project, tmp_path):
+    path = str(tmp_path / "labels.gpkg")
+    results, _ = _run(CreateLabelingLayerAlgorithm(), {"CRS": "EPSG:25832", "OUTPUT": path}, project)
+
+    layer = QgsVectorLayer(gpkg_uri(path, "labels.gpkg"), "labels", "ogr")
+    assert results["OUTPUT"] == path
+    assert is_labeling_layer(layer)
+    assert ReferenceIndex(path).exists()
+
+
+def test_generate_labels_references_project_layer_name(project, tmp_path):
+    path = str(tmp_path / "generated.gpkg")
+    results, context = _run(GenerateLabelsAlgorithm(),
+                            {"INPUT": _roads(project).id(), "EXPRESSION": '"name"', "OUTPUT": path}, project)
+
+    assert results["CREATED"] == 2
+    layer = QgsVectorLayer(results["OUTPUT"], "generated", "ogr")
+    assert sorted(f["Reference"].split(".")[0] for f in layer.getFeatures()) == ["Roads", "Roads"]
+    assert sorted(f["Text"] for f in layer.getFeatures()) == ["A", "B"]
+
+    # new outputs get the reference index of `create_new_layer`
+    reference_index = ReferenceIndex.for_layer(layer)
+    assert len(reference_index) == 2
+    reference_index.close()
+
+
+def test_reference_name_parameter(project):
+    results, context = _run(GenerateLabelsAlgorithm(),
+                            {"INPUT": _roads(project).id(), "EXPRESSION": '"name"', "REFERENCE_NAME": "Streets",
+                             "OUTPUT": "memory:"}, project)
+
+    layer = context.getMapLayer(results["OUTPUT"])
+    assert {f["Reference"].split(".")[0] for f in layer.getFeatures()} == {"Streets"}
+
+
+def test_refresh_labels(project, tmp_path):
+    path = str(tmp_path / "generated.gpkg")
+    results, _ = _run(GenerateLabelsAlgorithm(),
+                      {"INPUT": _roads(project).id(), "EXPRESSION": '"name"', "OUTPUT": path}, project)
+    labels = QgsVectorLayer(results["OUTPUT"], "generated", "ogr")
+    roads = _roads(project)
+    fid = next(f.id() for f in roads.getFeatures() if f["name"] == "A")
+    roads.dataProvider().changeAttributeValues({fid: {roads.fields().lookupField("name"): "C"}})
+
+    results, _ = _run(RefreshLabelsAlgorithm(), {"INPUT": labels, "DRY_RUN": True}, project)
+    assert results["STALE"] == 1
+    assert sorted(f["Text"] for f in labels.getFeatures()) == ["A", "B"]
+
+    results, _ = _run(RefreshLabelsAlgorithm(), {"INPUT": labels}, project)
+    assert results["UPDATED"] == 1
+    assert sorted(f["Text"] for f in labels.getFeatures()) == ["B", "C"]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.PyQt.QtCore import QPointF
+
+from easy_labeling.submodules.qgis.canvas.canvas_overlay import _as_coords, _polygon
+
+
+@pytest.mark.parametrize("coords", [[(0, 0), (1.5, 2), (-3, 4.25)], np.arange(20.0).reshape(-1, 2), []])
+def test_polygon_from_coords(qgis_app, coords):
+    polygon = _polygon(_as_coords(coords))
+
+    assert [(p.x(), p.y()) for p in polygon] == [(float(x), float(y)) for x, y in coords]
+
+
+def test_polygon_from_line_slice(qgis_app):
+    coords = _as_coords([(0, 0), (1, 1), (2, 2), (3, 3)])
+
+    assert list(_polygon(coords[1:3])) == [QPointF(1, 1), QPointF(2, 2)]
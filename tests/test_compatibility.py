@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsField, QgsVectorLayer
+from qgis.PyQt.QtCore import QVariant
+
+from easy_labeling.utilities.compatibility import LayerCompatibility
+from easy_labeling.utilities.functions import labeling_fields
+
+
+def labeling_layer() -> QgsVectorLayer:
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    layer.dataProvider().addAttributes(labeling_fields().toList())
+    layer.updateFields()
+    return layer
+
+
+@pytest.fixture
+def layers(qgis_app):
+    return labeling_layer(), QgsVectorLayer("LineString?crs=EPSG:25832&field=name:string", "Lines", "memory")
+
+
+def test_added_layers_are_checked_once(layers):
+    checked = []
+
+    def check(layer):
+        checked.append(layer.id())
+        return layer.name() == "Labels"
+
+    compatibility = LayerCompatibility(check)
+    labels, lines = layers
+
+    assert compatibility.add([labels, lines])
+    assert (compatibility.is_compatible(labels.id()), compatibility.is_compatible(lines.id())) == (True, False)
+    assert compatibility.excepted_ids() == ((lines.id(),), (labels.id(),))
+
+    # unchanged layers do not change the excepted ids
+    assert not compatibility.add([labels])
+    assert compatibility.excepted_ids() is None
+    assert checked == [labels.id(), lines.id(), labels.id()]
+
+
+def test_non_vector_layers_are_ignored(qgis_app):
+    compatibility = LayerCompatibility()
+
+    assert not compatibility.add([None, "layer"])
+    assert compatibility.excepted_ids() is None
+
+
+def test_field_changes_update_compatibility(layers):
+    compatibility = LayerCompatibility()
+    labels, lines = layers
+    compatibility.add(layers)
+    compatibility.excepted_ids()
+
+    labels.dataProvider().deleteAttributes([labels.fields().lookupField("Text")])
+    labels.updateFields()
+    assert compatibility.update(labels)
+    assert compatibility.excepted_ids() == ((labels.id(), lines.id()), ())
+
+    lines.dataProvider().addAttributes([QgsField("other", QVariant.Int)])
+    lines.updateFields()
+    assert not compatibility.update(lines)
+
+
+def test_removed_layers_are_forgotten(layers):
+    compatibility = LayerCompatibility()
+    labels, lines = layers
+    compatibility.add(layers)
+    compatibility.excepted_ids()
+
+    assert compatibility.remove([labels.id(), "unknown"])
+    assert labels.id() not in compatibility
+    assert compatibility.excepted_ids() == ((lines.id(),), ())
+    assert not compatibility.remove([labels.id()])
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.PyQt.QtWidgets import QGraphicsRectItem, QGraphicsScene
+
+from easy_labeling.submodules.qgis.canvas.drawing_registry import (DrawingRegistry, ListDrawingRegistry, SCOPE_MAP_TOOL,
+                                                                 SCOPE_MODULE)
+
+
+@pytest.fixture
+def scene(qgis_app):
+    return QGraphicsScene()
+
+
+def _item(scene):
+    item = QGraphicsRectItem(0, 0, 1, 1)
+    scene.addItem(item)
+    return item
+
+
+def test_oldest_items_are_evicted(scene):
+    registry = DrawingRegistry(max_size=2)
+    items = [_item(scene) for _ in range(3)]
+    for item in items:
+        registry.add(item)
+
+    assert list(registry) == items[1:]
+    assert registry.evicted == 1
+    assert items[0].scene() is None
+
+
+def test_remove_scope_keeps_other_scopes(scene):
+    registry = DrawingRegistry()
+    tool_item = _item(scene)
+    module_item = _item(scene)
+    registry.add(tool_item, scope=SCOPE_MAP_TOOL)
+    registry.add(module_item, scope=SCOPE_MODULE)
+
+    assert registry.remove_scope(SCOPE_MAP_TOOL) == 1
+    assert list(registry) == [module_item]
+    assert tool_item.scene() is None
+    assert module_item.scene() is scene
+
+
+def test_remove_owner_and_handles(scene):
+    registry = DrawingRegistry()
+    owner = object()
+    owned = _item(scene)
+    other = _item(scene)
+    handle = registry.add(owned, owner=owner)
+    registry.add(other)
+
+    assert registry.add(owned, owner=owner) == handle
+    assert registry.remove_owner(owner) == 1
+    assert owned not in registry
+    assert registry.remove(other)
+    assert not registry.remove(other)
+    assert registry.stats()["total"] == 0
+
+
+def test_module_scope_is_not_evicted(scene):
+    registry = DrawingRegistry(max_size=2)
+    overlay = _item(scene)
+    registry.add(overlay, scope=SCOPE_MODULE)
+    items = [_item(scene) for _ in range(3)]
+    for item in items:
+        registry.add(item)
+
+    assert list(registry) == [overlay, items[2]]
+    assert registry.evicted == 2
+    assert overlay.scene() is scene
+
+
+def test_remove_owner_in_scope(scene):
+    registry = DrawingRegistry()
+    owner = object()
+    tool_item = _item(scene)
+    overlay = _item(scene)
+    registry.add(tool_item, owner=owner, scope=SCOPE_MAP_TOOL)
+    registry.add(overlay, owner=owner, scope=SCOPE_MODULE)
+
+    assert registry.remove_owner(owner, SCOPE_MAP_TOOL) == 1
+    assert list(registry) == [overlay]
+
+
+def test_list_registry_keeps_list_up_to_date(scene):
+    existing = _item(scene)
+    drawings = [existing]
+    registry = ListDrawingRegistry(drawings)
+    added = _item(scene)
+    registry.add(added)
+
+    assert drawings == [existing, added]
+    registry.remove(existing)
+    assert drawings == [added]
+    registry.clear()
+    assert drawings == []
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsFields
+
+from easy_labeling.submodules.qgis.tools.expression_cache import ExpressionCache
+
+
+def test_errors_are_bounded(qgis_app):
+    cache = ExpressionCache(max_errors=2)
+    feature = QgsFeature(QgsFields())
+    for expression in ["to_int('a')", "to_int('b')", "to_int('c')", "to_int('b')"]:
+        assert cache.evaluate(feature, expression) is None
+        assert cache.last_error
+
+    assert list(cache.errors) == ["to_int('c')", "to_int('b')"]
+    assert cache.errors["to_int('b')"][1] == 2
+
+    assert cache.evaluate(feature, "1 + 1") == 2
+    assert cache.last_error == ""
+
+
+def test_pop_errors_resets_errors(qgis_app):
+    cache = ExpressionCache()
+    cache.evaluate(QgsFeature(QgsFields()), "1 +")
+
+    assert list(cache.pop_errors()) == ["1 +"]
+    assert not cache.errors
+
+
+def test_parser_errors_are_counted_per_evaluation(qgis_app):
+    cache = ExpressionCache(max_errors=1)
+    feature = QgsFeature(QgsFields())
+    for _ in range(3):
+        assert cache.evaluate(feature, "1 +") is None
+        assert cache.last_error
+
+    assert cache.errors["1 +"][1] == 3
+
+    # evicted errors of cached expressions are reported again
+    cache.evaluate(feature, "to_int('a')")
+    cache.evaluate(feature, "1 +")
+    assert list(cache.errors) == ["1 +"]
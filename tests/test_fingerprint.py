@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsField, QgsFields, QgsGeometry, QgsPointXY
+from qgis.PyQt.QtCore import QVariant
+
+from easy_labeling.utilities.fingerprint import expression_inputs, is_deterministic, label_fingerprint
+
+
+@pytest.fixture
+def feature(qgis_app):
+    fields = QgsFields()
+    fields.append(QgsField("name", QVariant.String))
+    fields.append(QgsField("width", QVariant.Int))
+    feature = QgsFeature(fields)
+    feature["name"] = "A"
+    feature["width"] = 5
+    feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(0, 10)]))
+    return feature
+
+
+@pytest.mark.parametrize("expression", ['"name"', 'upper("name") || \' \' || "width"',
+                                        'round(length($geometry), 1)', 'coalesce("name", @id)'])
+def test_deterministic_expressions(qgis_app, expression):
+    assert is_deterministic(expression)
+
+
+@pytest.mark.parametrize("expression", ['now()', '@project_title || "name"', 'round($length, 1)', '$area',
+                                        '$perimeter', 'aggregate(\'Roads\', \'count\', "name")',
+                                        'get_feature(\'Roads\', \'name\', "name")', '"name" ||'])
+def test_other_inputs_have_no_fingerprint(feature, expression):
+    assert not is_deterministic(expression)
+    assert expression_inputs(expression) == (None, True)
+    assert label_fingerprint(feature, expression) is None
+
+
+def test_fingerprint_covers_referenced_columns_only(feature):
+    before = label_fingerprint(feature, '"name"')
+
+    feature["width"] = 7
+    assert label_fingerprint(feature, '"name"') == before
+
+    feature["name"] = "B"
+    assert label_fingerprint(feature, '"name"') != before
+
+
+def test_fingerprint_covers_geometry_when_used(feature):
+    before = label_fingerprint(feature, 'length($geometry)')
+    name_only = label_fingerprint(feature, '"name"')
+
+    feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(0, 20)]))
+    assert label_fingerprint(feature, 'length($geometry)') != before
+    assert label_fingerprint(feature, '"name"') == name_only
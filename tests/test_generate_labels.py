@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from easy_labeling.generate_labels import fid_ranges
+
+
+def test_ranges_have_nearly_equal_sizes():
+    fids = list(range(1, 11))
+    ranges = fid_ranges(fids, 3)
+
+    assert ranges == [(1, 4), (5, 7), (8, 10)]
+
+
+def test_ranges_follow_gaps_and_order():
+    assert fid_ranges([40, 3, 17, 5], 2) == [(3, 5), (17, 40)]
+
+
+@pytest.mark.parametrize("count", [0, 1, 5])
+def test_ranges_are_limited_by_features(count):
+    ranges = fid_ranges([7, 8], count)
+
+    assert ranges == ([(7, 8)] if count < 2 else [(7, 7), (8, 8)])
+
+
+def test_no_features_no_ranges():
+    assert fid_ranges([], 4) == []
+
+
+def _write_shard(path, references):
+    from qgis.core import (QgsCoordinateReferenceSystem, QgsFeatureSink, QgsProject, QgsPointXY, QgsVectorFileWriter,
+                           QgsVectorLayer, QgsWkbTypes)
+
+    from easy_labeling.utilities.functions import create_new_feature, labeling_fields
+
+    fields = labeling_fields()
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "labels", "memory")
+    layer.dataProvider().addAttributes(fields.toList())
+    layer.updateFields()
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = "labels"
+    writer = QgsVectorFileWriter.create(path, fields, QgsWkbTypes.Point, QgsCoordinateReferenceSystem("EPSG:25832"),
+                                        QgsProject.instance().transformContext(), options)
+    features = [create_new_feature(layer, "", '"name"', reference, [], QgsPointXY(0, 0)) for reference in references]
+    assert writer.addFeatures(features, QgsFeatureSink.FastInsert)
+    del writer
+
+
+def test_merge_builds_reference_index(qgis_app, tmp_path):
+    from qgis.core import QgsCoordinateReferenceSystem
+
+    from easy_labeling.generate_labels import _merge
+    from easy_labeling.utilities.reference_index import ReferenceIndex
+
+    shards = [str(tmp_path / "shard_0.gpkg"), str(tmp_path / "shard_1.gpkg")]
+    _write_shard(shards[0], ["Roads.1", "Roads.2"])
+    _write_shard(shards[1], ["Roads.1", None])
+    destination = str(tmp_path / "labels.gpkg")
+
+    assert _merge(shards, destination, QgsCoordinateReferenceSystem("EPSG:25832")) == []
+
+    reference_index = ReferenceIndex(destination)
+    assert len(reference_index) == 3
+    assert len(reference_index.labels("Roads", 1)) == 2
+    reference_index.close()
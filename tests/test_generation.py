@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsProject, QgsRectangle, QgsVectorLayer
+
+from easy_labeling.utilities.functions import labeling_fields
+from easy_labeling.utilities.generation import GenerationTask, iter_chunks, source_request
+
+
+@pytest.mark.parametrize("count, size, sizes", [(0, 3, []), (2, 3, [2]), (6, 3, [3, 3]), (7, 3, [3, 3, 1])])
+def test_iter_chunks(qgis_app, count, size, sizes):
+    chunks = list(iter_chunks(iter(range(count)), size))
+
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [item for chunk in chunks for item in chunk] == list(range(count))
+
+
+@pytest.fixture
+def source_layer(qgis_app):
+    """ point layer with 5 features, names "p0" to "p4" """
+    layer = QgsVectorLayer("Point?crs=EPSG:25832&field=name:string&field=other:integer", "Points", "memory")
+    features = []
+    for i in range(5):
+        feature = QgsFeature(layer.fields())
+        feature["name"] = f"p{i}"
+        feature["other"] = i
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i * 10, 0)))
+        features.append(feature)
+    ok, _ = layer.dataProvider().addFeatures(features)
+    assert ok
+    return layer
+
+
+@pytest.fixture
+def dest_layer(qgis_app):
+    """ empty labeling layer in the project """
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    layer.dataProvider().addAttributes(labeling_fields().toList())
+    layer.updateFields()
+    QgsProject.instance().addMapLayer(layer)
+    yield layer
+    QgsProject.instance().removeMapLayer(layer.id())
+
+
+def run_task(task: GenerationTask):
+    """ runs the task in this thread, chunks are committed directly """
+    results = []
+    task.generated.connect(results.append)
+    ok = task.run()
+    task.finished(ok)
+    assert len(results) == 1
+    return ok, results[0]
+
+
+def test_source_request_fetches_expression_columns(source_layer):
+    request = source_request(source_layer, '"name" || \'!\'', fids=[1, 2])
+
+    assert sorted(request.filterFids()) == [1, 2]
+    assert [source_layer.fields().at(i).name() for i in request.subsetOfAttributes()] == ["name"]
+
+
+def test_source_request_without_columns_fetches_all(source_layer):
+    request = source_request(source_layer, "attribute(@feature, 'name')")
+
+    assert not request.flags() & request.SubsetOfAttributes
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_task_generates_selection(source_layer, dest_layer, chunk_size):
+    source_layer.selectByIds([1, 3, 4])
+    task = GenerationTask(source_layer, source_layer.selectedFeatures(), '"name"', dest_layer, 10, chunk_size,
+                          use_cache=False)
+
+    ok, result = run_task(task)
+
+    assert ok and not result.canceled
+    assert (result.total, len(result.created), result.skipped, result.failed) == (3, 3, [], 0)
+    assert sorted(feature["Text"] for feature in dest_layer.getFeatures()) == ["p1", "p3", "p4"]
+
+
+def test_task_streams_selection(source_layer, dest_layer):
+    request = source_request(source_layer, '"name"', fids=[0, 2])
+    task = GenerationTask(source_layer, request, '"name"', dest_layer, 10, use_cache=False)
+
+    ok, result = run_task(task)
+
+    assert ok
+    assert (result.total, len(result.created)) == (2, 2)
+    assert sorted(feature["Text"] for feature in dest_layer.getFeatures()) == ["p0", "p2"]
+
+
+def test_cancelled_task_writes_nothing(source_layer, dest_layer):
+    task = GenerationTask(source_layer, source_layer.getFeatures(), '"name"', dest_layer, 10, use_cache=False)
+    task.cancel()
+
+    ok, result = run_task(task)
+
+    assert not ok and result.canceled
+    assert dest_layer.featureCount() == 0
+
+
+def test_source_request_filters(source_layer):
+    request = source_request(source_layer, '"name"', extent=QgsRectangle(-1, -1, 25, 1), filter_expression='"other" > 0')
+    assert sorted(f["name"] for f in source_layer.getFeatures(request)) == ["p1", "p2"]
+
+    # feature ids replace the filter expression
+    request = source_request(source_layer, '"name"', fids=[0], filter_expression='"other" > 0')
+    assert [f["name"] for f in source_layer.getFeatures(request)] == ["p0"]
+
+
+def run_with_progress(task: GenerationTask):
+    progress = []
+    task.progressChanged.connect(progress.append)
+    ok, result = run_task(task)
+    return ok, result, progress
+
+
+def test_filtered_stream_progress_is_estimated(source_layer, dest_layer):
+    request = source_request(source_layer, '"name"', filter_expression='"other" < 2')
+    task = GenerationTask(source_layer, request, '"name"', dest_layer, 10, use_cache=False)
+    # feature count of the layer is the upper bound
+    assert task.result.total == 5
+
+    ok, result, progress = run_with_progress(task)
+
+    assert ok
+    assert (result.total, len(result.created)) == (2, 2)
+    assert progress and max(progress) <= 99
+
+
+def test_limited_stream_progress_is_estimated(source_layer, dest_layer):
+    request = source_request(source_layer, '"name"').setLimit(3)
+    task = GenerationTask(source_layer, request, '"name"', dest_layer, 10, use_cache=False)
+
+    assert task.result.total == 3
+
+
+def test_fid_stream_progress_is_exact(source_layer, dest_layer):
+    request = source_request(source_layer, '"name"', fids=[0, 1, 2])
+    task = GenerationTask(source_layer, request, '"name"', dest_layer, 10, use_cache=False)
+
+    ok, result, progress = run_with_progress(task)
+
+    assert ok and result.total == 3
+    assert progress[-1] == 100
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from easy_labeling.utilities.functions import (DEFAULT_OFFSET, create_new_feature, get_leader_targets, get_positions,
+                                               labeling_fields)
+from easy_labeling.utilities.geometry_follow import _same_points, reanchor_labels
+from easy_labeling.utilities.leaders import decode_leaders
+from easy_labeling.submodules.qgis.geometry.functions import get_distance_area
+
+
+CRS = QgsCoordinateReferenceSystem("EPSG:25832")
+OLD_LINE = QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(100, 0)])
+NEW_LINE = QgsGeometry.fromPolylineXY([QgsPointXY(0, 50), QgsPointXY(100, 50)])
+
+
+def generated(geom: QgsGeometry):
+    """ labeling point and leader targets like on generation """
+    point = get_positions([QgsGeometry(geom)], CRS, get_distance_area(CRS), DEFAULT_OFFSET)[0]
+    return point, get_leader_targets(geom)
+
+
+def labeling_layer(*labels):
+    """ memory labeling layer, one feature per (point, leader targets), all referencing feature 1 """
+    layer = QgsVectorLayer(f"Point?crs={CRS.authid()}", "Labels", "memory")
+    layer.dataProvider().addAttributes(labeling_fields().toList())
+    layer.updateFields()
+    features = [create_new_feature(layer, "Text", "'Text'", "Lines.1", targets, point) for point, targets in labels]
+    ok, features = layer.dataProvider().addFeatures(features)
+    assert ok
+    return layer, {feature.id(): 1 for feature in features}
+
+
+def reanchor(layer, labels, force=False, chunk_size=1000):
+    return reanchor_labels(layer, CRS, labels, {1: NEW_LINE}, {1: OLD_LINE}, force=force, chunk_size=chunk_size)
+
+
+def test_same_points(qgis_app):
+    points = [QgsPointXY(0, 0), QgsPointXY(1, 1)]
+
+    assert _same_points(points, [QgsPointXY(0, 0), QgsPointXY(1, 1.0000001)], 0.001)
+    assert not _same_points(points, [QgsPointXY(0, 0), QgsPointXY(1, 1.1)], 0.001)
+    assert not _same_points(points, points[:1], 0.001)
+    assert not _same_points(points, list(reversed(points)), 0.001)
+    assert _same_points([], [], 0.001)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_generated_label_is_moved(qgis_app, chunk_size):
+    layer, labels = labeling_layer(generated(OLD_LINE))
+    point, targets = generated(NEW_LINE)
+
+    fids, kept, error = reanchor(layer, labels, chunk_size=chunk_size)
+
+    assert (sorted(fids), kept, error) == (sorted(labels), 0, "")
+    feature = next(layer.getFeatures())
+    assert feature.geometry().asPoint().compare(point, 0.001)
+    assert _same_points(decode_leaders(feature), targets, 0.001)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_moved_label_is_kept_without_force(qgis_app, chunk_size):
+    old_point, old_targets = generated(OLD_LINE)
+    moved = QgsPointXY(old_point.x() + 10, old_point.y() + 10)
+    layer, labels = labeling_layer(generated(OLD_LINE), (moved, old_targets))
+
+    fids, kept, error = reanchor(layer, labels, chunk_size=chunk_size)
+
+    assert (len(fids), kept, error) == (1, 1, "")
+    kept_feature = [feature for feature in layer.getFeatures() if feature.id() not in fids][0]
+    assert kept_feature.geometry().asPoint().compare(moved, 0.001)
+
+
+def test_moved_label_is_moved_with_force(qgis_app):
+    old_point, old_targets = generated(OLD_LINE)
+    layer, labels = labeling_layer((QgsPointXY(old_point.x() + 10, old_point.y()), [QgsPointXY(-5, -5)]))
+    point, targets = generated(NEW_LINE)
+
+    fids, kept, error = reanchor(layer, labels, force=True, chunk_size=1)
+
+    assert (fids, kept, error) == (list(labels), 0, "")
+    feature = next(layer.getFeatures())
+    assert feature.geometry().asPoint().compare(point, 0.001)
+    assert _same_points(decode_leaders(feature), targets, 0.001)
+
+
+def test_edited_leaders_are_kept(qgis_app):
+    old_point, _ = generated(OLD_LINE)
+    edited = [QgsPointXY(-5, -5)]
+    layer, labels = labeling_layer((old_point, edited))
+    point, _ = generated(NEW_LINE)
+
+    fids, kept, error = reanchor(layer, labels)
+
+    assert (fids, kept, error) == (list(labels), 0, "")
+    feature = next(layer.getFeatures())
+    assert feature.geometry().asPoint().compare(point, 0.001)
+    assert _same_points(decode_leaders(feature), edited, 0.001)
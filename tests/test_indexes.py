@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import (QgsCoordinateReferenceSystem, QgsFeatureSource, QgsProject, QgsVectorFileWriter, QgsVectorLayer,
+                       QgsWkbTypes)
+
+from easy_labeling.utilities.functions import INDEXED_FIELDS, create_indexes, labeling_fields
+from easy_labeling.utilities.gpkg import gpkg_uri
+
+
+@pytest.fixture
+def gpkg_layer(qgis_app, tmp_path):
+    """ empty labeling layer in a GeoPackage without spatial index """
+    path = str(tmp_path / "labels.gpkg")
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = "labels"
+    options.layerOptions = ["SPATIAL_INDEX=NO"]
+    writer = QgsVectorFileWriter.create(path, labeling_fields(), QgsWkbTypes.Point,
+                                        QgsCoordinateReferenceSystem("EPSG:25832"),
+                                        QgsProject.instance().transformContext(), options)
+    assert writer.hasError() == QgsVectorFileWriter.NoError
+    del writer
+
+    layer = QgsVectorLayer(gpkg_uri(path, "labels"), "labels", "ogr")
+    assert layer.isValid()
+    return path, layer
+
+
+def indexed_columns(path: str):
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'labels'")
+        names = [row[0] for row in rows]
+        return {column[2] for name in names for column in connection.execute(f'PRAGMA index_info("{name}")')}
+    finally:
+        connection.close()
+
+
+def test_create_indexes_on_geopackage(gpkg_layer):
+    path, layer = gpkg_layer
+    assert layer.dataProvider().hasSpatialIndex() != QgsFeatureSource.SpatialIndexPresent
+
+    assert create_indexes(layer) == []
+
+    assert layer.dataProvider().hasSpatialIndex() == QgsFeatureSource.SpatialIndexPresent
+    assert set(INDEXED_FIELDS) <= indexed_columns(path)
+
+
+def test_existing_indexes_are_kept(gpkg_layer):
+    path, layer = gpkg_layer
+    assert create_indexes(layer) == []
+
+    assert create_indexes(layer) == []
+    assert set(INDEXED_FIELDS) <= indexed_columns(path)
+
+
+def test_missing_fields_are_skipped(qgis_app):
+    layer = QgsVectorLayer("Point?crs=EPSG:25832&field=Text:string", "Labels", "memory")
+
+    assert not set(INDEXED_FIELDS) & set(create_indexes(layer))
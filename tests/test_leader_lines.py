@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsPointXY, QgsVectorLayer
+
+from easy_labeling.utilities.functions import create_new_feature, create_new_layer
+from easy_labeling.utilities.gpkg import gpkg_path, gpkg_uri
+from easy_labeling.utilities.leader_lines import (POINT_FID_FIELD, leader_line_features, leader_table_name,
+                                                  sync_leader_lines, write_leader_table)
+from easy_labeling.utilities.leaders import leader_values
+
+
+@pytest.fixture
+def labels(qgis_app, tmp_path):
+    """ GeoPackage labeling layer with two, one and no leader targets """
+    layer = create_new_layer(str(tmp_path / "labels.gpkg"), QgsCoordinateReferenceSystem("EPSG:25832"))
+    features = [
+        create_new_feature(layer, "a", "", None, [QgsPointXY(1, 1), QgsPointXY(2, 2)], QgsPointXY(0, 0)),
+        create_new_feature(layer, "b", "", None, [QgsPointXY(3, 3)], QgsPointXY(5, 5)),
+        create_new_feature(layer, "c", "", None, [], QgsPointXY(9, 9)),
+    ]
+    ok, _ = layer.dataProvider().addFeatures(features)
+    assert ok
+    return layer
+
+
+def _lines(layer):
+    table = leader_table_name(layer)
+    lines = QgsVectorLayer(gpkg_uri(gpkg_path(layer), table), table, "ogr")
+    return {f[POINT_FID_FIELD]: f.geometry().asMultiPolyline() for f in lines.getFeatures()}
+
+
+def _fids(layer):
+    return {f["Text"]: f.id() for f in layer.getFeatures()}
+
+
+def test_line_features_start_at_label(labels):
+    features = list(leader_line_features(labels, QgsVectorLayer("MultiLineString?field=point_fid:long",
+                                                                "lines", "memory").fields()))
+
+    assert len(features) == 2
+    lines = {f[POINT_FID_FIELD]: f.geometry().asMultiPolyline() for f in features}
+    assert lines[_fids(labels)["a"]] == [[QgsPointXY(0, 0), QgsPointXY(1, 1)], [QgsPointXY(0, 0), QgsPointXY(2, 2)]]
+
+
+def test_write_table_in_chunks(labels):
+    assert write_leader_table(labels, chunk_size=1) == (True, "")
+
+    lines = _lines(labels)
+    fids = _fids(labels)
+    assert set(lines) == {fids["a"], fids["b"]}
+    assert lines[fids["b"]] == [[QgsPointXY(5, 5), QgsPointXY(3, 3)]]
+
+
+def test_sync_replaces_changed_and_removes_deleted(labels):
+    write_leader_table(labels)
+    fids = _fids(labels)
+    provider = labels.dataProvider()
+    changes = {provider.fields().lookupField(name): value
+               for name, value in leader_values(provider.fields(), [QgsPointXY(7, 7)]).items()}
+    assert provider.changeAttributeValues({fids["c"]: changes})
+    assert provider.deleteFeatures([fids["a"]])
+
+    assert sync_leader_lines(labels, [fids["a"], fids["c"]], chunk_size=1) == (True, "")
+
+    lines = _lines(labels)
+    assert set(lines) == {fids["b"], fids["c"]}
+    assert lines[fids["c"]] == [[QgsPointXY(9, 9), QgsPointXY(7, 7)]]
+
+
+def test_sync_without_table_writes_it(labels):
+    assert sync_leader_lines(labels, []) == (True, "")
+
+    assert len(_lines(labels)) == 2
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer, NULL
+
+from easy_labeling.utilities.leaders import decode_leaders, decode_leaders_text, encode_leaders_json, migrate_layer
+
+
+def test_json_round_trip(qgis_app):
+    points = [QgsPointXY(1.5, 2), QgsPointXY(-3, 4)]
+
+    assert decode_leaders_text(encode_leaders_json(points)) == points
+
+
+def test_legacy_python_list(qgis_app):
+    assert decode_leaders_text("[['1.5,2'], ['-3,4']]") == [QgsPointXY(1.5, 2), QgsPointXY(-3, 4)]
+
+
+def test_invalid_items_are_skipped(qgis_app):
+    assert decode_leaders_text("[[1, 2], ['a,b'], [1, 2, 3], 'x', [3, 4]]") == [QgsPointXY(1, 2), QgsPointXY(3, 4)]
+
+
+@pytest.mark.parametrize("text", [None, "", "  ", "not a list", "{'x': 1}", "[1, 2", 42])
+def test_invalid_text(qgis_app, text):
+    assert decode_leaders_text(text) == []
+
+
+@pytest.fixture
+def legacy_layer(qgis_app):
+    """ labeling layer without "Leaders" field, one feature with invalid targets """
+    layer = QgsVectorLayer("Point?crs=EPSG:25832&field=Points:string", "Labels", "memory")
+    features = []
+    for text in ["[[1, 2]]", "[['3,4'], ['5,6']]", "invalid", None]:
+        feature = QgsFeature(layer.fields())
+        feature["Points"] = text
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(0, 0)))
+        features.append(feature)
+    ok, _ = layer.dataProvider().addFeatures(features)
+    assert ok
+    return layer
+
+
+def test_migrate_layer_in_chunks(legacy_layer):
+    result = migrate_layer(legacy_layer, chunk_size=1)
+
+    assert (result.converted, result.invalid, result.failed) == (4, 1, 0)
+    targets = sorted((len(decode_leaders(feature)) for feature in legacy_layer.getFeatures()))
+    assert targets == [0, 0, 1, 2]
+    assert all(feature["Points"] in (None, NULL) for feature in legacy_layer.getFeatures())
+
+    # converted features are not changed again
+    assert migrate_layer(legacy_layer).converted == 0
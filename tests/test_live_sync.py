@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsGeometry, QgsPointXY, QgsProject, QgsVectorLayer
+from qgis.PyQt.QtTest import QTest
+
+from easy_labeling.modules.live_sync import LiveSync
+from easy_labeling.utilities.functions import create_new_feature, create_new_layer, labeling_fields
+from easy_labeling.utilities.live_sync import GEOMETRY_CHANGED, ReverseIndex, set_live_sync_enabled
+from easy_labeling.utilities.reference_index import ReferenceIndex
+
+
+@pytest.fixture
+def roads(qgis_app):
+    """ referenced layer "Roads" with two features in the project """
+    layer = QgsVectorLayer("LineString?crs=EPSG:25832&field=name:string&field=lanes:integer", "Roads", "memory")
+    features = []
+    for name, lanes in (("A", 1), ("B", 2)):
+        feature = QgsFeature(layer.fields())
+        feature["name"] = name
+        feature["lanes"] = lanes
+        feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(100, 0)]))
+        features.append(feature)
+    ok, _ = layer.dataProvider().addFeatures(features)
+    assert ok
+    QgsProject.instance().addMapLayer(layer)
+    yield layer
+    QgsProject.instance().removeMapLayer(layer.id())
+
+
+def add_labels(layer: QgsVectorLayer, labels):
+    """ adds labels (text, expression, reference) """
+    features = [create_new_feature(layer, text, expression, reference, [], QgsPointXY(0, 0))
+                for text, expression, reference in labels]
+    ok, features = layer.dataProvider().addFeatures(features)
+    assert ok
+    return [feature.id() for feature in features]
+
+
+@pytest.fixture
+def labels(roads):
+    """ labeling layer with live sync in the project, one label per field of feature 1 """
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    layer.dataProvider().addAttributes(labeling_fields().toList())
+    layer.updateFields()
+    add_labels(layer, [("A", '"name"', "Roads.1"), ("1", '"lanes"', "Roads.1"), ("B", '"name"', "Roads.2")])
+    set_live_sync_enabled(layer, True)
+    QgsProject.instance().addMapLayer(layer)
+    yield layer
+    QgsProject.instance().removeMapLayer(layer.id())
+
+
+@pytest.fixture
+def live_sync(labels):
+    module = LiveSync(plugin=None, name="live_sync")
+    yield module
+    module.reset_qt_connections()
+
+
+def texts(layer: QgsVectorLayer):
+    return {feature["Expression"] + feature["Reference"]: feature["Text"] for feature in layer.getFeatures()}
+
+
+def test_commits_are_flushed_once_per_cycle(live_sync, roads, labels):
+    roads.startEditing()
+    roads.changeAttributeValue(1, roads.fields().lookupField("name"), "C")
+    assert roads.commitChanges()
+    roads.startEditing()
+    roads.changeAttributeValue(2, roads.fields().lookupField("name"), "D")
+    assert roads.commitChanges()
+
+    # both commits wait for the same flush
+    assert set(live_sync._pending[roads.id()]) == {1, 2}
+    assert texts(labels)['"name"Roads.1'] == "A"
+
+    QTest.qWait(50)
+
+    assert live_sync._pending == {}
+    assert texts(labels) == {'"name"Roads.1': "C", '"lanes"Roads.1': "1", '"name"Roads.2': "D"}
+
+
+def test_only_labels_using_changed_fields_are_written(live_sync, roads, labels):
+    # text of the "lanes" label is stale on purpose, it must not be evaluated again
+    labels.dataProvider().changeAttributeValues({2: {labels.fields().lookupField("Text"): "stale"}})
+
+    roads.startEditing()
+    roads.changeAttributeValue(1, roads.fields().lookupField("name"), "C")
+    assert roads.commitChanges()
+    QTest.qWait(50)
+
+    assert texts(labels) == {'"name"Roads.1': "C", '"lanes"Roads.1': "stale", '"name"Roads.2': "B"}
+
+
+def test_reverse_index_affected(labels):
+    index = ReverseIndex(labels)
+
+    assert index.affected("Roads", {1: {"name"}}) == {1: 1}
+    assert index.affected("Roads", {1: {"name", "lanes"}, 2: {"lanes"}}) == {1: 1, 2: 1}
+    assert index.affected("Roads", {1: {GEOMETRY_CHANGED}}) == {}
+    assert index.affected("Other", {1: {"name"}}) == {}
+
+
+@pytest.fixture
+def gpkg_labels(roads, tmp_path):
+    """ labeling GeoPackage with a persistent reference index """
+    layer = create_new_layer(str(tmp_path / "labels.gpkg"), QgsCoordinateReferenceSystem("EPSG:25832"))
+    fids = add_labels(layer, [("A", '"name"', "Roads.1"), ("1", '"lanes"', "Roads.1")])
+    reference_index = ReferenceIndex.for_layer(layer)
+    reference_index.rebuild(layer)
+    yield layer, fids, reference_index
+    reference_index.close()
+
+
+def test_reverse_index_uses_persistent_index(gpkg_labels):
+    layer, fids, reference_index = gpkg_labels
+    index = ReverseIndex(layer, reference_index)
+
+    assert sorted(index.lookup("Roads", 1)) == sorted(fids)
+    assert index.affected("Roads", {1: {"lanes"}}) == {fids[1]: 1}
+    # only the expressions of affected labels were read
+    assert not index._scanned
+    assert len(index) == 2
+
+
+def test_reverse_index_falls_back_to_layer(gpkg_labels):
+    layer, fids, reference_index = gpkg_labels
+    index = ReverseIndex(layer, reference_index)
+    reference_index.drop()
+
+    assert sorted(index.lookup("Roads", 1)) == sorted(fids)
+    assert index._scanned
+    assert len(index) == 2
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsRectangle, QgsVectorLayer
+from qgis.gui import QgsMapCanvas
+
+from easy_labeling.submodules.qgis.canvas.maptool_click_snap import LocatorCache
+
+
+@pytest.fixture
+def canvas(qgis_app):
+    canvas = QgsMapCanvas()
+    canvas.setDestinationCrs(QgsCoordinateReferenceSystem("EPSG:25832"))
+    canvas.setExtent(QgsRectangle(0, 0, 100, 100))
+    yield canvas
+    canvas.deleteLater()
+
+
+@pytest.fixture
+def layer(qgis_app):
+    layer = QgsVectorLayer("LineString?crs=EPSG:25832", "Lines", "memory")
+    QgsProject.instance().addMapLayer(layer)
+    yield layer
+    if QgsProject.instance().mapLayer(layer.id()) is not None:
+        QgsProject.instance().removeMapLayer(layer.id())
+
+
+def test_locators_are_reused_per_crs(canvas, layer):
+    cache = LocatorCache()
+    locator = cache.get(layer, canvas)
+
+    assert cache.get(layer, canvas) is locator
+    assert len(cache) == 1
+
+    canvas.setDestinationCrs(QgsCoordinateReferenceSystem("EPSG:3857"))
+    assert cache.get(layer, canvas) is not locator
+    assert len(cache) == 2
+
+
+def test_deleted_layer_removes_locators(canvas, layer):
+    cache = LocatorCache()
+    cache.get(layer, canvas)
+    canvas.setDestinationCrs(QgsCoordinateReferenceSystem("EPSG:3857"))
+    cache.get(layer, canvas)
+
+    QgsProject.instance().removeMapLayer(layer.id())
+
+    assert len(cache) == 0
+    assert cache._connections == {}
+
+
+def test_remove_layer_disconnects(canvas, layer):
+    cache = LocatorCache()
+    locator = cache.get(layer, canvas)
+
+    cache.remove_layer(layer.id())
+    assert len(cache) == 0
+    assert cache._connections == {}
+
+    # a new locator is built and connected again
+    assert cache.get(layer, canvas) is not locator
+    assert layer.id() in cache._connections
+
+
+def test_clear_disconnects_all_layers(canvas, layer):
+    cache = LocatorCache()
+    cache.get(layer, canvas)
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache._connections == {}
+    # removing the layer afterwards does not call the cache
+    QgsProject.instance().removeMapLayer(layer.id())
+    assert len(cache) == 0
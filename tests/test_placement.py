@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import random
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsGeometry, QgsPointXY
+
+from easy_labeling.submodules.qgis.geometry.functions import get_distance_area
+from easy_labeling.submodules.qgis.geometry.placement import pack_lines, place_on_lines
+from easy_labeling.utilities.functions import get_position, get_positions
+
+
+def _random_lines(count: int, seed: int = 7):
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        x, y = rnd.uniform(300000, 400000), rnd.uniform(5600000, 5700000)
+        points = []
+        for _ in range(rnd.randint(2, 12)):
+            x += rnd.uniform(-50, 50)
+            y += rnd.uniform(-50, 50)
+            points.append(QgsPointXY(x, y))
+        lines.append(QgsGeometry.fromPolylineXY(points))
+
+    return lines
+
+
+@pytest.mark.parametrize("offset", [None, 0, 10])
+def test_positions_equal_single_placement(qgis_app, offset):
+    crs = QgsCoordinateReferenceSystem("EPSG:25832")
+    area = get_distance_area(crs)
+    geoms = _random_lines(300)
+    # closed and degenerated lines
+    geoms.append(QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(10, 0), QgsPointXY(0, 0)]))
+    geoms.append(QgsGeometry.fromPolylineXY([QgsPointXY(5, 5), QgsPointXY(5, 5)]))
+
+    expected = [get_position(geom, crs, area, offset) for geom in geoms]
+    actual = get_positions(geoms, crs, area, offset)
+
+    for geom, e, a in zip(geoms, expected, actual):
+        if e is None:
+            assert a is None, geom.asWkt()
+        else:
+            assert a is not None, geom.asWkt()
+            assert a.x() == pytest.approx(e.x(), abs=1e-6)
+            assert a.y() == pytest.approx(e.y(), abs=1e-6)
+
+
+def test_place_on_lines_center_without_offset(qgis_app):
+    coords, offsets = pack_lines([[QgsPointXY(0, 0), QgsPointXY(10, 0)],
+                                  [QgsPointXY(0, 0), QgsPointXY(0, 4), QgsPointXY(4, 4)]])
+    points, valid = place_on_lines(coords, offsets)
+
+    assert valid.tolist() == [True, True]
+    assert points.tolist() == [[5, 0], [0, 4]]
+
+
+def test_place_on_lines_single_vertex_is_invalid(qgis_app):
+    coords, offsets = pack_lines([[QgsPointXY(1, 1)]])
+    points, valid = place_on_lines(coords, offsets, 10)
+
+    assert valid.tolist() == [False]
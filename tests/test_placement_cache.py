@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsPointXY
+
+from easy_labeling.utilities.placement_cache import PlacementCache, cache_path
+
+
+def test_cache_is_a_separate_file(qgis_app):
+    assert cache_path(os.path.join("data", "labels.gpkg")) == os.path.join("data", "labels.placements.sqlite")
+
+
+def test_store_lookup_and_evict(qgis_app, tmp_path):
+    cache = PlacementCache(str(tmp_path / "labels.placements.sqlite"))
+    cache.store({"a": (QgsPointXY(1, 2), [QgsPointXY(0, 0), QgsPointXY(2, 4)]), "b": (None, [])})
+
+    found = cache.lookup(["a", "b", "c"])
+    assert found["a"][0] == QgsPointXY(1, 2)
+    assert found["a"][1] == [QgsPointXY(0, 0), QgsPointXY(2, 4)]
+    assert found["b"] == (None, [])
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    assert cache.evict(max_entries=1) == 1
+    assert len(cache.lookup(["a", "b"])) == 1
+    cache.close()
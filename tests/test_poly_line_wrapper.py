@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsPointXY
+
+from easy_labeling.submodules.qgis.tools.poly_line_wrapper import PolylineArray
+
+
+@pytest.fixture
+def line(qgis_app):
+    # segments of length 3, 4 and 0 (duplicate vertex)
+    return PolylineArray([QgsPointXY(0, 0), QgsPointXY(3, 0), QgsPointXY(3, 4), QgsPointXY(3, 4)])
+
+
+def test_length(line):
+    assert line.length() == 7
+    assert len(line) == 4
+
+
+@pytest.mark.parametrize("distance, index", [(0, 0), (1.5, 1), (3, 1), (3.5, 2), (7, 2)])
+def test_segment_index_at_distance(line, distance, index):
+    assert line.segment_index_at_distance(distance) == index
+
+
+@pytest.mark.parametrize("distance, point", [(0, (0, 0)), (1.5, (1.5, 0)), (3, (3, 0)), (5, (3, 2)), (7, (3, 4))])
+def test_point_at_distance(line, distance, point):
+    assert line.point_at_distance(distance) == QgsPointXY(*point)
+
+
+@pytest.mark.parametrize("distance", [-0.1, 7.1])
+def test_distance_outside_line(line, distance):
+    with pytest.raises(ValueError):
+        line.point_at_distance(distance)
+
+
+def test_distance_of_point(line):
+    assert line.distance_of_point(QgsPointXY(3, 2)) == pytest.approx(5)
+    with pytest.raises(ValueError):
+        line.distance_of_point(QgsPointXY(1, 1))
+
+
+def test_single_point(qgis_app):
+    line = PolylineArray([QgsPointXY(2, 2)])
+
+    assert line.length() == 0
+    assert line.point_at_distance(0) == QgsPointXY(2, 2)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsPointXY, QgsRectangle, QgsVectorLayer
+from qgis.gui import QgsMapCanvas, QgsMapMouseEvent, QgsRubberBand
+from qgis.PyQt.QtCore import QEvent, QPoint
+from qgis.PyQt.QtTest import QTest
+
+from easy_labeling.submodules.qgis.canvas.canvas_drawing import PreviewLine
+from easy_labeling.submodules.qgis.canvas.maptool_click_snap import MapToolQgisSnap
+
+
+@pytest.fixture
+def canvas(qgis_app):
+    canvas = QgsMapCanvas()
+    canvas.resize(400, 400)
+    canvas.setDestinationCrs(QgsCoordinateReferenceSystem("EPSG:25832"))
+    canvas.setExtent(QgsRectangle(0, 0, 100, 100))
+    yield canvas
+    canvas.deleteLater()
+
+
+class Interface:
+    """ only the map canvas of `QgisInterface` """
+
+    def __init__(self, canvas: QgsMapCanvas):
+        self.canvas = canvas
+
+    def mapCanvas(self) -> QgsMapCanvas:
+        return self.canvas
+
+
+def rubber_bands(canvas):
+    return [item for item in canvas.scene().items() if isinstance(item, QgsRubberBand)]
+
+
+def vertices(preview: PreviewLine):
+    return [QgsPointXY(point) for point in preview._rubber_band.asGeometry().asPolyline()]
+
+
+def test_preview_line_moves_end_vertex(canvas):
+    preview = PreviewLine(canvas)
+    preview.start(QgsPointXY(10, 10))
+    preview.move_to(QgsPointXY(20, 30))
+    preview.move_to(QgsPointXY(40, 50))
+
+    assert preview.active
+    assert vertices(preview) == [QgsPointXY(10, 10), QgsPointXY(40, 50)]
+
+
+def test_preview_line_reuses_rubber_band(canvas):
+    preview = PreviewLine(canvas)
+    preview.start(QgsPointXY(10, 10))
+    preview.reset()
+    preview.move_to(QgsPointXY(20, 30))
+    assert not preview.active
+
+    preview.start(QgsPointXY(50, 50))
+    preview.move_to(QgsPointXY(60, 60))
+
+    assert len(rubber_bands(canvas)) == 1
+    assert vertices(preview) == [QgsPointXY(50, 50), QgsPointXY(60, 60)]
+
+    preview.remove()
+    assert rubber_bands(canvas) == []
+
+
+def test_preview_line_transforms_layer_points(canvas):
+    layer = QgsVectorLayer("Point?crs=EPSG:4326", "Points", "memory")
+    preview = PreviewLine(canvas)
+    preview.start(QgsPointXY(9, 50), layer)
+    preview.move_to(QgsPointXY(9, 51))
+
+    start, end = vertices(preview)
+    assert start.x() == pytest.approx(500000, abs=1) and end.x() == pytest.approx(500000, abs=1)
+    assert 100000 < end.y() - start.y() < 120000
+
+
+def test_only_last_mouse_move_is_emitted(canvas):
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "Points", "memory")
+    tool = MapToolQgisSnap(Interface(canvas), layer, move_interval=20)
+    moved = []
+    tool.moved.connect(moved.append)
+
+    for x in (10, 20, 30):
+        tool.canvasMoveEvent(QgsMapMouseEvent(canvas, QEvent.MouseMove, QPoint(x, 40)))
+    assert moved == []
+
+    QTest.qWait(100)
+    assert moved == [tool.toLayerCoordinates(layer, tool.toMapCoordinates(QPoint(30, 40)))]
+
+    # moves after unloading are dropped
+    tool.canvasMoveEvent(QgsMapMouseEvent(canvas, QEvent.MouseMove, QPoint(50, 40)))
+    tool.unload_tool()
+    QTest.qWait(100)
+    assert len(moved) == 1
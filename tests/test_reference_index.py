@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsPointXY, QgsProject, QgsVectorLayer
+
+from easy_labeling.utilities import reference_index
+from easy_labeling.utilities.functions import create_new_feature, create_new_layer, labeling_fields
+from easy_labeling.utilities.gpkg import gpkg_uri
+from easy_labeling.utilities.live_sync import ReverseIndex
+from easy_labeling.utilities.reference_index import REFERENCE_INDEX_TABLE, ReferenceIndex
+
+
+@pytest.fixture
+def project(qgis_app):
+    project = QgsProject()
+    project.addMapLayer(QgsVectorLayer("LineString?crs=EPSG:25832", "Roads", "memory"))
+    yield project
+    project.clear()
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ReferenceIndex(str(tmp_path / "labels.gpkg"))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def labels(qgis_app):
+    """ labeling layer with two labels of "Roads" 10, one of "Roads" 11 and a manual label """
+    layer = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    layer.dataProvider().addAttributes(labeling_fields().toList())
+    layer.updateFields()
+    features = [create_new_feature(layer, "", '"name"', reference, [], QgsPointXY(0, 0))
+                for reference in ["Roads.10", "Roads.10", "Roads.11", None]]
+    ok, _ = layer.dataProvider().addFeatures(features)
+    assert ok
+    return layer
+
+
+def test_write_and_query(project, index):
+    index.create()
+    index.write({1: ("Roads", 10, "k1"), 2: ("Roads", 10, None), 3: ("Rivers", 5, None)}, project)
+
+    assert sorted(index.labels("Roads", 10)) == [1, 2]
+    assert index.labels_by_key("Roads", "k1") == [1]
+    assert index.referenced("Roads") == {10}
+    assert index.references([1, 3, 99]) == {1: ("Roads", 10), 3: ("Rivers", 5)}
+    assert len(index) == 3
+
+    index.remove([2])
+    assert index.labels("Roads", 10) == [1]
+    assert len(index) == 2
+
+
+def test_write_without_table_is_ignored(project, index):
+    index.write({1: ("Roads", 10, None)}, project)
+
+    assert not index.exists()
+    assert len(index) == 0
+
+
+def test_failed_write_keeps_table(project, index, labels):
+    index.rebuild(labels, project)
+    reverse_index = ReverseIndex(labels, index)
+
+    # "ref_fid" must not be NULL
+    assert not index.write({99: ("Roads", None, None)}, project)
+
+    assert index.exists()
+    assert len(index) == 3
+    assert len(reverse_index.lookup("Roads", 10)) == 2
+
+
+def test_table_is_registered_in_geopackage(qgis_app, tmp_path):
+    path = str(tmp_path / "labels.gpkg")
+    create_new_layer(path, QgsCoordinateReferenceSystem("EPSG:25832"))
+
+    connection = sqlite3.connect(path)
+    row = connection.execute("SELECT data_type FROM gpkg_contents WHERE table_name = ?",
+                             (REFERENCE_INDEX_TABLE,)).fetchone()
+    connection.close()
+    assert row == ("attributes",)
+    assert QgsVectorLayer(gpkg_uri(path, REFERENCE_INDEX_TABLE), "index", "ogr").isValid()
+
+    index = ReferenceIndex(path)
+    index.drop()
+    index.close()
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*) FROM gpkg_contents WHERE table_name = ?",
+                              (REFERENCE_INDEX_TABLE,)).fetchone() == (0,)
+    connection.close()
+
+
+def test_rebuild_in_chunks(project, index, labels, monkeypatch):
+    monkeypatch.setattr(reference_index, "_REBUILD_CHUNK_SIZE", 1)
+    index.rebuild(labels, project)
+
+    assert len(index) == 3
+    assert index.referenced("Roads") == {10, 11}
+
+
+def test_rebuild_and_sync(project, index, labels):
+    index.rebuild(labels, project)
+    assert len(index) == 3
+    assert index.referenced("Roads") == {10, 11}
+
+    ok, added = labels.dataProvider().addFeatures(
+        [create_new_feature(labels, "", '"name"', "Roads.12", [], QgsPointXY(0, 0))])
+    assert ok
+    index.sync(labels, project)
+
+    assert index.labels("Roads", 12) == [added[0].id()]
+    assert len(index) == 4
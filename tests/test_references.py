@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import NULL
+
+from easy_labeling.utilities.references import parse_reference
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("Roads.42", ("Roads", 42)),
+    ("Roads.0", ("Roads", 0)),
+    ("Straßen Nord.7", ("Straßen Nord", 7)),
+])
+def test_valid_references(qgis_app, reference, expected):
+    assert parse_reference(reference) == expected
+
+
+@pytest.mark.parametrize("reference", [None, NULL, "", "Roads", "Roads.", "Roads.-1", "Roads.4.2", "roads.v1.2",
+                                       "Roads.x", 42])
+def test_invalid_references(qgis_app, reference):
+    assert parse_reference(reference) is None
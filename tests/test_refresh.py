@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsFeedback, QgsField, QgsGeometry, QgsPointXY, QgsProject, QgsVectorLayer, NULL
+from qgis.PyQt.QtCore import QVariant
+
+from easy_labeling.utilities.functions import create_new_feature, labeling_fields
+from easy_labeling.utilities.refresh import (clear_checkpoint, iter_refresh_chunks, load_checkpoint, refresh_labels,
+                                             refresh_request, remaining_fids, save_checkpoint)
+
+
+@pytest.fixture
+def layers(qgis_app):
+    """ "Roads" with three named lines and a labeling layer with referenced, broken and manual labels """
+    project = QgsProject()
+    roads = QgsVectorLayer("LineString?crs=EPSG:25832", "Roads", "memory")
+    roads.dataProvider().addAttributes([QgsField("name", QVariant.String)])
+    roads.updateFields()
+    features = []
+    for i, name in enumerate(["A", "B", "C"]):
+        feature = QgsFeature(roads.fields())
+        feature["name"] = name
+        feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(i, 0), QgsPointXY(i, 10)]))
+        features.append(feature)
+    ok, features = roads.dataProvider().addFeatures(features)
+    assert ok
+
+    labels = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    labels.dataProvider().addAttributes(labeling_fields().toList())
+    labels.updateFields()
+    new_features = [create_new_feature(labels, "old", '"name"', f"Roads.{f.id()}", [], QgsPointXY(0, 0))
+                    for f in features]
+    # broken reference and manual label
+    new_features.append(create_new_feature(labels, "old", '"name"', "Roads.999", [], QgsPointXY(0, 0)))
+    new_features.append(create_new_feature(labels, "manual text", "", None, [], QgsPointXY(0, 0)))
+    ok, _ = labels.dataProvider().addFeatures(new_features)
+    assert ok
+
+    project.addMapLayers([roads, labels])
+    yield project, roads, labels
+    clear_checkpoint(labels)
+    project.clear()
+
+
+def _texts(layer):
+    return {f.id(): f["Text"] for f in layer.getFeatures()}
+
+
+def test_refresh_skips_manual_labels(layers):
+    project, roads, labels = layers
+    result = refresh_labels(labels, project=project)
+
+    assert result.updated == 3
+    assert result.manual == 1
+    assert len(result.broken) == 1
+    assert sorted(_texts(labels).values()) == ["A", "B", "C", "manual text", "old"]
+
+
+def test_refresh_dry_run_writes_nothing(layers):
+    project, roads, labels = layers
+    before = _texts(labels)
+    result = refresh_labels(labels, dry_run=True, project=project)
+
+    assert result.stale == 3
+    assert _texts(labels) == before
+    assert load_checkpoint(labels) is None
+
+
+def test_remaining_fids_are_sorted_and_filtered(layers):
+    project, roads, labels = layers
+    fids = remaining_fids(labels, '"Text" = \'old\'', after_fid=1)
+
+    assert fids == sorted(f.id() for f in labels.getFeatures() if f["Text"] == "old" and f.id() > 1)
+
+
+def test_chunk_request_has_no_order_by(layers):
+    project, roads, labels = layers
+    fids = remaining_fids(labels)
+    request = refresh_request(labels.fields(), fids[:2])
+
+    assert not request.orderBy()
+    assert sorted(f.id() for f in labels.getFeatures(request)) == fids[:2]
+
+
+def test_chunks_checkpoint_on_window_bound(layers):
+    project, roads, labels = layers
+    fids = remaining_fids(labels)
+    # a deleted feature inside a window does not move its bound
+    labels.dataProvider().deleteFeatures([fids[1]])
+
+    chunks = list(iter_refresh_chunks(labels, labels.fields(), fids, 2))
+
+    assert [last_fid for _, last_fid in chunks] == [fids[1], fids[3], fids[4]]
+    assert [len(features) for features, _ in chunks] == [1, 2, 1]
+
+
+def test_resumed_filtered_run_reports_progress(layers):
+    project, roads, labels = layers
+    first = min(f.id() for f in labels.getFeatures())
+    save_checkpoint(labels, '"Text" = \'old\'', first)
+    feedback = QgsFeedback()
+
+    result = refresh_labels(labels, '"Text" = \'old\'', chunk_size=1, resume=True, feedback=feedback,
+                            project=project)
+
+    assert result.resumed
+    assert feedback.progress() == 100
+
+
+def test_resume_starts_after_checkpoint(layers):
+    project, roads, labels = layers
+    first = min(f.id() for f in labels.getFeatures())
+    save_checkpoint(labels, None, first)
+
+    result = refresh_labels(labels, resume=True, project=project)
+
+    assert result.resumed
+    assert _texts(labels)[first] == "old"
+    assert result.updated == 2
+    # complete runs remove their checkpoint
+    assert load_checkpoint(labels) is None
+
+
+def test_chunked_run_ends_at_highest_feature_id(layers):
+    project, roads, labels = layers
+    result = refresh_labels(labels, chunk_size=2, project=project)
+
+    assert not result.errors
+    assert result.last_fid == max(f.id() for f in labels.getFeatures())
+
+
+def test_force_ignores_fingerprint(layers):
+    project, roads, labels = layers
+    refresh_labels(labels, project=project)
+    label_fid = next(f.id() for f in labels.getFeatures() if f["Text"] == "A")
+    labels.dataProvider().changeAttributeValues({label_fid: {labels.fields().lookupField("Text"): "edited"}})
+
+    result = refresh_labels(labels, project=project)
+    assert result.updated == 0
+    assert _texts(labels)[label_fid] == "edited"
+
+    result = refresh_labels(labels, project=project, force=True)
+    assert result.updated == 1
+    assert _texts(labels)[label_fid] == "A"
+
+
+def test_failed_text_gets_no_fingerprint(layers):
+    project, roads, labels = layers
+    expression_index = labels.fields().lookupField("Expression")
+    label_fid = next(f.id() for f in labels.getFeatures() if f["Reference"] == "Roads.1")
+    labels.dataProvider().changeAttributeValues({label_fid: {expression_index: 'to_int("name")'}})
+
+    result = refresh_labels(labels, project=project)
+
+    assert result.expression_errors
+    assert labels.getFeature(label_fid)["Fingerprint"] in (None, NULL)
+    assert all(f["Fingerprint"] for f in labels.getFeatures() if f["Reference"] in ("Roads.2", "Roads.3"))
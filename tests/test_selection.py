@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsProject, QgsVectorLayer
+
+from easy_labeling.utilities.functions import create_new_feature, labeling_fields
+from easy_labeling.utilities.selection import SelectionTask
+
+
+@pytest.fixture
+def layers(qgis_app):
+    """ "Roads" with one line and labels with two, one and no leader targets, the last with broken reference """
+    project = QgsProject.instance()
+    roads = QgsVectorLayer("LineString?crs=EPSG:25832", "Roads", "memory")
+    road = QgsFeature(roads.fields())
+    road.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(0, 0), QgsPointXY(0, 10)]))
+    ok, (road,) = roads.dataProvider().addFeatures([road])
+    assert ok
+
+    labels = QgsVectorLayer("Point?crs=EPSG:25832", "Labels", "memory")
+    labels.dataProvider().addAttributes(labeling_fields().toList())
+    labels.updateFields()
+    features = [
+        create_new_feature(labels, "", '"name"', f"Roads.{road.id()}", [QgsPointXY(1, 1), QgsPointXY(2, 2)],
+                           QgsPointXY(5, 5)),
+        create_new_feature(labels, "", '"name"', f"Roads.{road.id()}", [QgsPointXY(3, 3)], QgsPointXY(5, 5)),
+        create_new_feature(labels, "", '"name"', "Roads.999", [], QgsPointXY(5, 5)),
+    ]
+    ok, features = labels.dataProvider().addFeatures(features)
+    assert ok
+
+    project.addMapLayers([roads, labels])
+    yield roads, road, labels, [f.id() for f in features]
+    project.removeMapLayers([roads.id(), labels.id()])
+
+
+def _run(task: SelectionTask):
+    result = task.run()
+    task.finished(result)
+    return task.result
+
+
+def test_leader_targets_of_all_selected(layers):
+    roads, road, labels, fids = layers
+    result = _run(SelectionTask(labels, fids))
+
+    assert len(result.lines) == 3
+    assert sorted(p.x() for p in result.targets) == [1, 2, 3]
+    assert result.references == {}
+
+
+def test_references_are_resolved_only_when_requested(layers):
+    roads, road, labels, fids = layers
+    result = _run(SelectionTask(labels, fids, resolve=[fids[0], fids[2]]))
+
+    layer, feature = result.references[fids[0]]
+    assert layer is roads
+    assert feature.id() == road.id()
+    assert result.references[fids[2]] is None
+    assert fids[1] not in result.references
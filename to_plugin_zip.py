@@ -34,7 +34,9 @@ def build(zip_file_name, repo_location, destination_zip_file):
     ignore_paths = [
         # root folder
         ".idea", ".editorconfig", ".gitignore", ".gitignore", ".git", ".vscode",
-        ".mypy_cache"
+        ".mypy_cache",
+        # development only
+        "benchmarks", "generate_labels.py", "tests"
     ]
 
     p = os.path.dirname(__file__)
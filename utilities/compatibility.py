@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import QgsMapLayer, QgsVectorLayer
+
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from easy_labeling.utilities.functions import is_labeling_layer
+
+
+class LayerCompatibility:
+    """ Caches per layer id, if a vector layer is a compatible labeling layer.
+        Layers are only checked when added or when their fields changed, so layer signals of large
+        projects do not check all layers again.
+
+        .. code-block:: python
+
+            compatibility = LayerCompatibility()
+            if compatibility.add(QgsProject.instance().mapLayers().values()):
+                labeling_ids, reference_ids = compatibility.excepted_ids()
+
+        :param check: returns True for compatible labeling layers, defaults to `is_labeling_layer`
+    """
+
+    def __init__(self, check: Optional[Callable[[QgsVectorLayer], bool]] = None):
+        self.check = check or is_labeling_layer
+        # layer id -> compatible labeling layer, only vector layers
+        self._layers: Dict[str, bool] = {}
+        # excepted ids returned by last `excepted_ids`
+        self._excepted: Tuple[Tuple[str, ...], Tuple[str, ...]] = ((), ())
+
+    def __contains__(self, layer_id: str) -> bool:
+        return layer_id in self._layers
+
+    def is_compatible(self, layer_id: str) -> Optional[bool]:
+        """ Returns the cached compatibility, None for unknown layers """
+        return self._layers.get(layer_id)
+
+    def add(self, layers: Iterable[QgsMapLayer]) -> bool:
+        """ Checks new vector layers, other layers are ignored.
+
+            :return: True, if the cache changed
+        """
+        changed = False
+        for layer in layers:
+            if not isinstance(layer, QgsVectorLayer):
+                continue
+
+            changed = self.update(layer) or changed
+
+        return changed
+
+    def update(self, layer: QgsVectorLayer) -> bool:
+        """ Checks a layer again, e.g. after its fields changed.
+
+            :return: True, if the compatibility changed
+        """
+        compatible = self.check(layer)
+        if self._layers.get(layer.id()) == compatible:
+            return False
+
+        self._layers[layer.id()] = compatible
+        return True
+
+    def remove(self, layer_ids: Iterable[str]) -> bool:
+        """ Forgets removed layers.
+
+            :return: True, if the cache changed
+        """
+        changed = False
+        for layer_id in layer_ids:
+            changed = self._layers.pop(layer_id, None) is not None or changed
+
+        return changed
+
+    def excepted_ids(self) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """ Returns ids of incompatible labeling layers and of compatible labeling layers,
+            which are no reference layers. Returns None, if both are unchanged since the last call.
+        """
+        labeling_ids = tuple(layer_id for layer_id, ok in self._layers.items() if not ok)
+        reference_ids = tuple(layer_id for layer_id, ok in self._layers.items() if ok)
+        if (labeling_ids, reference_ids) == self._excepted:
+            return None
+
+        self._excepted = (labeling_ids, reference_ids)
+        return self._excepted
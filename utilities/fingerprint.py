@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import hashlib
+
+from functools import lru_cache
+
+from qgis.core import QgsExpression, QgsFeature, QgsFeatureRequest, QgsField, QgsFields, QgsVectorLayer
+from qgis.PyQt.QtCore import QVariant
+
+from typing import Any, Dict, Optional, Tuple
+
+
+# Fingerprint of the inputs a label text was built from, stored in the optional "Fingerprint" field:
+# expression, values of the columns it references and the geometry, when the expression uses it.
+# Labels with an equal fingerprint do not need to be evaluated again, see `utilities.refresh`.
+# Expressions with other inputs, see `is_deterministic`, have no fingerprint and are always evaluated.
+FINGERPRINT_FIELD = QgsField("Fingerprint", QVariant.String)
+
+# functions whose result only depends on their arguments and the referenced feature
+DETERMINISTIC_FUNCTIONS = frozenset({
+    # conditions and conversion
+    "if", "coalesce", "nullif", "is_empty", "is_empty_or_null", "try",
+    "to_string", "to_int", "to_real", "to_date", "to_datetime", "to_time", "to_interval",
+    # strings
+    "lower", "upper", "title", "trim", "ltrim", "rtrim", "concat", "substr", "left", "right", "replace",
+    "regexp_replace", "regexp_substr", "regexp_match", "regexp_matches", "strpos", "length", "format",
+    "format_number", "format_date", "lpad", "rpad", "wordwrap", "char", "ascii", "unaccent",
+    # maths
+    "abs", "round", "floor", "ceil", "min", "max", "sqrt", "exp", "ln", "log", "log10", "pi", "clamp",
+    "scale_linear", "sin", "cos", "tan", "asin", "acos", "atan", "atan2", "radians", "degrees",
+    # arrays, maps and json
+    "array", "array_get", "array_length", "array_to_string", "array_foreach", "array_filter", "array_first",
+    "array_last", "array_contains", "string_to_array", "map", "map_get", "from_json", "to_json",
+    # feature and variables of the expression itself
+    "attribute", "attributes", "with_variable", "$id", "$geometry",
+    # geometry of the feature, planar measures only: $length, $area and $perimeter depend on
+    # the ellipsoid and units of the project
+    "$x", "$y", "length", "area", "perimeter", "x", "y",
+    "x_min", "x_max", "y_min", "y_max", "centroid", "point_on_surface", "num_points", "num_geometries",
+    "start_point", "end_point", "geom_to_wkt", "azimuth", "line_interpolate_point", "make_point",
+})
+# variables of the feature context, all other variables, e.g. of project or layer, are inputs as well
+FEATURE_VARIABLES = frozenset({"feature", "id", "geometry", "fields", "element", "counter", "parent"})
+
+
+def has_fingerprint_field(fields: QgsFields) -> bool:
+    return fields.lookupField(FINGERPRINT_FIELD.name()) >= 0
+
+
+def add_fingerprint_field(layer: QgsVectorLayer) -> bool:
+    """ Adds the "Fingerprint" field to a labeling layer. Existing labels have no fingerprint
+        and are evaluated on their next refresh.
+
+        :return: True, if the field exists afterwards
+    """
+    provider = layer.dataProvider()
+    if has_fingerprint_field(provider.fields()):
+        return True
+
+    if not provider.addAttributes([QgsField(FINGERPRINT_FIELD)]):
+        return False
+
+    layer.updateFields()
+    return True
+
+
+def label_fingerprint(feature: QgsFeature, expression: str) -> Optional[str]:
+    """ Returns the fingerprint of a referenced feature for a label expression,
+        None for expressions with inputs outside of the feature, see `is_deterministic`.
+        Thread safe, does not access any layer.
+
+        :param feature: referenced feature
+        :param expression: label expression
+    """
+    if not is_deterministic(expression):
+        return None
+
+    columns, needs_geometry = expression_inputs(expression)
+    fields = feature.fields()
+    if columns is None:
+        names = sorted(fields.names())
+    else:
+        names = [name for name in columns if fields.lookupField(name) >= 0]
+
+    digest = hashlib.sha1(expression.encode("utf-8"))
+    for name in names:
+        digest.update(f"\x1f{name}={feature[name]!r}".encode("utf-8"))
+
+    if needs_geometry:
+        geometry = feature.geometry()
+        digest.update(b"\x1e")
+        if not geometry.isNull():
+            digest.update(bytes(geometry.asWkb()))
+
+    return digest.hexdigest()
+
+
+def fingerprint_values(fields: QgsFields, feature: Optional[QgsFeature], expression: str,
+                       evaluated: bool = True) -> Dict[str, Any]:
+    """ Attribute values by field name for storing the fingerprint, empty without "Fingerprint" field.
+
+        :param fields: labeling layer fields
+        :param feature: referenced feature, None for labels without reference
+        :param expression: label expression
+        :param evaluated: False, when evaluating the label text failed, no fingerprint is stored then
+    """
+    if not has_fingerprint_field(fields):
+        return {}
+
+    if feature is None or not expression or not evaluated:
+        return {FINGERPRINT_FIELD.name(): None}
+
+    return {FINGERPRINT_FIELD.name(): label_fingerprint(feature, expression)}
+
+
+@lru_cache(maxsize=256)
+def is_deterministic(expression: str) -> bool:
+    """ Checks, if an expression only depends on the referenced feature:
+        only `DETERMINISTIC_FUNCTIONS` and `FEATURE_VARIABLES` are used.
+        E.g. `aggregate`, `get_feature`, `now` or project variables are other inputs.
+    """
+    expr = QgsExpression(expression)
+    if expr.hasParserError():
+        return False
+
+    if any(name.lower() not in DETERMINISTIC_FUNCTIONS for name in expr.referencedFunctions()):
+        return False
+
+    return all(not name or name in FEATURE_VARIABLES for name in expr.referencedVariables())
+
+
+@lru_cache(maxsize=256)
+def expression_inputs(expression: str) -> Tuple[Optional[Tuple[str, ...]], bool]:
+    """ Referenced column names, None for all columns, and whether the geometry is used.
+        Expressions with other inputs, see `is_deterministic`, use all columns and the geometry.
+    """
+    if not is_deterministic(expression):
+        return None, True
+
+    expr = QgsExpression(expression)
+    columns = expr.referencedColumns()
+    if QgsFeatureRequest.ALL_ATTRIBUTES in columns:
+        return None, True
+
+    return tuple(sorted(columns)), expr.needsGeometry()
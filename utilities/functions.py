@@ -18,20 +18,27 @@ import os.path
 
 from pathlib import Path
 
-from qgis.core import (QgsVectorLayer, QgsFeature, QgsExpression,
-                       QgsExpressionContextUtils, QgsTriangle, QgsPointXY,
-                       QgsField, QgsVectorFileWriter, QgsWkbTypes,
-                       QgsCoordinateTransform, QgsProject,
-                       QgsGeometry, QgsCoordinateReferenceSystem)
+from qgis.core import (QgsVectorLayer, QgsFeature, QgsTriangle, QgsPointXY,
+                       QgsField, QgsFields, QgsVectorFileWriter, QgsWkbTypes,
+                       QgsCoordinateTransform, QgsProject, QgsDistanceArea,
+                       QgsGeometry, QgsCoordinateReferenceSystem, QgsFeatureSource,
+                       QgsVectorDataProvider)
 from qgis.PyQt.QtCore import QVariant
 
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union
 
 from easy_labeling.submodules.qgis.geometry.functions import get_distance_area
 from easy_labeling.submodules.qgis.geometry.line import get_polyline, is_point_in_polylist
-from easy_labeling.submodules.qgis.geometry.transform import transform_geometry
-from easy_labeling.submodules.qgis.tools.poly_line_wrapper import PolylineWrapper
+from easy_labeling.submodules.qgis.geometry.placement import pack_lines, place_on_lines, distance_area_measure
+from easy_labeling.submodules.qgis.geometry.transform import transform_geometry, get_transform
+from easy_labeling.submodules.qgis.tools.poly_line_wrapper import PolylineArray
+from easy_labeling.submodules.qgis.tools.expression_cache import ExpressionCache, get_thread_cache
 from easy_labeling.submodules.qgis.constants import EPSILON, EPSILON_METRES
+from easy_labeling.utilities.gpkg import gpkg_uri
+from easy_labeling.utilities.fingerprint import FINGERPRINT_FIELD, fingerprint_values
+from easy_labeling.utilities.leaders import LEADERS_FIELD, leader_values
+from easy_labeling.utilities.reference_index import ReferenceIndex
+from easy_labeling.utilities.references import parse_reference
 
 
 FIELDS = [
@@ -39,6 +46,7 @@ FIELDS = [
         QgsField("Text", QVariant.String),
         # list of points [[x, y], [x, y]]
         # per point an arrow from features point
+        # layers with the optional "Leaders" field store them there, see `utilities.leaders`
         QgsField("Points", QVariant.String),
         # expression to evaluate on reference feature
         QgsField("Expression", QVariant.String),
@@ -46,6 +54,82 @@ FIELDS = [
         QgsField("Reference", QVariant.String),
 ]
 
+# fields with attribute index on new labeling layers, used for reference lookups
+INDEXED_FIELDS = ["Reference", "Expression"]
+
+# offset in meters of generated labeling points from the center of their line
+DEFAULT_OFFSET = 10
+
+
+def labeling_fields() -> QgsFields:
+    """ Fields of new labeling layers: `FIELDS` and the optional "Leaders" and "Fingerprint" fields """
+    fields = QgsFields()
+    for field in FIELDS + [LEADERS_FIELD, FINGERPRINT_FIELD]:
+        fields.append(QgsField(field))
+
+    return fields
+
+
+def is_labeling_layer(layer: QgsVectorLayer) -> bool:
+    """ Checks, if a layer has all labeling `FIELDS` """
+    if not isinstance(layer, QgsVectorLayer) or layer.dataProvider() is None:
+        return False
+
+    names = layer.dataProvider().fields().names()
+    for field in FIELDS:
+        if field.name() not in names:
+            return False
+
+    return True
+
+
+class GenerationContext:
+    """ Snapshot of all layer information needed to generate new labeling features.
+        Create it in the main thread, afterwards it can be used without accessing any layer,
+        e.g. in a `QgsTask`.
+
+        :param source_layer: source layer
+        :param dest_layer: destination layer
+        :param expression: expression to evaluate on source features
+        :param offset: offset in meters from centroid point feature
+    """
+
+    def __init__(self, source_layer: QgsVectorLayer, dest_layer: QgsVectorLayer, expression: str,
+                 offset: Optional[float] = None):
+        self._setup(source_layer.name(), source_layer.dataProvider().crs(), dest_layer.dataProvider().crs(),
+                    dest_layer.fields(), expression, offset)
+
+    @classmethod
+    def create(cls, source_name: str, source_crs: QgsCoordinateReferenceSystem,
+               dest_crs: QgsCoordinateReferenceSystem, dest_fields: QgsFields, expression: str,
+               offset: Optional[float] = None) -> 'GenerationContext':
+        """ Creates a context without layers, e.g. for processing feature sources and sinks.
+
+            :param source_name: layer name written to "Reference"
+            :param source_crs: crs of source features
+            :param dest_crs: crs of labeling features
+            :param dest_fields: fields of labeling features
+        """
+        context = cls.__new__(cls)
+        context._setup(source_name, source_crs, dest_crs, dest_fields, expression, offset)
+        return context
+
+    def _setup(self, source_name: str, source_crs: QgsCoordinateReferenceSystem,
+               dest_crs: QgsCoordinateReferenceSystem, dest_fields: QgsFields, expression: str,
+               offset: Optional[float]):
+        self.source_name = source_name
+        self.source_crs = QgsCoordinateReferenceSystem(source_crs)
+        self.dest_crs = QgsCoordinateReferenceSystem(dest_crs)
+        self.dest_fields = QgsFields(dest_fields)
+        self.expression = expression
+        self.offset = offset
+        self.transform = get_transform(self.source_crs, self.dest_crs)
+        self.area = get_distance_area(self.dest_crs)
+        # prepared expressions, owned by the thread using this context
+        self.expressions = ExpressionCache()
+        # optional `PlacementCache`, used by `generate_from_snapshots`
+        self.cache = None
+
 
 def get_new_position(source_layer: QgsVectorLayer, feature: QgsFeature, dest_layer: QgsVectorLayer,
                      offset: Optional[float] = None) -> Optional[QgsPointXY]:
@@ -68,8 +152,24 @@ def get_new_position(source_layer: QgsVectorLayer, feature: QgsFeature, dest_lay
                               dest_layer.dataProvider().crs())
     area = get_distance_area(dest_crs)
 
+    return get_position(geom, dest_crs, area, offset)
+
+
+def get_position(geom: QgsGeometry, dest_crs: QgsCoordinateReferenceSystem, area: QgsDistanceArea,
+                 offset: Optional[float] = None) -> Optional[QgsPointXY]:
+    """ Returns new point position from a geometry in destination crs.
+        See `get_new_position`.
+
+        :param geom: geometry in destination crs
+        :param dest_crs: destination crs
+        :param area: distance area object for destination crs
+        :param offset: offset in meters from centroid point feature
+    """
     epsilon = EPSILON if dest_crs.isGeographic() else EPSILON_METRES
 
+    if geom.isNull() or geom.isEmpty():
+        return None
+
     if geom.type() == QgsWkbTypes.PointGeometry:
         if geom.isMultipart():
             return geom.asMultiPoint()[0]
@@ -83,8 +183,8 @@ def get_new_position(source_layer: QgsVectorLayer, feature: QgsFeature, dest_lay
     if not poly:
         return None
 
-    wrapper = PolylineWrapper.from_point_list(poly)
-    center_on_line = wrapper.insert_point_in_line(wrapper.length() / 2)
+    line = PolylineArray(poly)
+    center_on_line = line.point_at_distance(line.length() / 2)
     if offset is None or offset == 0:
         point = center_on_line
     else:
@@ -96,101 +196,224 @@ def get_new_position(source_layer: QgsVectorLayer, feature: QgsFeature, dest_lay
 
         triangle = QgsTriangle(start, end, center_on_line)
         points = [[QgsPointXY(c) for c in a] for a in triangle.altitudes()]
-        altitude = [a for a in points if is_point_in_polylist(center_on_line, a, epsilon)][0]
+        altitudes = [a for a in points if is_point_in_polylist(center_on_line, a, epsilon)]
+        if not altitudes:
+            # start, end and center are collinear, no offset direction available
+            return center_on_line
+
+        altitude = altitudes[0]
         distance = center_on_line.distance(altitude[1])  # relative distance
         length = area.measureLine(center_on_line, altitude[1])  # distance in meters
+        if not length:
+            return center_on_line
 
         factor = distance / length
         new_distance = factor * offset
         point = center_on_line.project(new_distance, center_on_line.azimuth(altitude[1]))
 
-    """# add found poly line to project as memory layer
-    layer = QgsVectorLayer(f"LineString?crs={dest_crs.authid()}", "test", "memory")
-    f = QgsFeature()
-    f.setGeometry(QgsGeometry.fromPolylineXY([center_on_line, point]))
-    layer.dataProvider().addFeatures([f])
-    QgsProject.instance().addMapLayer(layer)"""
-
     return point
 
 
 def generate_from_feature(source_layer: QgsVectorLayer, feature: QgsFeature, expression: str, dest_layer: QgsVectorLayer,
-                          offset: Optional[float] = None) -> Optional[QgsFeature]:
+                          offset: Optional[float] = None,
+                          context: Optional[GenerationContext] = None) -> Optional[QgsFeature]:
     """ Creates a new point feature from given line feature.
         Only valid for LineString geometries. Multitype not allowed/possible.
 
+        Creating the context sets up transformation, distance area and expression cache.
+        Pass one context for many features of the same layers and expression.
+
         :param layer: source layer
         :param feature: source feature
         :param expression: expression to evaluate on feature
         :param dest_layer: destination layer
         :param offset: offset in meters from centroid point feature
+        :param context: optional context of `source_layer`, `dest_layer`, `expression` and `offset`
+    """
+    if context is None:
+        context = GenerationContext(source_layer, dest_layer, expression, offset)
+    return generate_from_snapshot(context, feature)
+
+
+def generate_from_snapshot(context: GenerationContext, feature: QgsFeature) -> Optional[QgsFeature]:
+    """ Creates a new point feature from given feature and generation context.
+        Does not access any layer, safe to call from worker threads.
+
+        :param context: generation context
+        :param feature: source feature
     """
     # gets text from feature
-    text = get_label_text(feature, expression)
+    text = get_label_text(feature, context.expression, context.expressions)
+    evaluated = not context.expressions.last_error
+
+    geom = QgsGeometry(feature.geometry())
+    geom.transform(context.transform)
 
-    point = get_new_position(source_layer, feature, dest_layer, offset)
+    point = get_position(geom, context.dest_crs, context.area, context.offset)
     if point is None:
         return None
-    geom = transform_geometry(feature.geometry(),
-                              source_layer.dataProvider().crs(),
-                              dest_layer.dataProvider().crs())
 
-    if geom.type() == QgsWkbTypes.LineGeometry:
-        poly = get_polyline(geom)
-        start = poly[0]
-        end = poly[-1]
+    return _create_from_position(context, feature, get_leader_targets(geom), point, text, evaluated)
+
+
+def generate_from_snapshots(context: GenerationContext, features: List[QgsFeature]) -> List[Optional[QgsFeature]]:
+    """ Creates new point features like `generate_from_snapshot` for many features at once.
+        Positions on lines are computed together, see `get_positions`.
+        With a placement cache on the context only geometries without cached placement are computed.
+
+        :param context: generation context
+        :param features: source features
+        :return: new feature or None for each source feature
+    """
+    if context.cache is not None:
+        prefix = context.cache.key_prefix(context.source_crs, context.dest_crs, context.offset)
+        keys = [context.cache.key(prefix, feature) for feature in features]
+        placements = context.cache.lookup(keys)
     else:
-        start = None
-        end = None
+        keys = [None] * len(features)
+        placements = {}
+
+    missing = [i for i, key in enumerate(keys) if key not in placements]
+    geoms = []
+    for i in missing:
+        geom = QgsGeometry(features[i].geometry())
+        geom.transform(context.transform)
+        geoms.append(geom)
+
+    points = get_positions(geoms, context.dest_crs, context.area, context.offset)
+    computed = {}
+    for i, geom, point in zip(missing, geoms, points):
+        computed[i] = (point, get_leader_targets(geom) if point is not None else [])
+
+    if context.cache is not None:
+        context.cache.store({keys[i]: placement for i, placement in computed.items()})
+
+    new_features = []
+    for i, feature in enumerate(features):
+        point, targets = computed[i] if i in computed else placements[keys[i]]
+        if point is None:
+            new_features.append(None)
+            continue
+
+        text = get_label_text(feature, context.expression, context.expressions)
+        evaluated = not context.expressions.last_error
+        new_features.append(_create_from_position(context, feature, targets, point, text, evaluated))
+
+    return new_features
+
+
+def get_positions(geoms: List[QgsGeometry], dest_crs: QgsCoordinateReferenceSystem, area: QgsDistanceArea,
+                  offset: Optional[float] = None) -> List[Optional[QgsPointXY]]:
+    """ Returns new point positions like `get_position` for many geometries.
+        All line geometries are placed at once with `place_on_lines`.
+
+        :param geoms: geometries in destination crs
+        :param dest_crs: destination crs
+        :param area: distance area object for destination crs
+        :param offset: offset in meters from centroid point feature
+    """
+    positions: List[Optional[QgsPointXY]] = [None] * len(geoms)
+    line_indexes = []
+    lines = []
 
+    for i, geom in enumerate(geoms):
+        if not geom.isNull() and not geom.isEmpty() and geom.type() == QgsWkbTypes.LineGeometry:
+            line_indexes.append(i)
+            lines.append(get_polyline(geom))
+        else:
+            positions[i] = get_position(geom, dest_crs, area, offset)
+
+    if not lines:
+        return positions
+
+    epsilon = EPSILON if dest_crs.isGeographic() else EPSILON_METRES
+    coords, offsets = pack_lines(lines)
+    points, valid = place_on_lines(coords, offsets, offset, distance_area_measure(area), epsilon)
+
+    for i, (x, y), ok in zip(line_indexes, points.tolist(), valid.tolist()):
+        if ok:
+            positions[i] = QgsPointXY(x, y)
+
+    return positions
+
+
+def get_leader_targets(geom: QgsGeometry) -> List[QgsPointXY]:
+    """ Returns the leader targets of a generated labeling point: start and end vertex of lines,
+        none for other geometries.
+
+        :param geom: geometry in destination crs
+    """
+    if geom.isNull() or geom.isEmpty() or geom.type() != QgsWkbTypes.LineGeometry:
+        return []
+
+    poly = get_polyline(geom)
+    if not poly:
+        return []
+
+    return [poly[0], poly[-1]]
+
+
+def _create_from_position(context: GenerationContext, feature: QgsFeature, targets: List[QgsPointXY],
+                          point: QgsPointXY, text: str, evaluated: bool = True) -> QgsFeature:
+    # failed texts get no fingerprint, so a refresh evaluates them again
     new_feature = create_new_feature(
-        dest_layer,
+        context.dest_fields,
         text,
-        expression,
-        f"{source_layer.name()}.{feature.id()}",
-        [[start], [end]] if start else [],
-        point
+        context.expression,
+        f"{context.source_name}.{feature.id()}",
+        targets,
+        point,
+        feature if evaluated else None
     )
 
     return new_feature
 
 
-def create_new_feature(dest_layer: QgsVectorLayer, text: str, expression: str,
-                       reference: Optional[str], points: List[List[QgsPointXY]],
-                       point: QgsPointXY):
-    """ Create a new labeling feature from given attributes. """
+def create_new_feature(dest_layer: Union[QgsVectorLayer, QgsFields], text: str, expression: str,
+                       reference: Optional[str], points: List[QgsPointXY],
+                       point: QgsPointXY, reference_feature: Optional[QgsFeature] = None):
+    """ Create a new labeling feature from given attributes.
+        `dest_layer` can be the labeling layer or its fields.
+        `points` are the leader targets, see `utilities.leaders.leader_values`.
+        `reference_feature` is the referenced feature for the fingerprint, see `utilities.fingerprint`.
+    """
+    fields = dest_layer if isinstance(dest_layer, QgsFields) else dest_layer.fields()
 
-    new_feature = QgsFeature(dest_layer.fields())
+    new_feature = QgsFeature(fields)
     new_feature['Text'] = text
     new_feature['Expression'] = expression
     new_feature['Reference'] =reference
-    new_feature['Points'] = str([[p.toString(8) for p in part] for part in points])
+    for name, value in leader_values(fields, points).items():
+        new_feature[name] = value
+    for name, value in fingerprint_values(fields, reference_feature, expression).items():
+        new_feature[name] = value
     new_feature.setGeometry(QgsGeometry.fromPointXY(point))
 
     return new_feature
 
 
-def get_label_text(feature: QgsFeature, expression: str) -> str:
-    """ Gets evaluated text from given feature """
-
-    context = QgsExpressionContextUtils.createFeatureBasedContext(
-        feature, feature.fields())
-    expression = QgsExpression(expression)
-    result = expression.evaluate(context)
+def get_label_text(feature: QgsFeature, expression: str, cache: Optional[ExpressionCache] = None) -> str:
+    """ Gets evaluated text from given feature.
+        Prepared expressions are reused from `cache`, defaults to the cache of the current thread.
+        On errors None is returned, the error message is stored in `cache.errors`,
+        see `ExpressionCache.pop_errors` for the cache of the current thread.
+    """
+    if cache is None:
+        cache = get_thread_cache()
 
-    return result
+    return cache.evaluate(feature, expression)
 
 
 def create_new_layer(location: str, crs: QgsCoordinateReferenceSystem):
     name = os.path.basename(location)
     layer = QgsVectorLayer(f"Point?crs={crs.authid()}", name, "memory")
-    layer.dataProvider().addAttributes(FIELDS)
+    layer.dataProvider().addAttributes(labeling_fields().toList())
     layer.updateFields()
 
     options = QgsVectorFileWriter.SaveVectorOptions()
     options.driverName = "GPKG"
     # create options, list.append does not work on empty/default layerOptions
-    options.layerOptions = ["GEOMETRY_NULLABLE=NO"]
+    options.layerOptions = ["GEOMETRY_NULLABLE=NO", "SPATIAL_INDEX=YES"]
     options.layerName = layer.name()
     options.overrideGeometryType = QgsWkbTypes.Point
     options.forceMulti = False
@@ -211,49 +434,73 @@ def create_new_layer(location: str, crs: QgsCoordinateReferenceSystem):
         options
     )
 
+    layer = QgsVectorLayer(gpkg_uri(location, name), name, "ogr")
+    setup_new_layer(layer)
+
+    return layer
+
+
+def setup_new_layer(layer: QgsVectorLayer, project: Optional[QgsProject] = None):
+    """ Applies the default style and creates the indexes of a new labeling layer,
+        the reference index only for layers in a GeoPackage.
+
+        :param layer: new labeling layer, may already contain features
+        :param project: project to look up referenced layers, defaults to `QgsProject.instance()`
+    """
     style = str(Path(__file__).parent.parent / "templates" / "default_style.qml")
-    layer = QgsVectorLayer(location, name, "ogr")
     layer.loadNamedStyle(style)
+    create_indexes(layer)
 
-    return layer
+    reference_index = ReferenceIndex.for_layer(layer)
+    if reference_index is not None:
+        reference_index.rebuild(layer, project)
+        reference_index.close()
 
 
-def get_reference_data(point_feature) -> Optional[Tuple[QgsVectorLayer, QgsFeature]]:
-    reference = point_feature['Reference']
-    if not isinstance(reference, str):
-        return None
+def create_indexes(layer: QgsVectorLayer) -> List[str]:
+    """ Creates the spatial index and attribute indexes on `INDEXED_FIELDS`.
+        Existing indexes are kept.
 
-    if "." not in reference:
-        return None
+        :param layer: labeling layer
+        :return: names of indexes the provider could not create
+    """
+    provider = layer.dataProvider()
+    capabilities = provider.capabilities()
+    failed = []
+
+    if provider.hasSpatialIndex() != QgsFeatureSource.SpatialIndexPresent:
+        if not capabilities & QgsVectorDataProvider.CreateSpatialIndex or not provider.createSpatialIndex():
+            failed.append("Geometrie")
+
+    for name in INDEXED_FIELDS:
+        index = provider.fields().lookupField(name)
+        if index < 0:
+            continue
 
-    splitted = reference.split(".")
-    if len(splitted) != 2:
+        if not capabilities & QgsVectorDataProvider.CreateAttributeIndex or not provider.createAttributeIndex(index):
+            failed.append(name)
+
+    return failed
+
+
+def get_reference_data(point_feature) -> Optional[Tuple[QgsVectorLayer, QgsFeature]]:
+    """ Returns referenced layer and feature from a labeling feature.
+        To resolve many labeling features use `ReferenceResolver` instead.
+    """
+    parsed = parse_reference(point_feature['Reference'])
+    if parsed is None:
         return None
 
-    name, fid = splitted
+    name, fid = parsed
 
     layers = QgsProject.instance().mapLayersByName(name)
 
     if len(layers) != 1:
         return None
 
-    if not fid.isdigit():
-        return None
-
-    fid = int(fid)
-
     layer = layers[0]
     feature = layer.getFeature(fid)
     if not feature.isValid():
         return None
 
     return layer, feature
-
-
-if __name__ in ("__main__", "__console__"):
-    layer = iface.activeLayer()
-    dest_layer = QgsProject.instance().mapLayersByName("Punkte")[0]
-    for sf in layer.selectedFeatures():
-        f = generate_from_feature(layer, sf, """'osm_id: ' || "osm_id" """, dest_layer, 10)
-        if f:
-            dest_layer.dataProvider().addFeatures([f])
\ No newline at end of file
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+import threading
+
+from qgis.core import (QgsVectorLayer, QgsFeature, QgsFeedback, QgsTask, QgsProject, QgsFeatureRequest,
+                       QgsExpression, QgsRectangle, QgsVectorLayerFeatureSource, QgsFeatureSource)
+from qgis.PyQt.QtCore import pyqtSignal
+
+from typing import Optional, List, Iterable, Iterator, Tuple, Dict, Union
+
+from easy_labeling.utilities.functions import GenerationContext, generate_from_snapshots
+from easy_labeling.utilities.placement_cache import PlacementCache
+from easy_labeling.utilities.reference_index import ReferenceIndex, reference_entry
+
+
+# features per provider call, each call is one transaction on GeoPackages
+DEFAULT_CHUNK_SIZE = 1000
+# source features placed together, see `get_positions`
+PLACEMENT_CHUNK_SIZE = 1000
+# generated chunks waiting for the main thread, the worker waits when reached
+MAX_PENDING_CHUNKS = 2
+
+
+class BatchResult:
+    """ Collects the outcome of a batch run.
+
+        :param total: number of source features
+    """
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        # feature ids of written labeling features
+        self.created: List[int] = []
+        # source feature ids without a generated labeling point
+        self.skipped: List[int] = []
+        # number of labeling points the provider rejected
+        self.failed: int = 0
+        self.errors: List[str] = []
+        # expression -> (last error message, error count)
+        self.expression_errors: Dict[str, Tuple[str, int]] = {}
+        self.canceled = False
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(total={self.total}, created={len(self.created)}, " \
+               f"skipped={len(self.skipped)}, failed={self.failed}, canceled={self.canceled})"
+
+
+def generate_features(source_layer: QgsVectorLayer, features: Iterable[QgsFeature], expression: str,
+                      dest_layer: QgsVectorLayer, offset: Optional[float] = None,
+                      feedback: Optional[QgsFeedback] = None,
+                      result: Optional[BatchResult] = None,
+                      progress_range: Tuple[float, float] = (0, 100)) -> List[QgsFeature]:
+    """ Builds new labeling features for all given source features.
+        Source features without a valid position are stored in `result.skipped`.
+
+        :param source_layer: source layer
+        :param features: source features
+        :param expression: expression to evaluate on each feature
+        :param dest_layer: destination layer
+        :param offset: offset in meters from centroid point feature
+        :param feedback: optional feedback for progress and cancelling
+        :param result: optional result object to collect skipped features
+        :param progress_range: feedback progress from start to end value, defaults to (0, 100)
+        :return: generated labeling features
+    """
+    if result is None:
+        result = BatchResult()
+
+    context = GenerationContext(source_layer, dest_layer, expression, offset)
+
+    generated = []
+    done = 0
+    for chunk in iter_chunks(features, PLACEMENT_CHUNK_SIZE):
+        if feedback is not None and feedback.isCanceled():
+            result.canceled = True
+            break
+
+        for feature, new_feature in zip(chunk, generate_from_snapshots(context, chunk)):
+            if new_feature is None:
+                result.skipped.append(feature.id())
+            else:
+                generated.append(new_feature)
+
+        done += len(chunk)
+        if feedback is not None and result.total:
+            feedback.setProgress(_scale_progress(done / result.total, progress_range))
+
+    result.expression_errors.update(context.expressions.errors)
+
+    return generated
+
+
+def commit_features(dest_layer: QgsVectorLayer, features: Iterable[QgsFeature],
+                    chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    feedback: Optional[QgsFeedback] = None,
+                    result: Optional[BatchResult] = None,
+                    progress_range: Tuple[float, float] = (0, 100)) -> BatchResult:
+    """ Writes features in chunks to the destination provider.
+        Each chunk is written with one `addFeatures` call and therefore in one transaction.
+        Already written chunks are kept when cancelled.
+
+        :param dest_layer: destination layer
+        :param features: features to write
+        :param chunk_size: features per chunk, defaults to `DEFAULT_CHUNK_SIZE`
+        :param feedback: optional feedback for progress and cancelling
+        :param result: optional result object to update
+        :param progress_range: feedback progress from start to end value, defaults to (0, 100)
+        :return: result object
+    """
+    if result is None:
+        result = BatchResult()
+
+    if chunk_size < 1:
+        raise ValueError(f"chunk size must be greater than 0, got {chunk_size}")
+
+    if not isinstance(features, list):
+        features = list(features)
+
+    provider = dest_layer.dataProvider()
+    total = len(features)
+
+    for start in range(0, total, chunk_size):
+        if feedback is not None and feedback.isCanceled():
+            result.canceled = True
+            break
+
+        chunk = features[start:start + chunk_size]
+        ok, added = provider.addFeatures(chunk)
+        if ok:
+            result.created.extend(f.id() for f in added)
+        else:
+            result.failed += len(chunk)
+            result.errors.append(provider.lastError())
+
+        if feedback is not None:
+            feedback.setProgress(_scale_progress((start + len(chunk)) / total, progress_range))
+
+    return result
+
+
+def create_from_features(source_layer: QgsVectorLayer, features: List[QgsFeature], expression: str,
+                         dest_layer: QgsVectorLayer, offset: Optional[float] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         feedback: Optional[QgsFeedback] = None) -> BatchResult:
+    """ Builds all labeling features first and writes them in chunks afterwards.
+
+        .. code-block:: python
+
+            feedback = QgsFeedback()
+            result = create_from_features(layer, layer.selectedFeatures(), '"name"', dest_layer, 10,
+                                          feedback=feedback)
+            print(len(result.created), "created,", len(result.skipped), "skipped")
+
+        :param source_layer: source layer
+        :param features: source features
+        :param expression: expression to evaluate on each feature
+        :param dest_layer: destination layer
+        :param offset: offset in meters from centroid point feature
+        :param chunk_size: features per transaction, defaults to `DEFAULT_CHUNK_SIZE`
+        :param feedback: optional feedback for progress and cancelling
+        :return: result object
+    """
+    result = BatchResult(len(features))
+
+    generated = generate_features(source_layer, features, expression, dest_layer, offset,
+                                  feedback, result, (0, 50))
+    if result.canceled:
+        return result
+
+    return commit_features(dest_layer, generated, chunk_size, feedback, result, (50, 100))
+
+
+def source_request(source_layer: Union[QgsVectorLayer, QgsFeatureSource], expression: str,
+                   fids: Optional[Iterable[int]] = None,
+                   extent: Optional[QgsRectangle] = None,
+                   filter_expression: Optional[str] = None) -> QgsFeatureRequest:
+    """ Request for source features, which only fetches the geometry and the columns used by `expression`.
+
+        :param source_layer: source layer or feature source
+        :param expression: label expression
+        :param fids: only these feature ids
+        :param extent: only features in extent, in source layer crs
+        :param filter_expression: only features matching this expression, ignored when `fids` are set
+    """
+    request = QgsFeatureRequest()
+    if fids is not None:
+        request.setFilterFids(list(fids))
+    elif filter_expression:
+        request.setFilterExpression(filter_expression)
+
+    if extent is not None:
+        request.setFilterRect(extent)
+
+    columns = QgsExpression(expression).referencedColumns()
+    if QgsFeatureRequest.ALL_ATTRIBUTES not in columns:
+        request.setSubsetOfAttributes(columns, source_layer.fields())
+
+    return request
+
+
+class GenerationTask(QgsTask):
+    """ Generates labeling features in a background thread.
+
+        Source features are either copied on creation or streamed in the worker thread with a
+        `QgsFeatureRequest`, see `source_request`. The worker thread only uses these features
+        and a `GenerationContext`. Generated features are sent in chunks to the main thread,
+        where each chunk is written in one transaction. Already written chunks are kept when cancelled.
+        At most `MAX_PENDING_CHUNKS` chunks wait for the main thread.
+
+        .. code-block:: python
+
+            task = GenerationTask(layer, layer.selectedFeatures(), '"name"', dest_layer, 10)
+            # or streamed
+            request = source_request(layer, '"name"', fids=layer.selectedFeatureIds())
+            task = GenerationTask(layer, request, '"name"', dest_layer, 10)
+
+            task.generated.connect(lambda result: print(result))
+            QgsApplication.taskManager().addTask(task)
+
+        Qt Signals:
+        * chunkGenerated: list of generated features, emitted from worker thread
+        * generated: `BatchResult`, emitted in main thread after the task finished or was cancelled
+
+        Placements of GeoPackage destinations are cached in a file next to them, see `PlacementCache`,
+        so regenerating unchanged geometries skips transformation and placement.
+
+        :param source_layer: source layer
+        :param features: source features or request for source features
+        :param expression: expression to evaluate on each feature
+        :param dest_layer: destination layer
+        :param offset: offset in meters from centroid point feature
+        :param chunk_size: features per transaction, defaults to `DEFAULT_CHUNK_SIZE`
+        :param use_cache: use the placement cache of the destination, defaults to True
+    """
+    chunkGenerated = pyqtSignal(list, name="chunkGenerated")
+    generated = pyqtSignal(object, name="generated")
+
+    def __init__(self, source_layer: QgsVectorLayer, features: Union[Iterable[QgsFeature], QgsFeatureRequest],
+                 expression: str,
+                 dest_layer: QgsVectorLayer, offset: Optional[float] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, use_cache: bool = True):
+        super().__init__("Beschriftungspunkte erstellen", QgsTask.CanCancel)
+
+        if chunk_size < 1:
+            raise ValueError(f"chunk size must be greater than 0, got {chunk_size}")
+
+        self.context = GenerationContext(source_layer, dest_layer, expression, offset)
+        if use_cache:
+            self.context.cache = PlacementCache.for_layer(dest_layer)
+        if isinstance(features, QgsFeatureRequest):
+            self.source = QgsVectorLayerFeatureSource(source_layer)
+            self.request = QgsFeatureRequest(features)
+            self.features: Optional[List[QgsFeature]] = None
+            # total is only known for feature ids, otherwise the feature count of the layer is the upper bound
+            if features.filterType() == QgsFeatureRequest.FilterFids:
+                total = len(features.filterFids())
+            else:
+                total = max(source_layer.featureCount(), 0)
+                if features.limit() >= 0:
+                    total = min(total, features.limit())
+            self._estimated = features.filterType() != QgsFeatureRequest.FilterFids
+        else:
+            self.source = None
+            self.request = None
+            self.features = [QgsFeature(f) for f in features]
+            total = len(self.features)
+            self._estimated = False
+
+        self.dest_layer_id = dest_layer.id()
+        # written in main thread only
+        self.reference_index = ReferenceIndex.for_layer(dest_layer)
+        self.chunk_size = chunk_size
+        self.result = BatchResult(total)
+        self.exception: Optional[Exception] = None
+        self._pending = threading.BoundedSemaphore(MAX_PENDING_CHUNKS)
+
+        # slot lives in main thread, chunks are committed there
+        self.chunkGenerated.connect(self._commit_chunk)
+
+    def run(self) -> bool:
+        """ worker thread """
+        try:
+            if self.source is not None:
+                source_features = self.source.getFeatures(self.request)
+            else:
+                source_features = self.features
+
+            chunk = []
+            done = 0
+            for features in iter_chunks(source_features, PLACEMENT_CHUNK_SIZE):
+                if self.isCanceled():
+                    self.result.canceled = True
+                    return False
+
+                for feature, new_feature in zip(features, generate_from_snapshots(self.context, features)):
+                    if new_feature is None:
+                        self.result.skipped.append(feature.id())
+                    else:
+                        chunk.append(new_feature)
+
+                if len(chunk) >= self.chunk_size:
+                    if not self._emit_chunk(chunk):
+                        return False
+                    chunk = []
+
+                done += len(features)
+                if self.result.total:
+                    progress = 100 * done / self.result.total
+                    # filtered streams end before the estimated total
+                    self.setProgress(min(progress, 99) if self._estimated else progress)
+
+            if self.source is not None:
+                self.result.total = done
+
+            if chunk and not self._emit_chunk(chunk):
+                return False
+
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return True
+
+    def _emit_chunk(self, chunk: List[QgsFeature]) -> bool:
+        """ worker thread, waits while `MAX_PENDING_CHUNKS` chunks are not committed """
+        while not self._pending.acquire(timeout=0.1):
+            if self.isCanceled():
+                self.result.canceled = True
+                return False
+
+        self.chunkGenerated.emit(chunk)
+        return True
+
+    def _commit_chunk(self, chunk: List[QgsFeature]):
+        """ main thread """
+        try:
+            layer = QgsProject.instance().mapLayer(self.dest_layer_id)
+            if layer is None:
+                self.result.failed += len(chunk)
+                self.result.errors.append("Beschriftungslayer nicht gefunden")
+                self.cancel()
+                return
+
+            entries = {}
+            for features in iter_chunks(chunk, self.chunk_size):
+                created = len(self.result.created)
+                commit_features(layer, features, self.chunk_size, result=self.result)
+                fids = self.result.created[created:]
+                # failed transactions create nothing, otherwise ids are returned in feature order
+                if len(fids) == len(features):
+                    entries.update((fid, reference_entry(feature)) for fid, feature in zip(fids, features))
+
+            if self.reference_index is not None:
+                self.reference_index.write({fid: entry for fid, entry in entries.items() if entry is not None})
+        finally:
+            self._pending.release()
+
+    def finished(self, result: bool):
+        """ main thread """
+        if self.exception is not None:
+            self.result.errors.append(str(self.exception))
+
+        self.result.expression_errors.update(self.context.expressions.errors)
+
+        cache = self.context.cache
+        if cache is not None:
+            if not cache.error:
+                try:
+                    cache.evict()
+                except sqlite3.Error as e:
+                    cache.error = str(e)
+            cache.close()
+
+        if self.reference_index is not None:
+            self.reference_index.close()
+
+        self.result.canceled = self.result.canceled or self.isCanceled()
+        self.generated.emit(self.result)
+
+
+def iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    """ Yields lists with up to `size` items from iterable. """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _scale_progress(fraction: float, progress_range: Tuple[float, float]) -> float:
+    start, end = progress_range
+    return start + (end - start) * fraction
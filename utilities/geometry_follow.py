@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeatureRequest, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from typing import Dict, List, Optional, Tuple
+
+from easy_labeling.utilities.functions import DEFAULT_OFFSET, get_positions, get_leader_targets
+from easy_labeling.utilities.generation import DEFAULT_CHUNK_SIZE, iter_chunks
+from easy_labeling.utilities.leaders import LEADERS_FIELD, decode_leaders, leader_values
+from easy_labeling.submodules.qgis.geometry.functions import get_distance_area
+from easy_labeling.submodules.qgis.geometry.transform import get_transform
+from easy_labeling.submodules.qgis.constants import EPSILON, EPSILON_METRES
+
+
+# custom layer property of a labeling layer, set when labels follow edited reference geometries
+FOLLOW_GEOMETRY_PROPERTY = "easy_labeling/follow_geometry"
+# labels still at their generated position are moved
+FOLLOW_AUTO = "auto"
+# all labels are moved, also manually moved ones
+FOLLOW_FORCE = "force"
+
+
+def follow_mode(layer: QgsVectorLayer) -> str:
+    """ Returns `FOLLOW_AUTO`, `FOLLOW_FORCE` or an empty string when disabled. """
+    if layer is None:
+        return ""
+
+    mode = layer.customProperty(FOLLOW_GEOMETRY_PROPERTY, "")
+    return mode if mode in (FOLLOW_AUTO, FOLLOW_FORCE) else ""
+
+
+def set_follow_mode(layer: QgsVectorLayer, mode: str):
+    """ Sets `FOLLOW_AUTO`, `FOLLOW_FORCE` or disables geometry follow with an empty string. """
+    if mode:
+        if mode not in (FOLLOW_AUTO, FOLLOW_FORCE):
+            raise ValueError(f"unknown follow mode '{mode}'")
+        layer.setCustomProperty(FOLLOW_GEOMETRY_PROPERTY, mode)
+    else:
+        layer.removeCustomProperty(FOLLOW_GEOMETRY_PROPERTY)
+
+
+def reanchor_labels(layer: QgsVectorLayer, reference_crs: QgsCoordinateReferenceSystem,
+                    labels: Dict[int, int], new_geometries: Dict[int, QgsGeometry],
+                    old_geometries: Optional[Dict[int, QgsGeometry]] = None, force: bool = False,
+                    offset: Optional[float] = DEFAULT_OFFSET,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[List[int], int, str]:
+    """ Moves labeling points and their leader targets to the positions of edited reference geometries.
+        Positions are computed like on generation, see `get_positions` and `get_leader_targets`.
+        Changes are written in one transaction per chunk of labels, a rejected chunk stops and keeps
+        the chunks written before.
+
+        Without `force` only labels still at the position generated from the old geometry are moved,
+        and only leader targets still equal to the generated ones are replaced.
+        Labels without old geometry are kept then.
+
+        :param layer: labeling layer
+        :param reference_crs: crs of the referenced layer
+        :param labels: labeling feature id -> referenced feature id
+        :param new_geometries: referenced feature id -> new geometry in reference crs
+        :param old_geometries: referenced feature id -> geometry before the edit in reference crs
+        :param force: move manually moved labels as well
+        :param offset: offset in meters from center of lines
+        :param chunk_size: labeling features per transaction, defaults to `DEFAULT_CHUNK_SIZE`
+        :return: moved labeling feature ids, number of kept labels and error message
+    """
+    old_geometries = old_geometries or {}
+    fids = sorted({fid for fid in labels.values() if fid in new_geometries})
+    if not fids:
+        return [], 0, ""
+
+    provider = layer.dataProvider()
+    dest_crs = provider.crs()
+    transform = get_transform(reference_crs, dest_crs)
+    area = get_distance_area(dest_crs)
+    epsilon = EPSILON if dest_crs.isGeographic() else EPSILON_METRES
+
+    def place(geometries: Dict[int, QgsGeometry]) -> Dict[int, Tuple[Optional[QgsPointXY], List[QgsPointXY]]]:
+        ids = [fid for fid in fids if fid in geometries]
+        transformed = []
+        for fid in ids:
+            geom = QgsGeometry(geometries[fid])
+            if not geom.isNull():
+                geom.transform(transform)
+            transformed.append(geom)
+
+        positions = get_positions(transformed, dest_crs, area, offset)
+        return {fid: (point, get_leader_targets(geom)) for fid, geom, point in zip(ids, transformed, positions)}
+
+    new_places = place(new_geometries)
+    old_places = place(old_geometries) if not force else {}
+
+    names = [name for name in ("Points", LEADERS_FIELD.name()) if layer.fields().lookupField(name) >= 0]
+    moved = []
+    kept = 0
+    for chunk in iter_chunks(sorted(labels), chunk_size):
+        request = QgsFeatureRequest().setFilterFids(chunk)
+        request.setSubsetOfAttributes(names, layer.fields())
+
+        geometry_changes = {}
+        attribute_changes = {}
+        for feature in layer.getFeatures(request):
+            fid = labels[feature.id()]
+            point, targets = new_places.get(fid, (None, []))
+            if point is None:
+                continue
+
+            current = feature.geometry()
+            if current.isNull() or current.isEmpty():
+                continue
+            current_point = current.asMultiPoint()[0] if current.isMultipart() else current.asPoint()
+
+            leaders = decode_leaders(feature)
+            if force:
+                replace_leaders = True
+            else:
+                old_point, old_targets = old_places.get(fid, (None, []))
+                if old_point is None or not current_point.compare(old_point, epsilon):
+                    kept += 1
+                    continue
+                replace_leaders = _same_points(leaders, old_targets, epsilon)
+
+            geometry_changes[feature.id()] = QgsGeometry.fromPointXY(point)
+            if replace_leaders and not _same_points(leaders, targets, epsilon):
+                values = leader_values(provider.fields(), targets)
+                attribute_changes[feature.id()] = {provider.fields().lookupField(name): value
+                                                   for name, value in values.items()}
+
+        if not geometry_changes:
+            continue
+
+        if not provider.changeFeatures(attribute_changes, geometry_changes):
+            return moved, kept, provider.lastError()
+
+        moved.extend(geometry_changes)
+
+    return moved, kept, ""
+
+
+def _same_points(points: List[QgsPointXY], others: List[QgsPointXY], epsilon: float) -> bool:
+    return len(points) == len(others) and all(p.compare(o, epsilon) for p, o in zip(points, others))
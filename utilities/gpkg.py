@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import QgsDataProvider, QgsProviderRegistry, QgsVectorLayer
+
+from typing import Optional
+
+
+def gpkg_path(layer: QgsVectorLayer) -> Optional[str]:
+    """ Returns the GeoPackage file of an ogr layer, otherwise None. """
+    if layer is None or layer.providerType() != "ogr":
+        return None
+
+    path = QgsProviderRegistry.instance().decodeUri("ogr", layer.source()).get("path", "")
+    if not path.lower().endswith(".gpkg"):
+        return None
+
+    return path
+
+
+def gpkg_layer_name(layer: QgsVectorLayer) -> Optional[str]:
+    """ Returns the table name of a GeoPackage layer.
+        Layers opened without layer name use the first table of the file.
+    """
+    if gpkg_path(layer) is None:
+        return None
+
+    name = QgsProviderRegistry.instance().decodeUri("ogr", layer.source()).get("layerName")
+    if name:
+        return name
+
+    sub_layers = layer.dataProvider().subLayers()
+    if not sub_layers:
+        return None
+
+    # "index!!::!!name!!::!!count!!::!!geometry type!!::!!geometry column"
+    return sub_layers[0].split(QgsDataProvider.SUBLAYER_SEPARATOR)[1]
+
+
+def gpkg_uri(path: str, layer_name: str) -> str:
+    return f"{path}|layername={layer_name}"
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import (QgsFeature, QgsFeatureRequest, QgsFeatureSink, QgsField, QgsFields, QgsGeometry,
+                       QgsProject, QgsSingleSymbolRenderer, QgsSymbol, QgsVectorFileWriter,
+                       QgsVectorLayer, QgsWkbTypes)
+from qgis.PyQt.QtCore import QVariant
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from easy_labeling.utilities.generation import DEFAULT_CHUNK_SIZE, iter_chunks
+from easy_labeling.utilities.gpkg import gpkg_path, gpkg_layer_name, gpkg_uri
+from easy_labeling.utilities.leaders import LEADERS_FIELD, decode_leaders, arrow_generators, set_arrow_generators_enabled
+
+
+# custom layer property of a labeling layer, set when arrows are drawn from the leader line table
+LEADER_LINES_PROPERTY = "easy_labeling/leader_lines"
+# labeling feature id of each leader line feature
+POINT_FID_FIELD = "point_fid"
+
+
+def leader_table_name(layer: QgsVectorLayer) -> Optional[str]:
+    """ Returns the leader line table name for a GeoPackage labeling layer. """
+    name = gpkg_layer_name(layer)
+    return f"{name}_leaders" if name else None
+
+
+def leader_lines_enabled(layer: QgsVectorLayer) -> bool:
+    return bool(layer is not None and layer.customProperty(LEADER_LINES_PROPERTY, ""))
+
+
+def leader_line_features(layer: QgsVectorLayer, fields: QgsFields,
+                         request: Optional[QgsFeatureRequest] = None) -> Iterator[QgsFeature]:
+    """ Yields one MultiLineString feature per labeling feature with leader targets.
+        Each line starts at the labeling point and ends at one target.
+
+        :param layer: labeling layer
+        :param fields: fields of the leader line table
+        :param request: optional request for labeling features
+    """
+    request = QgsFeatureRequest(request) if request is not None else QgsFeatureRequest()
+    names = [name for name in ("Points", LEADERS_FIELD.name()) if layer.fields().lookupField(name) >= 0]
+    request.setSubsetOfAttributes(names, layer.fields())
+
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        targets = decode_leaders(feature)
+        if not targets or geometry.isNull() or geometry.isEmpty():
+            continue
+
+        point = geometry.asMultiPoint()[0] if geometry.isMultipart() else geometry.asPoint()
+
+        line_feature = QgsFeature(fields)
+        line_feature.setGeometry(QgsGeometry.fromMultiPolylineXY([[point, target] for target in targets]))
+        line_feature[POINT_FID_FIELD] = feature.id()
+        yield line_feature
+
+
+def write_leader_table(layer: QgsVectorLayer, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[bool, str]:
+    """ Writes all leader lines of a labeling layer into a table of the same GeoPackage.
+        An existing table is overwritten. Labeling features are read in chunks of feature ids,
+        no reader of the labeling layer is open while lines are written.
+
+        :param layer: labeling layer
+        :param chunk_size: labeling features per chunk, defaults to `DEFAULT_CHUNK_SIZE`
+        :return: success and error message
+    """
+    path = gpkg_path(layer)
+    table = leader_table_name(layer)
+    if path is None or table is None:
+        return False, "Nur für GeoPackage-Layer möglich"
+
+    fields = QgsFields()
+    fields.append(QgsField(POINT_FID_FIELD, QVariant.LongLong))
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = table
+    options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+
+    request = QgsFeatureRequest().setNoAttributes().setFlags(QgsFeatureRequest.NoGeometry)
+    fids = sorted(feature.id() for feature in layer.getFeatures(request))
+
+    writer = QgsVectorFileWriter.create(path, fields, QgsWkbTypes.MultiLineString, layer.crs(),
+                                        QgsProject.instance().transformContext(), options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        return False, writer.errorMessage()
+
+    for chunk in iter_chunks(fids, chunk_size):
+        features = list(leader_line_features(layer, fields, QgsFeatureRequest().setFilterFids(chunk)))
+        if features and not writer.addFeatures(features, QgsFeatureSink.FastInsert):
+            message = writer.lastError()
+            del writer
+            return False, message
+
+    # flushes and closes the table
+    del writer
+
+    lines = QgsVectorLayer(gpkg_uri(path, table), table, "ogr")
+    lines.dataProvider().createAttributeIndex(lines.fields().lookupField(POINT_FID_FIELD))
+
+    _reload_leader_layers(path, table)
+
+    return True, ""
+
+
+def sync_leader_lines(layer: QgsVectorLayer, fids: Iterable[int],
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[bool, str]:
+    """ Replaces the leader lines of given labeling features, one delete and insert per chunk of features.
+        Lines of deleted labeling features are removed.
+        Without leader line table, the table is written completely.
+
+        :param layer: labeling layer
+        :param fids: labeling feature ids
+        :param chunk_size: labeling features per chunk, defaults to `DEFAULT_CHUNK_SIZE`
+        :return: success and error message
+    """
+    fids = [int(fid) for fid in fids]
+    path = gpkg_path(layer)
+    table = leader_table_name(layer)
+    if path is None or table is None:
+        return False, "Nur für GeoPackage-Layer möglich"
+
+    lines = QgsVectorLayer(gpkg_uri(path, table), table, "ogr")
+    if not lines.isValid():
+        return write_leader_table(layer, chunk_size)
+
+    if not fids:
+        return True, ""
+
+    provider = lines.dataProvider()
+
+    for chunk in iter_chunks(fids, chunk_size):
+        request = QgsFeatureRequest()
+        request.setFilterExpression(f'"{POINT_FID_FIELD}" IN ({",".join(map(str, chunk))})')
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setNoAttributes()
+        old_ids = [feature.id() for feature in provider.getFeatures(request)]
+        if old_ids and not provider.deleteFeatures(old_ids):
+            return False, provider.lastError()
+
+        new_features = list(leader_line_features(layer, provider.fields(), QgsFeatureRequest().setFilterFids(chunk)))
+        if new_features and not provider.addFeatures(new_features)[0]:
+            return False, provider.lastError()
+
+    _reload_leader_layers(path, table)
+
+    return True, ""
+
+
+def enable_leader_lines(layer: QgsVectorLayer) -> Tuple[bool, str]:
+    """ Draws arrows from the leader line table instead of the geometry generator expression.
+        Writes the table, adds it below the labeling layer and disables the arrow geometry generators.
+
+        :param layer: labeling layer
+        :return: success and error message
+    """
+    ok, message = write_leader_table(layer)
+    if not ok:
+        return False, message
+
+    path = gpkg_path(layer)
+    table = leader_table_name(layer)
+
+    if not leader_layers(path, table):
+        lines = QgsVectorLayer(gpkg_uri(path, table), f"{layer.name()} (Pfeile)", "ogr")
+        generators = arrow_generators(layer)
+        if generators and generators[0].subSymbol() is not None:
+            symbol = generators[0].subSymbol().clone()
+        else:
+            symbol = QgsSymbol.defaultSymbol(QgsWkbTypes.LineGeometry)
+        lines.setRenderer(QgsSingleSymbolRenderer(symbol))
+
+        QgsProject.instance().addMapLayer(lines, False)
+        node = QgsProject.instance().layerTreeRoot().findLayer(layer.id())
+        parent = node.parent() if node is not None else QgsProject.instance().layerTreeRoot()
+        index = parent.children().index(node) + 1 if node is not None else 0
+        parent.insertLayer(index, lines)
+
+    set_arrow_generators_enabled(layer, False)
+    layer.setCustomProperty(LEADER_LINES_PROPERTY, table)
+
+    return True, ""
+
+
+def disable_leader_lines(layer: QgsVectorLayer):
+    """ Draws arrows with the geometry generator expression again.
+        The leader line table is kept in the GeoPackage, only its map layers are removed.
+
+        :param layer: labeling layer
+    """
+    path = gpkg_path(layer)
+    table = leader_table_name(layer)
+    if path is not None and table is not None:
+        QgsProject.instance().removeMapLayers([lines.id() for lines in leader_layers(path, table)])
+
+    set_arrow_generators_enabled(layer, True)
+    layer.removeCustomProperty(LEADER_LINES_PROPERTY)
+
+
+def leader_layers(path: str, table: str) -> List[QgsVectorLayer]:
+    """ Returns project layers of a leader line table. """
+    return [lines for lines in QgsProject.instance().mapLayers().values()
+            if isinstance(lines, QgsVectorLayer) and gpkg_path(lines) == path and gpkg_layer_name(lines) == table]
+
+
+def _reload_leader_layers(path: str, table: str):
+    for lines in leader_layers(path, table):
+        lines.reload()
+        lines.triggerRepaint()
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import ast
+import json
+
+from qgis.core import (QgsFeature, QgsFeatureRequest, QgsField, QgsFields, QgsGeometry,
+                       QgsGeometryGeneratorSymbolLayer, QgsMultiPoint, QgsPoint, QgsPointXY,
+                       QgsRenderContext, QgsSymbol, QgsVectorLayer, QgsWkbTypes, NULL)
+from qgis.PyQt.QtCore import QVariant, QByteArray
+
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Leader targets are stored as WKB in the optional "Leaders" field.
+# The WKB type is the format version:
+#   - MultiPoint: version 1, one point per leader target
+#   - MultiLineString: reserved for materialized leader lines, the last vertex of each line is the target
+# Layers without this field keep the JSON text in "Points" ([[x, y], ...]).
+LEADERS_FIELD = QgsField("Leaders", QVariant.ByteArray)
+
+# geometry generator expression for arrows from "Leaders"
+LEADERS_EXPRESSION = """with_variable('leaders', geom_from_wkb("Leaders"),
+\tcollect_geometries(array_foreach(
+\t\tgenerate_series(1, num_geometries(@leaders)),
+\t\tmake_line(make_point($x, $y), geometry_n(@leaders, @element))
+\t))
+)"""
+
+# geometry generator expression of older default styles
+LEGACY_EXPRESSION = """collect_geometries(array_foreach(
+\tfrom_json("Points"),
+\tmake_line(
+        make_point($x, $y),
+\t\tmake_point(array_get(@element, 0), array_get(@element, 1))
+\t)
+))"""
+
+
+def has_leaders_field(fields: QgsFields) -> bool:
+    return fields.lookupField(LEADERS_FIELD.name()) >= 0
+
+
+def encode_leaders(points: List[QgsPointXY]) -> QByteArray:
+    """ Encodes leader targets as WKB MultiPoint. """
+    geometry = QgsMultiPoint()
+    for point in points:
+        geometry.addGeometry(QgsPoint(point))
+
+    return geometry.asWkb()
+
+
+def decode_leaders_wkb(value: Any) -> List[QgsPointXY]:
+    """ Decodes leader targets from WKB, see `LEADERS_FIELD` for supported types. """
+    if not isinstance(value, (QByteArray, bytes, bytearray)) or not len(value):
+        return []
+
+    if not isinstance(value, QByteArray):
+        value = QByteArray(bytes(value))
+
+    geometry = QgsGeometry()
+    geometry.fromWkb(value)
+    if geometry.isNull() or geometry.isEmpty():
+        return []
+
+    if geometry.type() == QgsWkbTypes.PointGeometry:
+        if geometry.isMultipart():
+            return geometry.asMultiPoint()
+        return [geometry.asPoint()]
+
+    if geometry.type() == QgsWkbTypes.LineGeometry:
+        lines = geometry.asMultiPolyline() if geometry.isMultipart() else [geometry.asPolyline()]
+        return [line[-1] for line in lines if line]
+
+    return []
+
+
+def encode_leaders_json(points: List[QgsPointXY]) -> str:
+    """ Encodes leader targets as JSON text [[x, y], ...]. """
+    return json.dumps([[point.x(), point.y()] for point in points])
+
+
+def decode_leaders_text(text: Any) -> List[QgsPointXY]:
+    """ Decodes leader targets from the "Points" text field.
+        Accepts JSON [[x, y], ...] and the older Python list format [['x,y'], ...].
+        Invalid values return an empty list.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return []
+
+    try:
+        values = json.loads(text)
+    except ValueError:
+        try:
+            values = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return []
+
+    if not isinstance(values, (list, tuple)):
+        return []
+
+    points = []
+    for value in values:
+        point = _to_point(value)
+        if point is not None:
+            points.append(point)
+
+    return points
+
+
+def _to_point(value: Any) -> Optional[QgsPointXY]:
+    if isinstance(value, (list, tuple)):
+        if len(value) == 2 and all(isinstance(v, (int, float)) for v in value):
+            return QgsPointXY(float(value[0]), float(value[1]))
+        if len(value) == 1:
+            return _to_point(value[0])
+        return None
+
+    if isinstance(value, str):
+        try:
+            x, y = value.split(",")
+            return QgsPointXY(float(x), float(y))
+        except ValueError:
+            return None
+
+    return None
+
+
+def decode_leaders(feature: QgsFeature) -> List[QgsPointXY]:
+    """ Returns leader targets of a labeling feature.
+        Reads "Leaders" when the field exists and is set, otherwise the JSON text in "Points".
+    """
+    fields = feature.fields()
+    if has_leaders_field(fields):
+        value = feature[LEADERS_FIELD.name()]
+        if value is not None and value != NULL:
+            return decode_leaders_wkb(value)
+
+    if fields.lookupField("Points") >= 0:
+        return decode_leaders_text(feature["Points"])
+
+    return []
+
+
+def leader_values(fields: QgsFields, points: List[QgsPointXY]) -> Dict[str, Any]:
+    """ Attribute values by field name for storing leader targets.
+        With "Leaders" field the WKB is written and "Points" is cleared, otherwise JSON is written to "Points".
+    """
+    if has_leaders_field(fields):
+        return {LEADERS_FIELD.name(): encode_leaders(points), "Points": NULL}
+
+    return {"Points": encode_leaders_json(points)}
+
+
+class MigrationResult:
+    """ Outcome of `migrate_layer` """
+
+    def __init__(self):
+        # number of converted features
+        self.converted = 0
+        # number of invalid "Points" values, converted as empty
+        self.invalid = 0
+        # number of features the provider rejected, they keep "Points" and are converted by the next run
+        self.failed = 0
+        self.errors: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(converted={self.converted}, invalid={self.invalid}, " \
+               f"failed={self.failed})"
+
+
+def migrate_layer(layer: QgsVectorLayer, chunk_size: Optional[int] = None) -> MigrationResult:
+    """ Converts leader targets of all features from "Points" text to "Leaders" WKB.
+        Adds the "Leaders" field when missing. Features already having "Leaders" values are not changed.
+        Each chunk is written in one transaction, a rejected chunk is counted and the next one is written.
+        The default arrow style is only updated, when all features were converted.
+
+        :param layer: labeling layer
+        :param chunk_size: features per transaction, defaults to `DEFAULT_CHUNK_SIZE`
+        :return: result object
+    """
+    from easy_labeling.utilities.generation import DEFAULT_CHUNK_SIZE, iter_chunks
+
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if chunk_size < 1:
+        raise ValueError(f"chunk size must be greater than 0, got {chunk_size}")
+
+    provider = layer.dataProvider()
+    if not has_leaders_field(provider.fields()):
+        if not provider.addAttributes([QgsField(LEADERS_FIELD)]):
+            raise ValueError(f"Feld '{LEADERS_FIELD.name()}' konnte nicht erstellt werden ({provider.lastError()})")
+        layer.updateFields()
+
+    fields = provider.fields()
+    leaders_index = fields.lookupField(LEADERS_FIELD.name())
+    points_index = fields.lookupField("Points")
+
+    # ids first, the provider is not written while its features are read
+    request = QgsFeatureRequest().setFilterExpression(f'"{LEADERS_FIELD.name()}" IS NULL')
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setNoAttributes()
+    fids = sorted(feature.id() for feature in provider.getFeatures(request))
+
+    result = MigrationResult()
+    for chunk in iter_chunks(fids, chunk_size):
+        request = QgsFeatureRequest().setFilterFids(chunk)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([leaders_index, points_index])
+
+        changes = {}
+        invalid = 0
+        for feature in provider.getFeatures(request):
+            value = feature[leaders_index]
+            if value is not None and value != NULL:
+                continue
+
+            text = feature[points_index]
+            points = decode_leaders_text(text)
+            if not points and isinstance(text, str) and text.strip() not in ("", "[]"):
+                invalid += 1
+
+            changes[feature.id()] = {leaders_index: encode_leaders(points), points_index: NULL}
+
+        if changes and not provider.changeAttributeValues(changes):
+            result.failed += len(changes)
+            result.errors.append(provider.lastError())
+            continue
+
+        result.converted += len(changes)
+        result.invalid += invalid
+
+    if not result.failed:
+        update_style(layer)
+    layer.triggerRepaint()
+
+    return result
+
+
+def update_style(layer: QgsVectorLayer) -> int:
+    """ Replaces the legacy arrow expression in geometry generator symbol layers with `LEADERS_EXPRESSION`.
+        Changed expressions are kept.
+
+        :return: number of replaced expressions
+    """
+    renderer = layer.renderer()
+    if renderer is None:
+        return 0
+
+    legacy = _normalize(LEGACY_EXPRESSION)
+    replaced = 0
+    for symbol_layer in _geometry_generators(renderer.symbols(QgsRenderContext())):
+        if _normalize(symbol_layer.geometryExpression()) == legacy:
+            symbol_layer.setGeometryExpression(LEADERS_EXPRESSION)
+            replaced += 1
+
+    return replaced
+
+
+def arrow_generators(layer: QgsVectorLayer) -> List[QgsGeometryGeneratorSymbolLayer]:
+    """ Returns geometry generator symbol layers drawing arrows with one of the default expressions. """
+    renderer = layer.renderer()
+    if renderer is None:
+        return []
+
+    defaults = (_normalize(LEADERS_EXPRESSION), _normalize(LEGACY_EXPRESSION))
+    return [symbol_layer for symbol_layer in _geometry_generators(renderer.symbols(QgsRenderContext()))
+            if _normalize(symbol_layer.geometryExpression()) in defaults]
+
+
+def set_arrow_generators_enabled(layer: QgsVectorLayer, enabled: bool) -> int:
+    """ Enables or disables the arrow geometry generators, see `arrow_generators`.
+
+        :return: number of changed symbol layers
+    """
+    generators = arrow_generators(layer)
+    for symbol_layer in generators:
+        symbol_layer.setEnabled(enabled)
+
+    if generators:
+        layer.triggerRepaint()
+
+    return len(generators)
+
+
+def _geometry_generators(symbols: List[QgsSymbol]):
+    for symbol in symbols:
+        if symbol is None:
+            continue
+        for symbol_layer in symbol.symbolLayers():
+            if symbol_layer.layerType() == "GeometryGenerator":
+                yield symbol_layer
+            yield from _geometry_generators([symbol_layer.subSymbol()])
+
+
+def _normalize(expression: str) -> str:
+    return "".join(expression.split())
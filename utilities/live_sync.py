@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+
+from qgis.core import QgsFeatureRequest, QgsVectorLayer, QgsVectorLayerFeatureSource, NULL
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from easy_labeling.utilities.fingerprint import expression_inputs, fingerprint_values
+from easy_labeling.utilities.functions import get_label_text
+from easy_labeling.utilities.reference_index import ReferenceIndex
+from easy_labeling.utilities.references import parse_reference
+from easy_labeling.submodules.qgis.tools.expression_cache import ExpressionCache
+
+
+# custom layer property of a labeling layer, set when label texts follow reference layer edits
+LIVE_SYNC_PROPERTY = "easy_labeling/live_sync"
+# changed field name for geometry changes, see `ReverseIndex.affected`
+GEOMETRY_CHANGED = "$geometry"
+
+
+def live_sync_enabled(layer: QgsVectorLayer) -> bool:
+    return bool(layer is not None and layer.customProperty(LIVE_SYNC_PROPERTY, False))
+
+
+def set_live_sync_enabled(layer: QgsVectorLayer, enabled: bool):
+    if enabled:
+        layer.setCustomProperty(LIVE_SYNC_PROPERTY, True)
+    else:
+        layer.removeCustomProperty(LIVE_SYNC_PROPERTY)
+
+
+class ReverseIndex:
+    """ Labeling feature ids by referenced layer name and feature id of one labeling layer.
+        Built with one request without geometries.
+        With a persistent `ReferenceIndex` lookups are queries on it and expressions
+        are only read for affected labels, nothing is read on creation.
+        When the persistent index is dropped or can not be read, the index is built from the layer instead.
+
+        .. code-block:: python
+
+            index = ReverseIndex(labeling_layer)
+            label_fids = index.lookup("Roads", 42)
+            expression = index.expressions[label_fids[0]]
+
+        :param layer: labeling layer
+        :param reference_index: optional persistent reference index of the labeling layer
+    """
+
+    def __init__(self, layer: QgsVectorLayer, reference_index: Optional[ReferenceIndex] = None):
+        # layer name -> referenced feature id -> labeling feature ids
+        self._labels: Dict[str, Dict[int, List[int]]] = {}
+        # labeling feature id -> expression
+        self.expressions: Dict[int, str] = {}
+        self._reference_index = reference_index
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._fields = layer.fields()
+        self._scanned = False
+
+        if reference_index is None:
+            self._scan()
+
+    def _scan(self):
+        """ Builds the index from all labeling features """
+        self._reference_index = None
+        if self._scanned:
+            return
+
+        self._scanned = True
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["Reference", "Expression"], self._fields)
+        for feature in self._source.getFeatures(request):
+            parsed = parse_reference(feature['Reference'])
+            if parsed is None:
+                continue
+
+            name, fid = parsed
+            self._labels.setdefault(name, {}).setdefault(fid, []).append(feature.id())
+            expression = feature['Expression']
+            self.expressions[feature.id()] = expression if expression != NULL and expression else ""
+
+    def lookup(self, name: str, fid: int) -> List[int]:
+        """ Returns labeling feature ids referencing a feature. """
+        if self._reference_index is not None and self._reference_index.exists():
+            try:
+                return self._reference_index.labels(name, fid)
+            except sqlite3.Error:
+                pass
+
+        self._scan()
+        return self._labels.get(name, {}).get(fid, [])
+
+    def _load_expressions(self, fids: Iterable[int]):
+        """ Reads expressions of labels found in the persistent index """
+        missing = [fid for fid in fids if fid not in self.expressions]
+        if self._scanned or not missing:
+            return
+
+        request = QgsFeatureRequest().setFilterFids(missing)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["Expression"], self._fields)
+        for feature in self._source.getFeatures(request):
+            expression = feature['Expression']
+            self.expressions[feature.id()] = expression if expression != NULL and expression else ""
+
+    def affected(self, name: str, changes: Dict[int, Set[str]]) -> Dict[int, int]:
+        """ Returns labeling feature ids, whose expression uses a changed value, with their referenced feature id.
+
+            :param name: referenced layer name
+            :param changes: changed feature id -> changed field names, `GEOMETRY_CHANGED` for geometries
+        """
+        labels = {fid: self.lookup(name, fid) for fid in changes}
+        self._load_expressions(label_fid for label_fids in labels.values() for label_fid in label_fids)
+
+        result = {}
+        for fid, names in changes.items():
+            for label_fid in labels[fid]:
+                columns, needs_geometry = expression_inputs(self.expressions.get(label_fid, ""))
+                if columns is None or not names.isdisjoint(columns):
+                    used = True
+                else:
+                    used = needs_geometry and GEOMETRY_CHANGED in names
+
+                if used:
+                    result[label_fid] = fid
+
+        return result
+
+    def __len__(self) -> int:
+        if self._reference_index is not None and self._reference_index.exists():
+            try:
+                return len(self._reference_index)
+            except sqlite3.Error:
+                pass
+
+        self._scan()
+        return len(self.expressions)
+
+
+def update_label_texts(layer: QgsVectorLayer, reference_layer: QgsVectorLayer,
+                       labels: Dict[int, int]) -> Tuple[int, str]:
+    """ Evaluates label texts on their referenced features again and writes changed texts in one transaction.
+
+        :param layer: labeling layer
+        :param reference_layer: referenced layer
+        :param labels: labeling feature id -> referenced feature id, see `ReverseIndex.affected`
+        :return: number of written labels and error message
+    """
+    if not labels:
+        return 0, ""
+
+    provider = layer.dataProvider()
+    text_index = provider.fields().lookupField("Text")
+
+    request = QgsFeatureRequest().setFilterFids(list(labels))
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(["Text", "Expression"], layer.fields())
+    label_features = list(layer.getFeatures(request))
+
+    references = {feature.id(): feature for feature in
+                  reference_layer.getFeatures(QgsFeatureRequest().setFilterFids(list(set(labels.values()))))}
+
+    cache = ExpressionCache()
+    changes = {}
+    for feature in label_features:
+        reference = references.get(labels[feature.id()])
+        if reference is None:
+            continue
+
+        expression = feature['Expression']
+        text = get_label_text(reference, expression, cache)
+        attributes = {}
+        for name, value in fingerprint_values(layer.fields(), reference, expression,
+                                              not cache.last_error).items():
+            attributes[provider.fields().lookupField(name)] = value
+
+        current = feature['Text']
+        if text != (None if current == NULL else current):
+            attributes[text_index] = text
+
+        if attributes:
+            changes[feature.id()] = attributes
+
+    if changes and not provider.changeAttributeValues(changes):
+        return 0, provider.lastError()
+
+    return len(changes), ""
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsPointXY, QgsVectorLayer
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from easy_labeling.utilities.gpkg import gpkg_path
+from easy_labeling.utilities.leaders import decode_leaders_wkb, encode_leaders
+
+
+# table of the cache file, see `cache_path`
+PLACEMENT_CACHE_TABLE = "easy_labeling_placement_cache"
+# cache file next to the labeling GeoPackage, "labels.gpkg" -> "labels.placements.sqlite"
+PLACEMENT_CACHE_SUFFIX = ".placements.sqlite"
+# part of every cache key, change it when `get_positions` or `get_leader_targets` place differently
+PLACEMENT_MODE = "center-v1"
+# entries not used for this many days are evicted
+CACHE_MAX_AGE_DAYS = 180
+# the least recently used entries above this number are evicted
+CACHE_MAX_ENTRIES = 2000000
+# keys per sqlite statement, below the default variable limit of older sqlite versions
+_QUERY_SIZE = 500
+
+# position or None, when no position was found, and leader targets
+Placement = Tuple[Optional[QgsPointXY], List[QgsPointXY]]
+
+
+def cache_path(gpkg: str) -> str:
+    """ Returns the placement cache file of a labeling GeoPackage """
+    return os.path.splitext(gpkg)[0] + PLACEMENT_CACHE_SUFFIX
+
+
+class PlacementCache:
+    """ Generated positions and leader targets of source geometries, stored next to the labeling GeoPackage.
+        A separate file, because the worker thread reads and writes the cache while generated
+        features are written to the GeoPackage in the main thread, see `cache_path`.
+
+        The key is a hash of the source WKB, source and destination crs, offset and `PLACEMENT_MODE`,
+        so unchanged geometries are not transformed and placed again on the next generation.
+        The sqlite connection is opened on first use and must be used by one thread at a time.
+        Generation does not fail with the cache: after the first sqlite error it is disabled
+        and the error is kept in `error`.
+
+        .. code-block:: python
+
+            cache = PlacementCache.for_layer(dest_layer)
+            context = GenerationContext(source_layer, dest_layer, '"name"', 10)
+            context.cache = cache
+            features = generate_from_snapshots(context, source_layer.getFeatures())
+            cache.evict()
+            cache.close()
+
+        :param path: cache file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.error = ""
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def for_layer(cls, layer: QgsVectorLayer) -> Optional['PlacementCache']:
+        """ Returns the cache of labeling layers stored in a GeoPackage, otherwise None. """
+        path = gpkg_path(layer)
+        if path is None:
+            return None
+
+        return cls(cache_path(path))
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # opened in the worker thread, evicted and closed in the main thread after the task
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {PLACEMENT_CACHE_TABLE} "
+                    f"(key TEXT PRIMARY KEY, x REAL, y REAL, leaders BLOB, used INTEGER NOT NULL)")
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {PLACEMENT_CACHE_TABLE}_used ON {PLACEMENT_CACHE_TABLE} (used)")
+
+        return self._connection
+
+    @staticmethod
+    def key_prefix(source_crs: QgsCoordinateReferenceSystem, dest_crs: QgsCoordinateReferenceSystem,
+                   offset: Optional[float]) -> bytes:
+        """ Part of the key shared by all geometries of one generation run """
+        crs = [c.authid() or c.toWkt() for c in (source_crs, dest_crs)]
+        return f"{crs[0]}|{crs[1]}|{offset}|{PLACEMENT_MODE}|".encode()
+
+    @staticmethod
+    def key(prefix: bytes, feature: QgsFeature) -> str:
+        """ Returns the cache key of a source feature, see `key_prefix` """
+        return hashlib.sha1(prefix + bytes(feature.geometry().asWkb())).hexdigest()
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, Placement]:
+        """ Returns the cached placements of the given keys and marks them as used """
+        keys = list(dict.fromkeys(keys))
+        if self.error:
+            return {}
+
+        now = int(time.time())
+        found = {}
+        try:
+            connection = self._connect()
+            with connection:
+                for start in range(0, len(keys), _QUERY_SIZE):
+                    chunk = keys[start:start + _QUERY_SIZE]
+                    marks = ",".join("?" * len(chunk))
+                    rows = connection.execute(
+                        f"SELECT key, x, y, leaders FROM {PLACEMENT_CACHE_TABLE} WHERE key IN ({marks})", chunk)
+                    for key, x, y, leaders in rows.fetchall():
+                        point = None if x is None or y is None else QgsPointXY(x, y)
+                        found[key] = (point, decode_leaders_wkb(leaders))
+
+                    connection.execute(f"UPDATE {PLACEMENT_CACHE_TABLE} SET used = ? WHERE key IN ({marks})",
+                                       [now] + chunk)
+        except sqlite3.Error as e:
+            self.error = str(e)
+            return {}
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def store(self, placements: Dict[str, Placement]):
+        """ Writes new placements in one transaction """
+        if not placements or self.error:
+            return
+
+        now = int(time.time())
+        rows = []
+        for key, (point, targets) in placements.items():
+            x, y = (point.x(), point.y()) if point is not None else (None, None)
+            rows.append((key, x, y, bytes(encode_leaders(targets)) if targets else None, now))
+
+        try:
+            connection = self._connect()
+            with connection:
+                connection.executemany(f"INSERT OR REPLACE INTO {PLACEMENT_CACHE_TABLE} VALUES (?, ?, ?, ?, ?)",
+                                       rows)
+        except sqlite3.Error as e:
+            self.error = str(e)
+
+    def evict(self, max_age_days: float = CACHE_MAX_AGE_DAYS, max_entries: int = CACHE_MAX_ENTRIES) -> int:
+        """ Removes entries not used for `max_age_days` and the least recently used ones above `max_entries`.
+
+            :return: number of removed entries
+        """
+        connection = self._connect()
+        with connection:
+            removed = connection.execute(f"DELETE FROM {PLACEMENT_CACHE_TABLE} WHERE used < ?",
+                                         (int(time.time() - max_age_days * 86400),)).rowcount
+
+            count = connection.execute(f"SELECT COUNT(*) FROM {PLACEMENT_CACHE_TABLE}").fetchone()[0]
+            if count > max_entries:
+                removed += connection.execute(
+                    f"DELETE FROM {PLACEMENT_CACHE_TABLE} WHERE key IN "
+                    f"(SELECT key FROM {PLACEMENT_CACHE_TABLE} ORDER BY used LIMIT ?)",
+                    (count - max_entries,)).rowcount
+
+        return removed
+
+    def clear(self):
+        connection = self._connect()
+        with connection:
+            connection.execute(f"DELETE FROM {PLACEMENT_CACHE_TABLE}")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
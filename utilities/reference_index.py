@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sqlite3
+from itertools import islice
+
+from qgis.core import Qgis, QgsFeature, QgsFeatureRequest, QgsMessageLog, QgsProject, QgsVectorLayer, NULL
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from easy_labeling.utilities.gpkg import gpkg_path
+from easy_labeling.utilities.references import ReferenceResolver, parse_reference
+
+
+# attributes table inside the labeling GeoPackage, registered in gpkg_contents
+REFERENCE_INDEX_TABLE = "easy_labeling_references"
+# custom layer property of a labeling layer, name of a stable key field in referenced layers
+REFERENCE_KEY_PROPERTY = "easy_labeling/reference_key_field"
+# label fids per sqlite statement, below the default variable limit of older sqlite versions
+_QUERY_SIZE = 500
+# labeling features read at once by `ReferenceIndex.rebuild`
+_REBUILD_CHUNK_SIZE = 1000
+
+# referenced layer name, referenced feature id and stable key or None
+Entry = Tuple[str, int, Optional[str]]
+
+
+def reference_key_field(layer: QgsVectorLayer) -> str:
+    return layer.customProperty(REFERENCE_KEY_PROPERTY, "") if layer is not None else ""
+
+
+def set_reference_key_field(layer: QgsVectorLayer, name: str):
+    """ Sets the field of referenced layers stored as stable key, an empty name disables it. """
+    if name:
+        layer.setCustomProperty(REFERENCE_KEY_PROPERTY, name)
+    else:
+        layer.removeCustomProperty(REFERENCE_KEY_PROPERTY)
+
+
+def reference_entry(feature: QgsFeature, reference: Optional[QgsFeature] = None,
+                    key_field: str = "") -> Optional[Entry]:
+    """ Returns the index entry of a labeling feature, None without valid reference.
+
+        :param feature: labeling feature with "Reference"
+        :param reference: resolved referenced feature, only needed for the stable key
+        :param key_field: stable key field of referenced layers, see `REFERENCE_KEY_PROPERTY`
+    """
+    parsed = parse_reference(feature['Reference'])
+    if parsed is None:
+        return None
+
+    key = None
+    if key_field and reference is not None and reference.fields().lookupField(key_field) >= 0:
+        value = reference[key_field]
+        key = None if value == NULL or value is None else str(value)
+
+    return parsed[0], parsed[1], key
+
+
+class ReferenceIndex:
+    """ Persistent reference index of a labeling layer, stored in its GeoPackage.
+
+        One row per labeling feature with a valid "Reference": referenced layer name, source and id
+        of the referenced layer (when its name was unique in the project), referenced feature id
+        and an optional stable key, see `REFERENCE_KEY_PROPERTY`.
+        Indexed by labeling feature id and by referenced layer name and feature id, so
+        "which labels point at this feature" and "which features are labeled" need no full scan.
+
+        The table is built once with `rebuild` or on first `sync`, afterwards it is kept up to date by
+        generation, refresh and committed edits. Without table all writes are ignored.
+        The table is registered in gpkg_contents as attributes table. A failed write, e.g. while the file
+        is locked too long, keeps the table and is logged, `rebuild` makes the index complete again.
+
+        .. code-block:: python
+
+            index = ReferenceIndex.for_layer(labeling_layer)
+            if not index.exists():
+                index.rebuild(labeling_layer)
+            label_fids = index.labels("Roads", 42)
+            labeled = index.referenced("Roads")
+
+        :param path: GeoPackage file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._exists: Optional[bool] = None
+
+    @classmethod
+    def for_layer(cls, layer: QgsVectorLayer) -> Optional['ReferenceIndex']:
+        """ Returns the index of labeling layers stored in a GeoPackage, otherwise None. """
+        path = gpkg_path(layer)
+        if path is None:
+            return None
+
+        return cls(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # GDAL may write the same file at the same time, wait for its locks
+            self._connection = sqlite3.connect(self.path, timeout=30)
+
+        return self._connection
+
+    def exists(self) -> bool:
+        if self._exists is None:
+            try:
+                row = self._connect().execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                              (REFERENCE_INDEX_TABLE,)).fetchone()
+            except sqlite3.Error:
+                # e.g. not a valid sqlite file, nothing is indexed then
+                row = None
+            self._exists = row is not None
+
+        return self._exists
+
+    def create(self):
+        """ Creates an empty table, e.g. for new labeling layers """
+        connection = self._connect()
+        with connection:
+            self._create(connection)
+
+    def _create(self, connection: sqlite3.Connection):
+        self._register(connection)
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {REFERENCE_INDEX_TABLE} "
+            f"(label_fid INTEGER PRIMARY KEY, layer_name TEXT NOT NULL, layer_source TEXT, layer_id TEXT, "
+            f"ref_fid INTEGER NOT NULL, stable_key TEXT)")
+        connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {REFERENCE_INDEX_TABLE}_ref "
+            f"ON {REFERENCE_INDEX_TABLE} (layer_name, ref_fid)")
+        connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {REFERENCE_INDEX_TABLE}_key "
+            f"ON {REFERENCE_INDEX_TABLE} (layer_name, stable_key)")
+        self._exists = True
+
+    @staticmethod
+    def _has_table(connection: sqlite3.Connection, name: str) -> bool:
+        return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (name,)).fetchone() is not None
+
+    def _register(self, connection: sqlite3.Connection):
+        """ Adds the table to gpkg_contents, so GDAL and other tools treat it as GeoPackage table """
+        if not self._has_table(connection, "gpkg_contents"):
+            return
+
+        connection.execute("INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, identifier, description) "
+                           "VALUES (?, 'attributes', ?, ?)",
+                           (REFERENCE_INDEX_TABLE, REFERENCE_INDEX_TABLE, "Easy Labeling Referenzindex"))
+
+    def rebuild(self, layer: QgsVectorLayer, project: Optional[QgsProject] = None):
+        """ Builds the table from all labeling features in one transaction.
+            Stable keys are read from the referenced features, when a key field is set.
+
+            :param layer: labeling layer
+            :param project: project to look up referenced layers, defaults to `QgsProject.instance()`
+        """
+        resolver = ReferenceResolver(project)
+        key_field = reference_key_field(layer)
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["Reference"], layer.fields())
+        features = layer.getFeatures(request)
+
+        connection = self._connect()
+        with connection:
+            self._create(connection)
+            connection.execute(f"DELETE FROM {REFERENCE_INDEX_TABLE}")
+            while True:
+                chunk = list(islice(features, _REBUILD_CHUNK_SIZE))
+                if not chunk:
+                    break
+
+                references = resolver.resolve(chunk) if key_field else {}
+                entries = {}
+                for feature in chunk:
+                    reference = references.get(feature.id())
+                    entries[feature.id()] = reference_entry(feature, reference[1] if reference else None, key_field)
+                self._write(connection, entries, resolver)
+
+    def write(self, entries: Dict[int, Optional[Entry]], project: Optional[QgsProject] = None) -> bool:
+        """ Inserts or replaces entries in one transaction, None removes the labeling feature.
+            A failed write is logged and leaves the table unchanged.
+
+            :param entries: labeling feature id -> entry, see `reference_entry`
+            :param project: project to look up referenced layers, defaults to `QgsProject.instance()`
+            :return: False if the entries could not be written
+        """
+        if not entries or not self.exists():
+            return True
+
+        connection = self._connect()
+        try:
+            with connection:
+                self._write(connection, entries, ReferenceResolver(project))
+        except sqlite3.Error as e:
+            QgsMessageLog.logMessage(f"Referenzindex in {self.path} konnte nicht geschrieben werden, "
+                                     f"{len(entries)} Einträge fehlen: {e}", "Easy Labeling", Qgis.Warning)
+            return False
+
+        return True
+
+    def drop(self):
+        """ Removes the table, e.g. to disable the index of a labeling layer """
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(f"DROP TABLE IF EXISTS {REFERENCE_INDEX_TABLE}")
+                for table in ("gpkg_contents", "gpkg_ogr_contents"):
+                    if self._has_table(connection, table):
+                        connection.execute(f"DELETE FROM {table} WHERE table_name = ?", (REFERENCE_INDEX_TABLE,))
+        except sqlite3.Error:
+            pass
+        self._exists = None
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, entries: Dict[int, Optional[Entry]], resolver: ReferenceResolver):
+        layers = {}
+        rows = []
+        removed = []
+        for label_fid, entry in entries.items():
+            if entry is None:
+                removed.append(label_fid)
+                continue
+
+            name, fid, key = entry
+            if name not in layers:
+                layer = resolver.get_layer(name)
+                layers[name] = (layer.source(), layer.id()) if layer is not None else (None, None)
+
+            rows.append((label_fid, name, layers[name][0], layers[name][1], fid, key))
+
+        connection.executemany(f"INSERT OR REPLACE INTO {REFERENCE_INDEX_TABLE} VALUES (?, ?, ?, ?, ?, ?)", rows)
+        connection.executemany(f"DELETE FROM {REFERENCE_INDEX_TABLE} WHERE label_fid = ?",
+                               [(fid,) for fid in removed])
+
+    def update(self, layer: QgsVectorLayer, fids: Iterable[int], project: Optional[QgsProject] = None):
+        """ Reads "Reference" of the given labeling features and writes their entries.
+            Features not found anymore are removed.
+        """
+        fids = list(fids)
+        if not fids or not self.exists():
+            return
+
+        request = QgsFeatureRequest().setFilterFids(fids)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["Reference"], layer.fields())
+        entries: Dict[int, Optional[Entry]] = {fid: None for fid in fids}
+        for feature in layer.getFeatures(request):
+            entries[feature.id()] = reference_entry(feature)
+
+        self.write(entries, project)
+
+    def sync(self, layer: QgsVectorLayer, project: Optional[QgsProject] = None):
+        """ Builds the table on first use, otherwise adds labeling features appended by other tools,
+            e.g. processing algorithms, with a higher feature id than the last indexed one.
+        """
+        if not self.exists():
+            self.rebuild(layer, project)
+            return
+
+        last_fid = self._connect().execute(f"SELECT MAX(label_fid) FROM {REFERENCE_INDEX_TABLE}").fetchone()[0]
+        request = QgsFeatureRequest()
+        if last_fid is not None:
+            request.setFilterExpression(f"$id > {int(last_fid)}")
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["Reference"], layer.fields())
+        entries = {feature.id(): reference_entry(feature) for feature in layer.getFeatures(request)}
+        # features without valid reference have no row
+        self.write({fid: entry for fid, entry in entries.items() if entry is not None}, project)
+
+    def remove(self, fids: Iterable[int]) -> bool:
+        return self.write({fid: None for fid in fids})
+
+    def labels(self, name: str, fid: int) -> List[int]:
+        """ Returns labeling feature ids referencing a feature. """
+        rows = self._connect().execute(
+            f"SELECT label_fid FROM {REFERENCE_INDEX_TABLE} WHERE layer_name = ? AND ref_fid = ?", (name, fid))
+        return [row[0] for row in rows]
+
+    def labels_by_key(self, name: str, key: str) -> List[int]:
+        """ Returns labeling feature ids referencing a feature by its stable key. """
+        rows = self._connect().execute(
+            f"SELECT label_fid FROM {REFERENCE_INDEX_TABLE} WHERE layer_name = ? AND stable_key = ?", (name, key))
+        return [row[0] for row in rows]
+
+    def referenced(self, name: str) -> Set[int]:
+        """ Returns all referenced feature ids of a layer. """
+        rows = self._connect().execute(
+            f"SELECT DISTINCT ref_fid FROM {REFERENCE_INDEX_TABLE} WHERE layer_name = ?", (name,))
+        return {row[0] for row in rows}
+
+    def references(self, fids: Iterable[int]) -> Dict[int, Tuple[str, int]]:
+        """ Returns referenced layer name and feature id of labeling features. """
+        fids = list(fids)
+        connection = self._connect()
+        result = {}
+        for start in range(0, len(fids), _QUERY_SIZE):
+            chunk = fids[start:start + _QUERY_SIZE]
+            marks = ",".join("?" * len(chunk))
+            rows = connection.execute(f"SELECT label_fid, layer_name, ref_fid FROM {REFERENCE_INDEX_TABLE} "
+                                      f"WHERE label_fid IN ({marks})", chunk)
+            for label_fid, name, fid in rows:
+                result[label_fid] = (name, fid)
+
+        return result
+
+    def __len__(self) -> int:
+        if not self.exists():
+            return 0
+
+        return self._connect().execute(f"SELECT COUNT(*) FROM {REFERENCE_INDEX_TABLE}").fetchone()[0]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+
+from qgis.core import QgsVectorLayer, QgsFeature, QgsFeatureRequest, QgsProject, QgsVectorLayerFeatureSource
+from qgis.PyQt.QtCore import QObject, QThread, pyqtSignal
+
+from typing import Callable, Optional, Tuple, Dict, List, Iterable
+
+
+def parse_reference(reference) -> Optional[Tuple[str, int]]:
+    """ Splits a reference string "Layername.FeatureId" into layer name and feature id.
+
+        :param reference: value of the `Reference` field
+        :return: layer name and feature id, None if not valid
+    """
+    if not isinstance(reference, str):
+        return None
+
+    if "." not in reference:
+        return None
+
+    splitted = reference.split(".")
+    if len(splitted) != 2:
+        return None
+
+    name, fid = splitted
+
+    if not fid.isdigit():
+        return None
+
+    return name, int(fid)
+
+
+class ReferenceResolver:
+    """ Resolves the referenced features of many labeling features at once.
+        Layer names are looked up once per resolver,
+        referenced features are fetched with one request per referenced layer.
+
+        .. code-block:: python
+
+            resolver = ReferenceResolver()
+            references = resolver.resolve(point_layer.selectedFeatures())
+            for point_fid, reference in references.items():
+                if reference is None:
+                    print(point_fid, "reference not found")
+                    continue
+
+                layer, feature = reference
+
+        In worker threads use a resolver from `snapshot` and `resolve_features`.
+        Feature sources of referenced layers are created on first use in the main thread.
+
+        :param project: project to look up layers, defaults to `QgsProject.instance()`
+    """
+
+    def __init__(self, project: Optional[QgsProject] = None):
+        self.project = project if project is not None else QgsProject.instance()
+        self._layers_by_name: Optional[Dict[str, List[QgsVectorLayer]]] = None
+        # layer name -> feature source or None for unknown layers, only set by `snapshot`
+        self._sources: Optional[Dict[str, Optional[QgsVectorLayerFeatureSource]]] = None
+        self._loader: Optional[_SourceLoader] = None
+
+    @classmethod
+    def snapshot(cls, project: Optional[QgsProject] = None,
+                 is_canceled: Optional[Callable[[], bool]] = None) -> 'ReferenceResolver':
+        """ Creates a resolver for worker threads in main thread.
+            Afterwards `resolve_features` can be used in any thread. Feature sources are only created
+            for referenced layers, on first use and in the main thread, the worker thread waits for them.
+
+            :param project: project to look up layers, defaults to `QgsProject.instance()`
+            :param is_canceled: stops waiting for the main thread, e.g. `QgsTask.isCanceled`
+        """
+        resolver = cls(project)
+        resolver._index()
+        resolver._sources = {}
+        resolver._loader = _SourceLoader(resolver, is_canceled)
+
+        return resolver
+
+    def _create_source(self, name: str) -> Optional[QgsVectorLayerFeatureSource]:
+        """ main thread """
+        if name not in self._sources:
+            layer = self.get_layer(name)
+            self._sources[name] = QgsVectorLayerFeatureSource(layer) if layer is not None else None
+
+        return self._sources[name]
+
+    def _source(self, name: str) -> Optional[QgsVectorLayerFeatureSource]:
+        if name in self._sources:
+            return self._sources[name]
+
+        return self._loader.load(name)
+
+    def _index(self) -> Dict[str, List[QgsVectorLayer]]:
+        if self._layers_by_name is None:
+            self._layers_by_name = {}
+            for layer in self.project.mapLayers().values():
+                self._layers_by_name.setdefault(layer.name(), []).append(layer)
+
+        return self._layers_by_name
+
+    def get_layer(self, name: str) -> Optional[QgsVectorLayer]:
+        """ Returns the layer with given name, None if not found or name is not unique. """
+        layers = self._index().get(name, [])
+        if len(layers) != 1:
+            return None
+
+        layer = layers[0]
+        if not isinstance(layer, QgsVectorLayer):
+            return None
+
+        return layer
+
+    def resolve(self, point_features: Iterable[QgsFeature]) -> Dict[int, Optional[Tuple[QgsVectorLayer, QgsFeature]]]:
+        """ Resolves referenced layer and feature for each labeling feature.
+
+            :param point_features: labeling features
+            :return: labeling feature id with referenced layer and feature, None if not found
+        """
+        result, grouped = self._group(point_features)
+
+        for name, fids in grouped.items():
+            layer = self.get_layer(name)
+            if layer is None:
+                continue
+
+            request = QgsFeatureRequest().setFilterFids(list(fids))
+            for feature in layer.getFeatures(request):
+                for point_fid in fids.get(feature.id(), []):
+                    result[point_fid] = (layer, feature)
+
+        return result
+
+    def resolve_features(self, point_features: Iterable[QgsFeature]) -> Dict[int, Optional[QgsFeature]]:
+        """ Resolves referenced feature for each labeling feature.
+            Thread safe for resolvers from `snapshot`.
+
+            :param point_features: labeling features
+            :return: labeling feature id with referenced feature, None if not found
+        """
+        result, grouped = self._group(point_features)
+
+        for name, fids in grouped.items():
+            if self._sources is not None:
+                source = self._source(name)
+            else:
+                source = self.get_layer(name)
+
+            if source is None:
+                continue
+
+            request = QgsFeatureRequest().setFilterFids(list(fids))
+            for feature in source.getFeatures(request):
+                for point_fid in fids.get(feature.id(), []):
+                    result[point_fid] = feature
+
+        return result
+
+    @staticmethod
+    def _group(point_features: Iterable[QgsFeature]) -> Tuple[Dict[int, None], Dict[str, Dict[int, List[int]]]]:
+        result = {}
+        # layer name -> referenced feature id -> labeling feature ids
+        grouped: Dict[str, Dict[int, List[int]]] = {}
+
+        for point_feature in point_features:
+            result[point_feature.id()] = None
+
+            parsed = parse_reference(point_feature['Reference'])
+            if parsed is None:
+                continue
+
+            name, fid = parsed
+            grouped.setdefault(name, {}).setdefault(fid, []).append(point_feature.id())
+
+        return result, grouped
+
+
+class _SourceLoader(QObject):
+    """ Creates feature sources of a snapshot resolver in the thread the resolver was created in """
+    _requested = pyqtSignal(str)
+
+    def __init__(self, resolver: ReferenceResolver, is_canceled: Optional[Callable[[], bool]] = None):
+        super().__init__()
+        self._resolver = resolver
+        self._is_canceled = is_canceled
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        # queued, when emitted from worker threads
+        self._requested.connect(self._load)
+
+    def load(self, name: str) -> Optional[QgsVectorLayerFeatureSource]:
+        """ Returns the feature source of a layer, waits for the main thread in worker threads.
+            None for unknown layers or when canceled while waiting.
+        """
+        if QThread.currentThread() == self.thread():
+            return self._resolver._create_source(name)
+
+        with self._lock:
+            self._loaded.clear()
+            self._requested.emit(name)
+            # wait in steps, the main thread may wait for this task itself
+            while not self._loaded.wait(0.1):
+                if self._is_canceled is not None and self._is_canceled():
+                    return None
+
+        return self._resolver._sources.get(name)
+
+    def _load(self, name: str):
+        """ main thread """
+        try:
+            self._resolver._create_source(name)
+        finally:
+            self._loaded.set()
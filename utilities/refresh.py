@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import hashlib
+import threading
+
+from qgis.core import (QgsFeature, QgsFeatureRequest, QgsFeedback, QgsFields, QgsProject, QgsSettings, QgsTask,
+                       QgsVectorLayer, QgsVectorLayerFeatureSource, NULL)
+from qgis.PyQt.QtCore import pyqtSignal
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from easy_labeling.utilities.fingerprint import FINGERPRINT_FIELD, label_fingerprint
+from easy_labeling.utilities.functions import get_label_text
+from easy_labeling.utilities.reference_index import Entry, ReferenceIndex, reference_entry, reference_key_field
+from easy_labeling.utilities.references import ReferenceResolver
+from easy_labeling.submodules.qgis.tools.expression_cache import ExpressionCache
+
+
+# labeling features per provider call, each call is one transaction on GeoPackages
+REFRESH_CHUNK_SIZE = 1000
+# refreshed chunks waiting for the main thread, the worker waits when reached
+MAX_PENDING_CHUNKS = 2
+# settings group of refresh checkpoints
+CHECKPOINT_SETTINGS = "easy_labeling/refresh_checkpoints"
+
+
+class RefreshResult:
+    """ Collects the outcome of a refresh run. Counts include resumed runs only from their checkpoint. """
+
+    def __init__(self):
+        # number of labeling features with changed text
+        self.updated = 0
+        # number of labeling features with the same text
+        self.unchanged = 0
+        # number of labeling features written (or to write in a dry run),
+        # changed text or changed fingerprint
+        self.stale = 0
+        # labeling feature ids without referenced feature
+        self.broken: List[int] = []
+        # number of manual labeling features, without "Reference" and "Expression", they are skipped
+        self.manual = 0
+        # number of labeling features the provider rejected
+        self.failed = 0
+        self.errors: List[str] = []
+        # expression -> (last error message, error count)
+        self.expression_errors: Dict[str, Tuple[str, int]] = {}
+        # last committed labeling feature id
+        self.last_fid: Optional[int] = None
+        # run started at a checkpoint
+        self.resumed = False
+        # nothing was written
+        self.dry_run = False
+        self.canceled = False
+
+    @property
+    def done(self) -> int:
+        return self.updated + self.unchanged + len(self.broken) + self.manual + self.failed
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(updated={self.updated}, unchanged={self.unchanged}, " \
+               f"stale={self.stale}, broken={len(self.broken)}, manual={self.manual}, failed={self.failed}, " \
+               f"dry_run={self.dry_run}, canceled={self.canceled})"
+
+
+def checkpoint_key(layer: QgsVectorLayer, filter_expression: Optional[str] = None) -> str:
+    """ Settings key of the refresh checkpoint for a labeling layer and filter. """
+    digest = hashlib.md5(f"{layer.source()}\n{filter_expression or ''}".encode("utf-8")).hexdigest()
+    return f"{CHECKPOINT_SETTINGS}/{digest}"
+
+
+def load_checkpoint(layer: QgsVectorLayer, filter_expression: Optional[str] = None) -> Optional[int]:
+    """ Returns the last committed labeling feature id of an interrupted refresh, None without checkpoint. """
+    value = QgsSettings().value(checkpoint_key(layer, filter_expression), None)
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def save_checkpoint(layer: QgsVectorLayer, filter_expression: Optional[str], fid: int):
+    QgsSettings().setValue(checkpoint_key(layer, filter_expression), int(fid))
+
+
+def clear_checkpoint(layer: QgsVectorLayer, filter_expression: Optional[str] = None):
+    QgsSettings().remove(checkpoint_key(layer, filter_expression))
+
+
+def remaining_fids(source, filter_expression: Optional[str] = None, after_fid: Optional[int] = None) -> List[int]:
+    """ Returns the sorted ids of labeling features to refresh, read without geometry and attributes.
+        Features are paged by these ids, see `refresh_request`, providers like OGR do not compile an
+        order by feature id and would sort all features in memory before returning the first one.
+
+        :param source: labeling layer or its feature source
+        :param filter_expression: only features matching this expression
+        :param after_fid: only features with a greater feature id, see `load_checkpoint`
+    """
+    filters = []
+    if filter_expression:
+        filters.append(f"({filter_expression})")
+    if after_fid is not None:
+        filters.append(f"$id > {int(after_fid)}")
+
+    request = QgsFeatureRequest()
+    if filters:
+        request.setFilterExpression(" AND ".join(filters))
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setNoAttributes()
+
+    return sorted(feature.id() for feature in source.getFeatures(request))
+
+
+def refresh_request(fields: QgsFields, fids: List[int]) -> QgsFeatureRequest:
+    """ Request for one chunk of labeling features to refresh, without geometry and only with the needed fields.
+
+        :param fields: fields of the labeling layer
+        :param fids: feature ids of the chunk, see `remaining_fids`
+    """
+    request = QgsFeatureRequest().setFilterFids(fids)
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    names = ["Text", "Expression", "Reference"]
+    if fields.lookupField(FINGERPRINT_FIELD.name()) >= 0:
+        names.append(FINGERPRINT_FIELD.name())
+    request.setSubsetOfAttributes(names, fields)
+
+    return request
+
+
+def iter_refresh_chunks(source, fields: QgsFields, fids: List[int],
+                        chunk_size: int) -> Iterator[Tuple[List[QgsFeature], int]]:
+    """ Yields chunks of labeling features with the highest feature id of their window as checkpoint.
+        The window bound is the checkpoint even if features of the window were deleted meanwhile.
+
+        :param source: labeling layer or its feature source
+        :param fields: fields of the labeling layer
+        :param fids: sorted feature ids, see `remaining_fids`
+        :param chunk_size: features per chunk
+    """
+    for start in range(0, len(fids), chunk_size):
+        window = fids[start:start + chunk_size]
+        yield list(source.getFeatures(refresh_request(fields, window))), window[-1]
+
+
+def refresh_chunk(features: List[QgsFeature], resolver: ReferenceResolver, text_index: int,
+                  fingerprint_index: int, expressions: ExpressionCache,
+                  key_field: str = "",
+                  force: bool = False) -> Tuple[dict, List[int], Tuple[int, int, int], Dict[int, Optional[Entry]]]:
+    """ Evaluates label texts of a chunk of labeling features, see `iter_refresh_chunks`.
+        Does not write anything, thread safe with a resolver from `ReferenceResolver.snapshot`.
+        Manual labels without "Reference" and "Expression" are skipped and only counted.
+        Labels whose text could not be evaluated get no fingerprint, so they are evaluated again next time.
+
+        :param features: labeling features
+        :param resolver: reference resolver
+        :param text_index: provider field index of "Text"
+        :param fingerprint_index: provider field index of "Fingerprint", -1 without fingerprints
+        :param expressions: expression cache of the current thread
+        :param key_field: stable key field of referenced layers, see `reference_key_field`
+        :param force: evaluate all labels, also the ones with an unchanged fingerprint
+        :return: attribute changes, broken ids, (updated, unchanged, manual) counts and reference index entries
+    """
+    manual = 0
+    labels = []
+    for feature in features:
+        if feature['Reference'] or feature['Expression']:
+            labels.append(feature)
+        else:
+            manual += 1
+
+    references = resolver.resolve_features(labels)
+    changes = {}
+    broken = []
+    entries = {feature.id(): None for feature in features}
+    updated = 0
+    unchanged = 0
+    for feature in labels:
+        reference = references[feature.id()]
+        entries[feature.id()] = reference_entry(feature, reference, key_field)
+        if reference is None:
+            broken.append(feature.id())
+            continue
+
+        expression = feature['Expression']
+        fingerprint = None
+        stored = None
+        if fingerprint_index >= 0:
+            fingerprint = label_fingerprint(reference, expression or "")
+            stored = feature[FINGERPRINT_FIELD.name()]
+            stored = None if stored == NULL else stored
+            if fingerprint is not None and fingerprint == stored and not force:
+                unchanged += 1
+                continue
+
+        attributes = {}
+        text = get_label_text(reference, expression, expressions)
+        if expressions.last_error:
+            fingerprint = None
+        current = feature['Text']
+        if text == (None if current == NULL else current):
+            unchanged += 1
+        else:
+            attributes[text_index] = text
+            updated += 1
+
+        if fingerprint_index >= 0 and fingerprint != stored:
+            attributes[fingerprint_index] = fingerprint
+
+        if attributes:
+            changes[feature.id()] = attributes
+
+    return changes, broken, (updated, unchanged, manual), entries
+
+
+def refresh_labels(layer: QgsVectorLayer, filter_expression: Optional[str] = None,
+                   chunk_size: int = REFRESH_CHUNK_SIZE, resume: bool = False, dry_run: bool = False,
+                   feedback: Optional[QgsFeedback] = None, project: Optional[QgsProject] = None,
+                   force: bool = False) -> RefreshResult:
+    """ Refreshes label texts like `RefreshTask`, but synchronous in the current thread,
+        e.g. for processing algorithms. Each chunk is written in one transaction and checkpointed.
+
+        :param layer: labeling layer
+        :param filter_expression: only features matching this expression
+        :param chunk_size: features per transaction, defaults to `REFRESH_CHUNK_SIZE`
+        :param resume: continue at the checkpoint of an interrupted run, ignored for dry runs
+        :param dry_run: only count, nothing is written
+        :param feedback: optional feedback for progress and cancelling
+        :param project: project to resolve references, defaults to `QgsProject.instance()`
+        :param force: evaluate all labels, also the ones with an unchanged fingerprint
+        :return: result object
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk size must be greater than 0, got {chunk_size}")
+
+    filter_expression = filter_expression or None
+    result = RefreshResult()
+    result.dry_run = dry_run
+
+    checkpoint = load_checkpoint(layer, filter_expression) if resume and not dry_run else None
+    if not resume and not dry_run:
+        clear_checkpoint(layer, filter_expression)
+    result.resumed = checkpoint is not None
+    result.last_fid = checkpoint
+
+    provider = layer.dataProvider()
+    text_index = provider.fields().lookupField("Text")
+    fingerprint_index = provider.fields().lookupField(FINGERPRINT_FIELD.name())
+    resolver = ReferenceResolver(project)
+    expressions = ExpressionCache()
+    key_field = reference_key_field(layer)
+    reference_index = ReferenceIndex.for_layer(layer) if not dry_run else None
+    fids = remaining_fids(layer, filter_expression, checkpoint)
+    total = len(fids)
+
+    for chunk, last_fid in iter_refresh_chunks(layer, layer.fields(), fids, chunk_size):
+        if feedback is not None and feedback.isCanceled():
+            result.canceled = True
+            break
+
+        changes, broken, (updated, unchanged, manual), entries = refresh_chunk(chunk, resolver, text_index,
+                                                                               fingerprint_index, expressions,
+                                                                               key_field, force)
+        if not dry_run:
+            if changes and not provider.changeAttributeValues(changes):
+                result.failed += len(changes)
+                result.errors.append(provider.lastError())
+                break
+            if reference_index is not None:
+                reference_index.write(entries, project)
+            save_checkpoint(layer, filter_expression, last_fid)
+
+        result.updated += updated
+        result.unchanged += unchanged
+        result.manual += manual
+        result.stale += len(changes)
+        result.broken.extend(broken)
+        result.last_fid = last_fid
+
+        if feedback is not None and total:
+            feedback.setProgress(100 * result.done / total)
+
+    result.expression_errors.update(expressions.errors)
+    if reference_index is not None:
+        reference_index.close()
+    if not dry_run:
+        if not result.canceled and not result.errors:
+            clear_checkpoint(layer, filter_expression)
+        layer.triggerRepaint()
+
+    return result
+
+
+class RefreshTask(QgsTask):
+    """ Refreshes the text of all labeling features or of features matching a filter in a background thread.
+
+        Labeling features are streamed in the worker thread and resolved with a `ReferenceResolver.snapshot`.
+        Changed texts are sent in chunks to the main thread, where each chunk is written in one transaction
+        and the last feature id is stored as checkpoint. An interrupted run continues at its checkpoint,
+        the checkpoint is removed after a complete run. Features are requested in windows of sorted
+        feature ids, see `remaining_fids`. Manual labels are skipped.
+        At most `MAX_PENDING_CHUNKS` chunks wait for the main thread.
+
+        Layers with "Fingerprint" field only evaluate labels whose fingerprint differs from the one of the
+        referenced feature, see `utilities.fingerprint`, unless `force` is set. A dry run counts stale labels
+        without writing and without checkpoints.
+
+        .. code-block:: python
+
+            task = RefreshTask(layer, '"Reference" LIKE \\'Roads:%\\'')
+            task.chunkRefreshed.connect(lambda result: print(result))
+            task.refreshed.connect(lambda result: print(result))
+            QgsApplication.taskManager().addTask(task)
+
+        Qt Signals:
+        * chunkRefreshed: `RefreshResult`, emitted in main thread after each written chunk
+        * refreshed: `RefreshResult`, emitted in main thread after the task finished or was cancelled
+
+        :param layer: labeling layer
+        :param filter_expression: only features matching this expression
+        :param chunk_size: features per transaction, defaults to `REFRESH_CHUNK_SIZE`
+        :param resume: continue at the checkpoint of an interrupted run, ignored for dry runs
+        :param dry_run: only count, nothing is written
+        :param force: evaluate all labels, also the ones with an unchanged fingerprint
+    """
+    chunkRefreshed = pyqtSignal(object, name="chunkRefreshed")
+    refreshed = pyqtSignal(object, name="refreshed")
+
+    # worker thread -> main thread: attribute changes, broken ids, (updated, unchanged) counts, last feature id,
+    # reference index entries
+    # dict typed arguments do not keep int keys reliably in queued connections
+    _chunkReady = pyqtSignal(object, list, object, object, object, name="_chunkReady")
+
+    def __init__(self, layer: QgsVectorLayer, filter_expression: Optional[str] = None,
+                 chunk_size: int = REFRESH_CHUNK_SIZE, resume: bool = True, dry_run: bool = False,
+                 force: bool = False):
+        super().__init__("Veraltete Beschriftungspunkte zählen" if dry_run else "Beschriftungspunkte aktualisieren",
+                         QgsTask.CanCancel)
+
+        if chunk_size < 1:
+            raise ValueError(f"chunk size must be greater than 0, got {chunk_size}")
+
+        self.layer_id = layer.id()
+        self.filter_expression = filter_expression or None
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.force = force
+        self.result = RefreshResult()
+        self.result.dry_run = dry_run
+
+        checkpoint = load_checkpoint(layer, self.filter_expression) if resume and not dry_run else None
+        if not resume and not dry_run:
+            clear_checkpoint(layer, self.filter_expression)
+        self.result.resumed = checkpoint is not None
+        self.result.last_fid = checkpoint
+
+        provider_fields = layer.dataProvider().fields()
+        self.text_index = provider_fields.lookupField("Text")
+        self.fingerprint_index = provider_fields.lookupField(FINGERPRINT_FIELD.name())
+        self.checkpoint = checkpoint
+        self.fields = layer.fields()
+        self.total = 0
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.resolver = ReferenceResolver.snapshot(is_canceled=self.isCanceled)
+        self.key_field = reference_key_field(layer)
+        # written in main thread only
+        self.reference_index = ReferenceIndex.for_layer(layer) if not dry_run else None
+        self.expressions = ExpressionCache()
+        self.exception: Optional[Exception] = None
+        self._pending = threading.BoundedSemaphore(MAX_PENDING_CHUNKS)
+
+        # slot lives in main thread, chunks are committed there
+        self._chunkReady.connect(self._commit_chunk)
+
+    def run(self) -> bool:
+        """ worker thread """
+        try:
+            fids = remaining_fids(self.source, self.filter_expression, self.checkpoint)
+            self.total = len(fids)
+            done = 0
+            for features, last_fid in iter_refresh_chunks(self.source, self.fields, fids, self.chunk_size):
+                if self.isCanceled():
+                    self.result.canceled = True
+                    return False
+
+                changes, broken, counts, entries = self._refresh_chunk(features)
+                if self.isCanceled():
+                    # references may be unresolved, when waiting for their sources was canceled
+                    self.result.canceled = True
+                    return False
+                if not self._emit_chunk(changes, broken, counts, last_fid, entries):
+                    return False
+
+                done += len(features)
+                if self.total:
+                    self.setProgress(100 * done / self.total)
+
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return True
+
+    def _refresh_chunk(self, features: List[QgsFeature]) -> Tuple[dict, List[int], Tuple[int, int, int], dict]:
+        """ worker thread """
+        return refresh_chunk(features, self.resolver, self.text_index, self.fingerprint_index, self.expressions,
+                             self.key_field, self.force)
+
+    def _emit_chunk(self, changes: dict, broken: List[int], counts: Tuple[int, int, int], last_fid: int,
+                    entries: Dict[int, Optional[Entry]]) -> bool:
+        """ worker thread, waits while `MAX_PENDING_CHUNKS` chunks are not committed """
+        while not self._pending.acquire(timeout=0.1):
+            if self.isCanceled():
+                self.result.canceled = True
+                return False
+
+        self._chunkReady.emit(changes, broken, counts, last_fid, entries)
+        return True
+
+    def _commit_chunk(self, changes: dict, broken: List[int], counts: Tuple[int, int, int], last_fid: int,
+                      entries: Dict[int, Optional[Entry]]):
+        """ main thread, writes one chunk and moves the checkpoint behind it """
+        try:
+            updated, unchanged, manual = counts
+            if self.dry_run:
+                self.result.updated += updated
+                self.result.unchanged += unchanged
+                self.result.manual += manual
+                self.result.stale += len(changes)
+                self.result.broken.extend(broken)
+                self.result.last_fid = last_fid
+                self.chunkRefreshed.emit(self.result)
+                return
+
+            layer = QgsProject.instance().mapLayer(self.layer_id)
+            if layer is None:
+                self.result.failed += len(changes)
+                self.result.errors.append("Beschriftungslayer nicht gefunden")
+                self.cancel()
+                return
+
+            provider = layer.dataProvider()
+            if changes and not provider.changeAttributeValues(changes):
+                # checkpoint stays before this chunk
+                self.result.failed += len(changes)
+                self.result.errors.append(provider.lastError())
+                self.cancel()
+                return
+
+            self.result.updated += updated
+            self.result.unchanged += unchanged
+            self.result.manual += manual
+            self.result.stale += len(changes)
+            self.result.broken.extend(broken)
+            self.result.last_fid = last_fid
+            if self.reference_index is not None:
+                self.reference_index.write(entries)
+            save_checkpoint(layer, self.filter_expression, last_fid)
+
+            self.chunkRefreshed.emit(self.result)
+        finally:
+            self._pending.release()
+
+    def finished(self, result: bool):
+        """ main thread """
+        if self.exception is not None:
+            self.result.errors.append(str(self.exception))
+
+        self.result.expression_errors.update(self.expressions.errors)
+        self.result.canceled = self.result.canceled or self.isCanceled()
+        if self.reference_index is not None:
+            self.reference_index.close()
+
+        layer = QgsProject.instance().mapLayer(self.layer_id)
+        if layer is not None:
+            if result and not self.dry_run and not self.result.canceled and not self.result.errors:
+                clear_checkpoint(layer, self.filter_expression)
+            if not self.dry_run:
+                layer.triggerRepaint()
+
+        self.refreshed.emit(self.result)
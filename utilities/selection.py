@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+        copyright            : (C) 2022 Felix von Studsinske
+        email                : felix.vons@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsPointXY, QgsTask, QgsVectorLayer, QgsVectorLayerFeatureSource
+from qgis.PyQt.QtCore import pyqtSignal
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from easy_labeling.utilities.leaders import decode_leaders
+from easy_labeling.utilities.references import ReferenceResolver, parse_reference
+
+
+class SelectionResult:
+    """ Leader targets and referenced features of selected labeling features, see `SelectionTask` """
+
+    def __init__(self, fids: List[int]):
+        self.fids = fids
+        # leader lines [anchor, target] and targets in labeling layer crs
+        self.lines: List[List[QgsPointXY]] = []
+        self.targets: List[QgsPointXY] = []
+        # labeling feature id -> referenced layer and feature, None if not found, only for resolved features
+        self.references: Dict[int, Optional[Tuple[QgsVectorLayer, QgsFeature]]] = {}
+        self.errors: List[str] = []
+        self.canceled = False
+
+
+class SelectionTask(QgsTask):
+    """ Reads leader targets of selected labeling features and resolves their references in a background thread,
+        so selecting many labels does not block the map canvas.
+        References are resolved with a `ReferenceResolver.snapshot`, only for the features in `resolve`.
+
+        .. code-block:: python
+
+            task = SelectionTask(layer, layer.selectedFeatureIds(), resolve=layer.selectedFeatureIds()[:1])
+            task.resolved.connect(lambda result: print(result.targets, result.references))
+            QgsApplication.taskManager().addTask(task)
+
+        Qt Signals:
+        * resolved: `SelectionResult`, emitted in main thread after the task finished or was cancelled
+
+        :param layer: labeling layer
+        :param fids: selected labeling feature ids
+        :param resolve: labeling feature ids, whose referenced feature is needed
+    """
+    resolved = pyqtSignal(object, name="resolved")
+
+    def __init__(self, layer: QgsVectorLayer, fids: Iterable[int], resolve: Iterable[int] = ()):
+        super().__init__("Auswahl laden", QgsTask.CanCancel)
+
+        self.layer_id = layer.id()
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.fields = layer.fields()
+        self.resolve = set(resolve)
+        self.resolver = ReferenceResolver.snapshot(is_canceled=self.isCanceled) if self.resolve else None
+        self.result = SelectionResult(list(fids))
+        self.exception: Optional[Exception] = None
+        # labeling feature id -> referenced layer name and feature, None if not found
+        self._references: Dict[int, Optional[Tuple[str, QgsFeature]]] = {}
+
+    def run(self) -> bool:
+        """ worker thread """
+        try:
+            request = QgsFeatureRequest().setFilterFids(self.result.fids)
+            request.setSubsetOfAttributes([n for n in ("Points", "Leaders", "Reference")
+                                           if self.fields.lookupField(n) >= 0], self.fields)
+
+            features = []
+            for feature in self.source.getFeatures(request):
+                if self.isCanceled():
+                    return False
+
+                if feature.id() in self.resolve:
+                    features.append(QgsFeature(feature))
+
+                geometry = feature.geometry()
+                points = decode_leaders(feature)
+                if not points or geometry.isNull() or geometry.isEmpty():
+                    continue
+
+                anchor = geometry.asPoint()
+                self.result.lines.extend([anchor, point] for point in points)
+                self.result.targets.extend(points)
+
+            if features:
+                references = self.resolver.resolve_features(features)
+                for feature in features:
+                    reference = references.get(feature.id())
+                    parsed = parse_reference(feature['Reference'])
+                    self._references[feature.id()] = (parsed[0], reference) if reference is not None else None
+
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return True
+
+    def finished(self, result: bool):
+        """ main thread """
+        if self.exception is not None:
+            self.result.errors.append(str(self.exception))
+
+        for fid, reference in self._references.items():
+            layer = self.resolver.get_layer(reference[0]) if reference is not None else None
+            self.result.references[fid] = (layer, reference[1]) if layer is not None else None
+
+        self.result.canceled = self.isCanceled()
+        self.resolved.emit(self.result)
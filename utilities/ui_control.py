@@ -22,6 +22,9 @@ def load_tool_bar(plugin: EasyLabeling):
     from qgis.PyQt.QtGui import QIcon
 
     from ..modules.labeling import LabelingMenu
+    from ..modules.live_sync import LiveSync
+
+    plugin.add_module("LiveSync", LiveSync)
 
     icon = QIcon(plugin.get_icon_path("icon.png"))
     plugin.add_action("Easy Labeling öffnen",
@@ -33,3 +36,267 @@ def load_tool_bar(plugin: EasyLabeling):
                       plugin.plugin_menu_name,
                       True,
                       True)
+
+    plugin.add_action("Beschriftungslayer migrieren",
+                      QIcon(),
+                      False,
+                      lambda: migrate_labeling_layer(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Speichert die Pfeilziele des aktiven Beschriftungslayers im Feld 'Leaders' "
+                               "und ergänzt das Feld 'Fingerprint'.")
+
+    plugin.add_action("Pfeile aus Begleitlayer zeichnen (umschalten)",
+                      QIcon(),
+                      False,
+                      lambda: toggle_leader_lines(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Zeichnet die Pfeile des aktiven Beschriftungslayers aus einer Linientabelle "
+                               "im selben GeoPackage statt aus einem Ausdruck.")
+
+    plugin.add_action("Indizes für Beschriftungslayer erstellen",
+                      QIcon(),
+                      False,
+                      lambda: create_labeling_indexes(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Erstellt Geometrie- und Attributindizes (Reference, Expression) "
+                               "für den aktiven Beschriftungslayer.")
+
+    plugin.add_action("Beschriftungspunkte nach Filter aktualisieren",
+                      QIcon(),
+                      False,
+                      lambda: refresh_labeling_layer(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Aktualisiert die Texte aller Beschriftungspunkte des aktiven Beschriftungslayers, "
+                               "die einem Ausdruck entsprechen. Ohne Ausdruck werden alle aktualisiert.")
+
+    plugin.add_action("Beschriftungspunkte nach Filter neu berechnen",
+                      QIcon(),
+                      False,
+                      lambda: refresh_labeling_layer(plugin, force=True),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Berechnet die Texte aller Beschriftungspunkte des aktiven Beschriftungslayers, "
+                               "die einem Ausdruck entsprechen, neu, auch bei unverändertem Fingerabdruck.")
+
+    plugin.add_action("Veraltete Beschriftungspunkte zählen",
+                      QIcon(),
+                      False,
+                      lambda: refresh_labeling_layer(plugin, dry_run=True),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Zählt die Beschriftungspunkte des aktiven Beschriftungslayers, "
+                               "deren Referenz sich geändert hat, ohne sie zu aktualisieren.")
+
+    plugin.add_action("Beschriftungen live aktualisieren (umschalten)",
+                      QIcon(),
+                      False,
+                      lambda: toggle_live_sync(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Aktualisiert die Texte des aktiven Beschriftungslayers automatisch, "
+                               "sobald Änderungen an referenzierten Objekten gespeichert werden.")
+
+    plugin.add_action("Beschriftungen an Geometrieänderungen anpassen (umschalten)",
+                      QIcon(),
+                      False,
+                      lambda: toggle_geometry_follow(plugin),
+                      True,
+                      None,
+                      None,
+                      True,
+                      True,
+                      tool_tip="Verschiebt Beschriftungspunkte und Pfeile des aktiven Beschriftungslayers, "
+                               "sobald Geometrieänderungen an referenzierten Objekten gespeichert werden.")
+
+
+def migrate_labeling_layer(plugin: EasyLabeling):
+    """ Converts leader targets of the active labeling layer to the binary "Leaders" field """
+    from qgis.core import QgsVectorLayer
+
+    from ..modules.labeling import LabelingMenu
+    from .fingerprint import add_fingerprint_field
+    from .leaders import migrate_layer
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    if layer.isEditable():
+        bar.pushWarning("Easy Labeling", "Bitte zuerst den Bearbeitungsmodus des Layers beenden.")
+        return
+
+    try:
+        result = migrate_layer(layer)
+    except ValueError as e:
+        bar.pushCritical("Easy Labeling", str(e))
+        return
+
+    if not add_fingerprint_field(layer):
+        bar.pushWarning("Easy Labeling", "Feld 'Fingerprint' konnte nicht erstellt werden.")
+
+    bar.pushSuccess("Easy Labeling", f"{result.converted} Beschriftungspunkt(e) migriert.")
+    if result.invalid:
+        bar.pushWarning("Easy Labeling", f"{result.invalid} Beschriftungspunkt(e) mit ungültigen Pfeilzielen.")
+    if result.failed:
+        bar.pushCritical("Easy Labeling", f"{result.failed} Beschriftungspunkt(e) konnten nicht migriert werden, "
+                                          f"der Pfeilstil bleibt unverändert. Migration erneut starten "
+                                          f"({'; '.join(result.errors)})")
+
+
+def toggle_leader_lines(plugin: EasyLabeling):
+    """ Switches arrow rendering of the active labeling layer between expression and leader line table """
+    from qgis.core import QgsVectorLayer
+
+    from ..modules.labeling import LabelingMenu
+    from .leader_lines import leader_lines_enabled, enable_leader_lines, disable_leader_lines
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    if leader_lines_enabled(layer):
+        disable_leader_lines(layer)
+        bar.pushSuccess("Easy Labeling", "Pfeile werden wieder per Ausdruck gezeichnet.")
+        return
+
+    ok, message = enable_leader_lines(layer)
+    if ok:
+        bar.pushSuccess("Easy Labeling", "Pfeile werden aus dem Begleitlayer gezeichnet.")
+    else:
+        bar.pushCritical("Easy Labeling", f"Begleitlayer konnte nicht erstellt werden ({message})")
+
+
+def create_labeling_indexes(plugin: EasyLabeling):
+    """ Adds missing indexes to the active labeling layer """
+    from qgis.core import QgsVectorLayer
+
+    from ..modules.labeling import LabelingMenu
+    from .functions import create_indexes
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    failed = create_indexes(layer)
+    if failed:
+        bar.pushWarning("Easy Labeling", f"Indizes konnten nicht erstellt werden: {', '.join(failed)}")
+    else:
+        bar.pushSuccess("Easy Labeling", "Indizes erstellt.")
+
+
+def refresh_labeling_layer(plugin: EasyLabeling, dry_run: bool = False, force: bool = False):
+    """ Refreshes labeling points of the active labeling layer matching an expression.
+        A dry run only counts stale labeling points, `force` ignores fingerprints.
+    """
+    from qgis.core import QgsVectorLayer
+    from qgis.gui import QgsExpressionBuilderDialog
+
+    from ..modules.labeling import LabelingMenu
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    dialog = QgsExpressionBuilderDialog(layer, "", plugin.iface.mainWindow())
+    if dry_run:
+        dialog.setWindowTitle("Veraltete Beschriftungspunkte zählen")
+    elif force:
+        dialog.setWindowTitle("Beschriftungspunkte nach Filter neu berechnen")
+    else:
+        dialog.setWindowTitle("Beschriftungspunkte nach Filter aktualisieren")
+    if not dialog.exec_():
+        return
+
+    LabelingMenu.load(plugin)
+    menu = plugin['LabelingMenu']
+    menu.DrD_LabelingLayers.setLayer(layer)
+    menu.refresh_all(dialog.expressionText().strip() or None, dry_run, force)
+
+
+def toggle_live_sync(plugin: EasyLabeling):
+    """ Switches live sync of label texts for the active labeling layer """
+    from qgis.core import QgsVectorLayer
+
+    from ..modules.labeling import LabelingMenu
+    from .live_sync import live_sync_enabled, set_live_sync_enabled
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    enabled = not live_sync_enabled(layer)
+    set_live_sync_enabled(layer, enabled)
+    plugin['LiveSync'].invalidate(layer.id())
+
+    if enabled:
+        bar.pushSuccess("Easy Labeling", f"Beschriftungen in '{layer.name()}' werden live aktualisiert.")
+    else:
+        bar.pushSuccess("Easy Labeling", f"Live-Aktualisierung für '{layer.name()}' beendet.")
+
+
+def toggle_geometry_follow(plugin: EasyLabeling):
+    """ Switches geometry follow for the active labeling layer """
+    from qgis.core import QgsVectorLayer
+    from qgis.PyQt.QtWidgets import QMessageBox
+
+    from ..modules.labeling import LabelingMenu
+    from .geometry_follow import FOLLOW_AUTO, FOLLOW_FORCE, follow_mode, set_follow_mode
+
+    bar = plugin.iface.messageBar()
+    layer = plugin.iface.activeLayer()
+    if not isinstance(layer, QgsVectorLayer) or not LabelingMenu.is_point_layer_valid(layer):
+        bar.pushWarning("Easy Labeling", "Bitte einen Beschriftungslayer im Layerbaum wählen.")
+        return
+
+    if follow_mode(layer):
+        set_follow_mode(layer, "")
+        bar.pushSuccess("Easy Labeling", f"Beschriftungen in '{layer.name()}' folgen keinen Geometrieänderungen mehr.")
+        return
+
+    reply = QMessageBox.question(
+        plugin.iface.mainWindow(),
+        "Easy Labeling",
+        "Auch manuell verschobene Beschriftungen und geänderte Pfeile anpassen?",
+        QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+        QMessageBox.No
+    )
+    if reply == QMessageBox.Cancel:
+        return
+
+    set_follow_mode(layer, FOLLOW_FORCE if reply == QMessageBox.Yes else FOLLOW_AUTO)
+    bar.pushSuccess("Easy Labeling", f"Beschriftungen in '{layer.name()}' folgen Geometrieänderungen.")